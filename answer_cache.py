@@ -0,0 +1,170 @@
+"""
+Semantic Answer Cache
+เก็บคำตอบ (พร้อม source documents) ของคำถามที่เคยถาม ต่อเอกสารและ model
+ค้นหาแบบตรงตัวก่อน แล้วจึงค้นหาคำถามที่ความหมายใกล้เคียงด้วย embedding ของคำถาม
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+DEFAULT_SIMILARITY_THRESHOLD = float(os.environ.get("BORNZI_ANSWER_CACHE_THRESHOLD", 0.95))
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 5000
+_THAI_DIGITS = str.maketrans("๐๑๒๓๔๕๖๗๘๙", "0123456789")
+
+
+def normalize_question(question):
+    """ตัดช่องว่างและเครื่องหมายท้ายประโยค เพื่อให้คำถามที่พิมพ์ต่างกันเล็กน้อยตรงกัน"""
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip("?？!. ")
+
+
+def question_numbers(question):
+    """
+    ตัวเลขในคำถามตามลำดับ (เลขไทยแปลงเป็นเลขอารบิก)
+
+    คำถามที่ต่างกันแค่ตัวเลข (ปี, ข้อ, จำนวน) มี embedding ใกล้กันมาก แต่คำตอบต่างกัน
+    """
+    return re.findall(r"[0-9]+(?:[.,][0-9]+)*", normalize_question(question).translate(_THAI_DIGITS))
+
+
+def cache_model(llm_model, embedding_model, adaptive, vectorstore_path=None):
+    """
+    ส่วน model ของ key: คำตอบขึ้นกับ LLM, adaptive retrieval และ artifact ที่ค้นหา
+    (เอกสารเดียวกันมีได้หลาย artifact) ส่วน embedding ของคำถามขึ้นกับ embedding model
+    """
+    path = os.path.abspath(vectorstore_path) if vectorstore_path else None
+    return f"{llm_model}|{embedding_model}|adaptive={bool(adaptive)}|{path}"
+
+
+class AnswerCache:
+    """
+    Cache คำตอบในหน่วยความจำ แยกตาม (document fingerprint, model) - model ได้จาก cache_model
+
+    คำถามที่ความหมายใกล้เคียงต้องมีตัวเลขตรงกันด้วย (question_numbers)
+
+    Args:
+        similarity_threshold: cosine similarity ขั้นต่ำของคำถามที่ถือว่าเป็นคำถามเดียวกัน
+        ttl_seconds: อายุของคำตอบใน cache
+        max_entries: จำนวนคำตอบสูงสุดรวมทุกเอกสาร (เกินแล้ว evict แบบ LRU)
+    """
+
+    def __init__(
+        self,
+        similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD,
+        ttl_seconds=DEFAULT_TTL_SECONDS,
+        max_entries=DEFAULT_MAX_ENTRIES
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (fingerprint, model, normalized question) -> entry
+        self._lock = threading.Lock()
+
+    def _expired(self, entry, now):
+        return now - entry['created_at'] > self.ttl_seconds
+
+    def lookup(self, fingerprint, model, question, embed_query=None):
+        """
+        ค้นหาคำตอบใน cache
+
+        Args:
+            embed_query: ฟังก์ชันแปลงคำถามเป็น embedding (ถ้าไม่ระบุจะค้นหาแบบตรงตัวอย่างเดียว)
+
+        Returns:
+            (entry หรือ None, query embedding หรือ None)
+            entry มี 'result', 'source_documents', 'match' ('exact' หรือ 'semantic') และ 'similarity'
+        """
+        now = time.time()
+        key = (fingerprint, model, normalize_question(question))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry, now):
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return dict(entry, match='exact', similarity=1.0), entry['embedding']
+
+        if embed_query is None:
+            with self._lock:
+                self.misses += 1
+            return None, None
+
+        query_embedding = np.asarray(embed_query(question), dtype=np.float32)
+        query_embedding /= np.linalg.norm(query_embedding) or 1.0
+        numbers = question_numbers(question)
+
+        with self._lock:
+            candidates = [
+                (cache_key, entry) for cache_key, entry in self._entries.items()
+                if cache_key[:2] == (fingerprint, model)
+                and entry['numbers'] == numbers
+                and entry['embedding'] is not None
+                and entry['embedding'].shape == query_embedding.shape
+                and not self._expired(entry, now)
+            ]
+            if candidates:
+                matrix = np.stack([entry['embedding'] for _, entry in candidates])
+                similarities = matrix @ query_embedding
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    cache_key, entry = candidates[best]
+                    self._entries.move_to_end(cache_key)
+                    self.semantic_hits += 1
+                    return dict(entry, match='semantic', similarity=float(similarities[best])), query_embedding
+
+            self.misses += 1
+        return None, query_embedding
+
+    def store(self, fingerprint, model, question, result, source_documents, query_embedding=None):
+        """เก็บคำตอบลง cache (query_embedding ที่ได้จาก lookup ใช้ซ้ำได้ ไม่ต้อง embed ใหม่)"""
+        if query_embedding is not None:
+            query_embedding = np.asarray(query_embedding, dtype=np.float32)
+            query_embedding = query_embedding / (np.linalg.norm(query_embedding) or 1.0)
+
+        with self._lock:
+            key = (fingerprint, model, normalize_question(question))
+            self._entries[key] = {
+                'question': question,
+                'numbers': question_numbers(question),
+                'result': result,
+                'source_documents': list(source_documents),
+                'embedding': query_embedding,
+                'created_at': time.time()
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, fingerprint):
+        """ลบคำตอบทั้งหมดของเอกสาร (เรียกเมื่อ Process เอกสารใหม่)"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == fingerprint]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'exact_hits': self.exact_hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0
+            }
+
+
+_answer_cache = AnswerCache()
+
+
+def get_answer_cache():
+    """คืน AnswerCache ที่ใช้ร่วมกันทั้ง process"""
+    return _answer_cache
@@ -0,0 +1,465 @@
+"""
+Headless Query Service
+HTTP API (aiohttp) สำหรับ Process PDF และถามคำถาม โดยไม่ต้องผ่าน Streamlit
+ใช้ pipeline เดียวกับ UI (ingest_jobs, artifact cache, answer cache, llm_config)
+
+    python api_server.py --port 8080 --ollama-url http://localhost:11434
+
+Endpoints:
+    POST /ingest          อัพโหลด PDF (body เป็นไฟล์ PDF หรือ multipart field "file")
+                          query: embedding_model, index_type, splitter, name
+    GET  /jobs/{job_id}   สถานะงาน Process PDF
+    POST /query           {"document_id", "question", "llm_model", "embedding_model", "adaptive"}
+                          -> คำตอบทั้งหมดเป็น JSON
+    POST /query/stream    เหมือน /query แต่ส่ง NDJSON ทีละ event: sources, token, done (หรือ error)
+    GET  /health          สถานะของ service
+    GET  /metrics         Prometheus text format
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from answer_cache import cache_model, get_answer_cache, normalize_question
+from artifact_cache import get_artifact_cache
+from embeddings_config import DEFAULT_EMBEDDING_MODEL, EmbeddingFactory
+from ingest_jobs import get_job_manager
+from llm_config import DEFAULT_LLM_MODEL, stream_answer
+from ollama_client import get_ollama_pool
+from pdf_processor import file_fingerprint, ingest_params, DEFAULT_SPLITTER, INDEX_TYPES, SPLITTERS
+from resource_registry import get_qa_chain, get_vectorstore, vectorstore_path
+from tracing import Trace, get_metrics_sink, METRIC_PREFIX
+
+
+DEFAULT_OLLAMA_URL = os.environ.get("BORNZI_OLLAMA_URL", "http://localhost:11434")
+# จำนวนคำถามที่ส่งไป LLM แต่ละ model พร้อมกันได้
+DEFAULT_MODEL_CONCURRENCY = int(os.environ.get("BORNZI_API_MODEL_CONCURRENCY", 2))
+# จำนวนคำถาม (ที่ไม่ซ้ำกัน) ที่รอหรือกำลังตอบได้สูงสุด เกินนี้ตอบ 503 ทันที
+DEFAULT_MAX_PENDING = int(os.environ.get("BORNZI_API_MAX_PENDING", 64))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+class QueueFull(Exception):
+    """คิวคำถามเต็ม"""
+
+
+class DocumentNotFound(Exception):
+    """ไม่มี Vector Store ของเอกสารใน artifact cache"""
+
+
+class Flight:
+    """
+    การตอบคำถาม 1 ครั้งที่กำลังทำงาน ผู้ถามคำถามเดียวกันทุกคนติดตาม Flight เดียวกัน
+
+    event ทั้งหมดถูกเก็บไว้ ผู้ที่เข้ามาทีหลังจึงได้รับตั้งแต่ event แรก
+    """
+
+    def __init__(self):
+        self.events = []
+        self.finished = False
+        self._wakeup = asyncio.get_running_loop().create_future()
+
+    def publish(self, event):
+        """เพิ่ม event (เรียกใน event loop เท่านั้น)"""
+        self.events.append(event)
+        if event['type'] in ('done', 'error'):
+            self.finished = True
+        wakeup, self._wakeup = self._wakeup, asyncio.get_running_loop().create_future()
+        wakeup.set_result(None)
+
+    async def follow(self):
+        """async generator ของ event ตั้งแต่ต้นจนจบ"""
+        position = 0
+        while True:
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+            if self.finished:
+                return
+            await self._wakeup
+
+
+def _source_payload(doc):
+    return {'page_content': doc.page_content, 'metadata': doc.metadata}
+
+
+class QueryService:
+    """
+    ตอบคำถามจาก Vector Store ใน artifact cache
+
+    - คำถามเดียวกัน (เอกสาร, models, คำถามหลัง normalize) ที่ถามพร้อมกันใช้การ generate ครั้งเดียว
+    - จำกัดจำนวนการ generate พร้อมกันต่อ LLM model (asyncio.Semaphore)
+    - คำถามที่รอ + กำลังตอบ เกิน max_pending จะถูกปฏิเสธ (QueueFull) แทนการรอคิวยาวไม่จำกัด
+
+    Args:
+        base_url: URL ของ Ollama
+        model_concurrency: จำนวนการ generate พร้อมกันต่อ LLM model
+        max_pending: จำนวนคำถามที่ไม่ซ้ำกันที่รับไว้ได้สูงสุด
+    """
+
+    def __init__(self, base_url=DEFAULT_OLLAMA_URL, model_concurrency=DEFAULT_MODEL_CONCURRENCY,
+                 max_pending=DEFAULT_MAX_PENDING):
+        self.base_url = base_url
+        self.model_concurrency = max(1, model_concurrency)
+        self.max_pending = max(1, max_pending)
+        self.pending = 0
+        self.stats = {'queries': 0, 'coalesced': 0, 'rejected': 0, 'answer_cache_hits': 0, 'errors': 0}
+        self._flights = {}
+        self._semaphores = {}
+        self._running = {}
+        self._tasks = set()  # event loop เก็บ task แบบ weak reference
+        # thread ถูกใช้เฉพาะคำถามที่ได้ semaphore แล้ว จึงไม่เกิน จำนวน model x model_concurrency
+        self._executor = ThreadPoolExecutor(thread_name_prefix="query")
+
+    def _semaphore(self, model):
+        if model not in self._semaphores:
+            self._semaphores[model] = asyncio.Semaphore(self.model_concurrency)
+        return self._semaphores[model]
+
+    def _document_vectorstore(self, document_id, embedding_model):
+        """Vector Store ล่าสุดของเอกสารที่สร้างด้วย embedding_model"""
+        entries = [
+            entry for entry in get_artifact_cache().entries_for(document_id)
+            if entry['embedding_model'] == embedding_model
+        ]
+        if not entries:
+            raise DocumentNotFound(document_id)
+        entry = max(entries, key=lambda entry: entry['last_used'])
+        return get_vectorstore(entry['path'], document_id, embedding_model, self.base_url)
+
+    def query(self, document_id, question, llm_model=DEFAULT_LLM_MODEL,
+              embedding_model=DEFAULT_EMBEDDING_MODEL, adaptive=True):
+        """
+        เริ่มตอบคำถาม หรือเข้าร่วมกับคำถามเดียวกันที่กำลังตอบอยู่
+
+        Returns:
+            (flight, coalesced)
+
+        Raises:
+            QueueFull: มีคำถามรออยู่ครบ max_pending แล้ว
+        """
+        self.stats['queries'] += 1
+        key = (document_id, embedding_model, llm_model, bool(adaptive), normalize_question(question))
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.stats['coalesced'] += 1
+            return flight, True
+
+        if self.pending >= self.max_pending:
+            self.stats['rejected'] += 1
+            raise QueueFull(f"มีคำถามรออยู่ {self.pending} คำถาม")
+
+        flight = Flight()
+        self._flights[key] = flight
+        self.pending += 1
+        # งานแยกจากผู้ถาม - ผู้ถามคนแรกยกเลิก/หลุดไป ผู้ถามคนอื่นยังได้คำตอบ
+        task = asyncio.get_running_loop().create_task(
+            self._run(key, flight, document_id, question, llm_model, embedding_model, adaptive)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return flight, False
+
+    async def _run(self, key, flight, document_id, question, llm_model, embedding_model, adaptive):
+        loop = asyncio.get_running_loop()
+        trace = Trace("query", llm_model=llm_model, embedding_model=embedding_model, api=True)
+        try:
+            async with self._semaphore(llm_model):
+                self._running[llm_model] = self._running.get(llm_model, 0) + 1
+                try:
+                    await loop.run_in_executor(
+                        self._executor,
+                        self._generate,
+                        loop, flight, document_id, question, llm_model, embedding_model, adaptive, trace
+                    )
+                finally:
+                    self._running[llm_model] -= 1
+        except DocumentNotFound:
+            self.stats['errors'] += 1
+            flight.publish({'type': 'error', 'status': 404, 'error': f"ไม่พบเอกสาร {document_id}"})
+        except Exception as e:
+            self.stats['errors'] += 1
+            flight.publish({'type': 'error', 'status': 500, 'error': str(e)})
+        finally:
+            self.pending -= 1
+            del self._flights[key]
+        await loop.run_in_executor(None, get_metrics_sink().record, trace)
+
+    def _generate(self, loop, flight, document_id, question, llm_model, embedding_model, adaptive, trace):
+        """ตอบคำถามใน worker thread แล้วส่ง event กลับเข้า event loop"""
+
+        def publish(event):
+            loop.call_soon_threadsafe(flight.publish, event)
+
+        vectorstore = self._document_vectorstore(document_id, embedding_model)
+        qa_chain = get_qa_chain(vectorstore, document_id, llm_model=llm_model, base_url=self.base_url)
+
+        answer_cache = get_answer_cache()
+        answer_cache_model = cache_model(llm_model, embedding_model, adaptive, vectorstore_path(vectorstore))
+        with trace.span("answer_cache"):
+            cached, query_embedding = answer_cache.lookup(
+                document_id, answer_cache_model, question, vectorstore.embeddings.embed_query
+            )
+        trace.count("answer_cache_hits", int(cached is not None))
+        if cached is not None:
+            self.stats['answer_cache_hits'] += 1
+            publish({'type': 'sources', 'sources': [_source_payload(doc) for doc in cached['source_documents']]})
+            publish({'type': 'token', 'text': cached['result']})
+            publish({'type': 'done', 'cached': True, 'timings': None, 'packing': None})
+            return
+
+        answer_stream = stream_answer(qa_chain, question, query_embedding, adaptive=adaptive, trace=trace)
+        answer_stream.retrieve()
+        publish({'type': 'sources', 'sources': [_source_payload(doc) for doc in answer_stream.source_documents]})
+        for token in answer_stream:
+            publish({'type': 'token', 'text': token})
+
+        answer_cache.store(
+            document_id, answer_cache_model, question, answer_stream.result,
+            answer_stream.source_documents, query_embedding
+        )
+        publish({
+            'type': 'done',
+            'cached': False,
+            'timings': answer_stream.timings,
+            'packing': answer_stream.packing
+        })
+
+    def health(self):
+        return {
+            'status': 'ok',
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'in_flight': len(self._flights),
+            'running': {model: count for model, count in self._running.items() if count},
+            'model_concurrency': self.model_concurrency,
+            **self.stats
+        }
+
+    def prometheus_text(self):
+        p = METRIC_PREFIX
+        lines = [
+            f"# HELP {p}_api_queries_total API queries by outcome.",
+            f"# TYPE {p}_api_queries_total counter"
+        ]
+        lines += [f'{p}_api_queries_total{{outcome="{name}"}} {value}' for name, value in self.stats.items()]
+        lines += [
+            f"# HELP {p}_api_pending Queries waiting or being answered.",
+            f"# TYPE {p}_api_pending gauge",
+            f"{p}_api_pending {self.pending}"
+        ]
+        return "\n".join(lines) + "\n"
+
+
+# ==================== HTTP handlers ====================
+
+def _error(status, message):
+    return web.json_response({'error': message}, status=status)
+
+
+async def _read_query(request):
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text="body ต้องเป็น JSON")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="body ต้องเป็น JSON object")
+    if not body.get('document_id') or not body.get('question'):
+        raise web.HTTPBadRequest(text="ต้องระบุ document_id และ question")
+    if not isinstance(body['document_id'], str) or not isinstance(body['question'], str):
+        raise web.HTTPBadRequest(text="document_id และ question ต้องเป็นข้อความ")
+    return {
+        'document_id': body['document_id'],
+        'question': body['question'],
+        'llm_model': body.get('llm_model', DEFAULT_LLM_MODEL),
+        'embedding_model': body.get('embedding_model', DEFAULT_EMBEDDING_MODEL),
+        'adaptive': body.get('adaptive', True)
+    }
+
+
+async def handle_query(request):
+    service = request.app['service']
+    try:
+        flight, coalesced = service.query(**await _read_query(request))
+    except QueueFull as e:
+        return web.json_response({'error': str(e)}, status=503, headers={'Retry-After': "1"})
+
+    answer, sources, done = [], [], None
+    async for event in flight.follow():
+        if event['type'] == 'sources':
+            sources = event['sources']
+        elif event['type'] == 'token':
+            answer.append(event['text'])
+        elif event['type'] == 'error':
+            return _error(event['status'], event['error'])
+        else:
+            done = event
+    return web.json_response({
+        'answer': "".join(answer),
+        'sources': sources,
+        'cached': done['cached'],
+        'coalesced': coalesced,
+        'timings': done['timings'],
+        'packing': done['packing']
+    })
+
+
+async def handle_query_stream(request):
+    service = request.app['service']
+    try:
+        flight, coalesced = service.query(**await _read_query(request))
+    except QueueFull as e:
+        return web.json_response({'error': str(e)}, status=503, headers={'Retry-After': "1"})
+
+    response = web.StreamResponse(headers={'Content-Type': "application/x-ndjson"})
+    await response.prepare(request)
+    async for event in flight.follow():
+        if event['type'] == 'done':
+            event = dict(event, coalesced=coalesced)
+        await response.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+    await response.write_eof()
+    return response
+
+
+async def _save_upload(request):
+    """บันทึก PDF ที่อัพโหลดลงไฟล์ชั่วคราวทีละส่วน (ไม่อ่านทั้งไฟล์เข้า memory)"""
+    name = request.query.get('name')
+    if request.content_type.startswith("multipart/"):
+        reader = await request.multipart()
+        part = await reader.next()
+        while part is not None and part.name != "file":
+            part = await reader.next()
+        if part is None:
+            raise web.HTTPBadRequest(text="ไม่พบ field 'file'")
+        name = name or part.filename
+        read_chunk = lambda: part.read_chunk(UPLOAD_CHUNK_BYTES)
+    else:
+        read_chunk = lambda: request.content.read(UPLOAD_CHUNK_BYTES)
+
+    upload = tempfile.SpooledTemporaryFile(max_size=16 * UPLOAD_CHUNK_BYTES)
+    while True:
+        chunk = await read_chunk()
+        if not chunk:
+            break
+        upload.write(chunk)
+    if upload.tell() == 0:
+        raise web.HTTPBadRequest(text="ไฟล์ว่าง")
+    upload.seek(0)
+    return upload, name or "document.pdf"
+
+
+def _submit_ingest(service, upload, name, embedding_model, params):
+    fingerprint = file_fingerprint(upload)
+    entry = get_artifact_cache().lookup(fingerprint, embedding_model, params, name=name)
+    if entry is not None:
+        return {'document_id': fingerprint, 'status': "done", 'cached': True, 'info': entry['info']}, 200
+    job_id = get_job_manager().submit(
+        upload, fingerprint, embedding_model, params, name=name, base_url=service.base_url
+    )
+    return {'document_id': fingerprint, 'job_id': job_id, 'status': "queued", 'cached': False}, 202
+
+
+async def handle_ingest(request):
+    service = request.app['service']
+    embedding_model = request.query.get('embedding_model', DEFAULT_EMBEDDING_MODEL)
+    index_type = request.query.get('index_type', "auto")
+    splitter = request.query.get('splitter', DEFAULT_SPLITTER)
+    # ตรวจก่อนรับไฟล์ ค่าที่ไม่รองรับจะทำให้งานล้มเหลวใน worker หลังอัพโหลดเสร็จ
+    if embedding_model not in EmbeddingFactory.SUPPORTED_MODELS:
+        return _error(400, f"ไม่รองรับ embedding_model '{embedding_model}'. ที่ใช้ได้: {list(EmbeddingFactory.SUPPORTED_MODELS)}")
+    if index_type not in INDEX_TYPES:
+        return _error(400, f"ไม่รองรับ index_type '{index_type}'. ที่ใช้ได้: {list(INDEX_TYPES)}")
+    if splitter not in SPLITTERS:
+        return _error(400, f"ไม่รองรับ splitter '{splitter}'. ที่ใช้ได้: {list(SPLITTERS)}")
+
+    upload, name = await _save_upload(request)
+    params = ingest_params(index_type=index_type, splitter=splitter)
+    with upload:
+        payload, status = await asyncio.get_running_loop().run_in_executor(
+            None, _submit_ingest, service, upload, name, embedding_model, params
+        )
+    return web.json_response(payload, status=status)
+
+
+async def handle_job(request):
+    job = get_job_manager().get(request.match_info['job_id'])
+    if job is None:
+        return _error(404, "ไม่พบงาน")
+    return web.json_response({
+        'job_id': job['id'],
+        'document_id': job['fingerprint'],
+        'name': job['name'],
+        'status': job['status'],
+        'embedding_model': job['embedding_model'],
+        'pages_done': job['pages_done'],
+        'num_pages': job['num_pages'],
+        'chunks_done': job['chunks_done'],
+        'error': job['error'],
+        'result': job['result']
+    })
+
+
+async def handle_health(request):
+    service = request.app['service']
+    # probe เป็น HTTP request แบบ blocking - รันใน thread แยกไม่ให้บล็อก event loop
+    probe = await asyncio.get_running_loop().run_in_executor(None, get_ollama_pool().probe, service.base_url)
+    return web.json_response({
+        **service.health(),
+        'ollama': {
+            'ok': probe['ok'],
+            'latency_ms': round(probe['latency_ms'], 1),
+            'loaded_models': [model['name'] for model in probe['models']],
+            'error': probe['error']
+        }
+    })
+
+
+async def warm_up_models(app):
+    """โหลด model เริ่มต้นเข้า memory ของ Ollama ตอนเปิด server (ไม่รอให้เสร็จ)"""
+    get_ollama_pool().warm_up(
+        embedding_models=[DEFAULT_EMBEDDING_MODEL],
+        llm_models=[DEFAULT_LLM_MODEL],
+        base_url=app['service'].base_url
+    )
+
+
+async def handle_metrics(request):
+    text = get_metrics_sink().prometheus_text() + request.app['service'].prometheus_text()
+    return web.Response(text=text, content_type="text/plain")
+
+
+def create_app(service=None):
+    """สร้าง aiohttp application (ใช้ทดสอบหรือรันร่วมกับ server อื่นได้)"""
+    app = web.Application()
+    app['service'] = service or QueryService()
+    app.router.add_post("/ingest", handle_ingest)
+    app.router.add_get("/jobs/{job_id}", handle_job)
+    app.router.add_post("/query", handle_query)
+    app.router.add_post("/query/stream", handle_query_stream)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+    app.on_startup.append(warm_up_models)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP API สำหรับ Process PDF และถามคำถาม")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--ollama-url", default=DEFAULT_OLLAMA_URL)
+    parser.add_argument("--model-concurrency", type=int, default=DEFAULT_MODEL_CONCURRENCY,
+                        help="จำนวนคำถามที่ส่งไป LLM แต่ละ model พร้อมกัน")
+    parser.add_argument("--max-pending", type=int, default=DEFAULT_MAX_PENDING,
+                        help="จำนวนคำถามที่รอได้สูงสุด (เกินนี้ตอบ 503)")
+    args = parser.parse_args(argv)
+
+    service = QueryService(args.ollama_url, args.model_concurrency, args.max_pending)
+    web.run_app(create_app(service), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
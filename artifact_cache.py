@@ -0,0 +1,327 @@
+"""
+Vector Store Artifact Cache
+เก็บ vector store ที่ประมวลผลแล้ว แยกตามเนื้อหาของ PDF (sha256), embedding model และค่าการแบ่ง chunks
+PDF เดียวกันที่อัพโหลดด้วยชื่ออื่นจะใช้ index เดิมได้ทันที โดยไม่ต้อง embed ใหม่
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+
+ARTIFACT_DIR = os.path.join("vectorstore_cache", "artifacts")
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+DEFAULT_MAX_BYTES = int(os.environ.get("BORNZI_ARTIFACT_CACHE_MAX_BYTES", 10 * 1024 ** 3))
+# vector store รุ่นแรก: <ชื่อไฟล์>.faiss ใน vectorstore_cache (FAISS.save_local, ไม่มี fingerprint/model)
+LEGACY_SUFFIX = ".faiss"
+
+
+def artifact_key(fingerprint, embedding_model, params):
+    """key ของ artifact = hash ของ (เนื้อหา PDF, embedding model, ค่าการประมวลผล)"""
+    payload = json.dumps(
+        {'fingerprint': fingerprint, 'embedding_model': embedding_model, 'params': params},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _directory_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            total += os.path.getsize(os.path.join(dirpath, name))
+    return total
+
+
+class ArtifactCache:
+    """
+    Cache ของ vector store บนดิสก์ พร้อม manifest และขนาดรวมสูงสุด
+
+    เมื่อขนาดรวมเกิน max_bytes จะลบ artifact ที่ไม่ได้ใช้นานที่สุดก่อน (LRU)
+
+    Args:
+        directory: โฟลเดอร์ของ cache (1 โฟลเดอร์ย่อยต่อ artifact)
+        max_bytes: ขนาดรวมสูงสุดของทุก artifact
+    """
+
+    def __init__(self, directory=ARTIFACT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+        self._legacy_imported = False
+        self._entries = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get('version') != MANIFEST_VERSION:
+            return {}
+        self._legacy_imported = manifest.get('legacy_imported', False)
+        return manifest['entries']
+
+    def _save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {'version': MANIFEST_VERSION, 'legacy_imported': self._legacy_imported, 'entries': self._entries},
+                f, ensure_ascii=False, indent=2
+            )
+        os.replace(tmp_path, self.manifest_path)
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key)
+
+    def peek(self, fingerprint, embedding_model, params, name=None):
+        """ตรวจว่ามี artifact หรือไม่ โดยไม่นับเป็นการใช้งาน (ใช้แสดงผลใน UI)"""
+        from vector_store_format import is_native_store  # faiss/langchain โหลดเมื่อมีไฟล์ให้ตรวจเท่านั้น
+        
+        key = artifact_key(fingerprint, embedding_model, params)
+        with self._lock:
+            self._adopt_legacy(key, fingerprint, embedding_model, params, name)
+            entry = self._entries.get(key)
+            if entry is None or not is_native_store(self.path_for(key)):
+                return None
+            return dict(entry, key=key, path=self.path_for(key))
+
+    def lookup(self, fingerprint, embedding_model, params, name=None):
+        """
+        ค้นหา artifact ของเอกสาร
+
+        Args:
+            name: ชื่อไฟล์ที่อัพโหลด (ถ้ามี จะถูกเพิ่มในรายชื่อของ artifact)
+
+        Returns:
+            entry (dict มี 'path', 'names', 'info', ...) หรือ None
+        """
+        from vector_store_format import is_native_store
+        
+        key = artifact_key(fingerprint, embedding_model, params)
+        with self._lock:
+            self._adopt_legacy(key, fingerprint, embedding_model, params, name)
+            entry = self._entries.get(key)
+            if entry is None or not is_native_store(self.path_for(key)):
+                if entry is not None:
+                    # ไฟล์ถูกลบไปจากภายนอก
+                    del self._entries[key]
+                    self._save()
+                self.misses += 1
+                return None
+
+            entry['last_used'] = time.time()
+            if name and name not in entry['names']:
+                entry['names'].append(name)
+            self._save()
+            self.hits += 1
+            return dict(entry, key=key, path=self.path_for(key))
+
+    def store(self, fingerprint, embedding_model, params, vectorstore, name=None, info=None):
+        """
+        บันทึก vector store ลง cache แล้ว evict artifact เก่าถ้าเกินขนาดที่กำหนด
+
+        Args:
+            info: ข้อมูลเพิ่มเติมของการประมวลผล (จำนวนหน้า, chunks, ...) แสดงตอนโหลดจาก cache
+
+        Returns:
+            entry ของ artifact ที่บันทึก
+        """
+        from vector_store_format import save_store
+        
+        key = artifact_key(fingerprint, embedding_model, params)
+        path = self.path_for(key)
+        save_store(vectorstore, path)
+
+        now = time.time()
+        with self._lock:
+            previous = self._entries.get(key, {})
+            names = previous.get('names', [])
+            if name and name not in names:
+                names.append(name)
+            self._entries[key] = {
+                'fingerprint': fingerprint,
+                'embedding_model': embedding_model,
+                'params': params,
+                'names': names,
+                'info': info or {},
+                'size_bytes': _directory_size(path),
+                'created_at': now,
+                'last_used': now
+            }
+            self._evict(keep=key)
+            self._save()
+            return dict(self._entries[key], key=key, path=path)
+
+    def import_legacy_stores(self, root, params):
+        """
+        นำ vector store รุ่นแรก (<ชื่อไฟล์>.faiss ใน root) เข้า cache ครั้งเดียวตอนเริ่มใช้งานครั้งแรก
+
+        store รุ่นแรกไม่ได้บันทึก fingerprint และ embedding model ไว้:
+        - แปลงเป็นรูปแบบ native (convert_legacy_store) และย้ายเข้าโฟลเดอร์ของ cache
+        - embedding model หาจากขนาด vector (ต้องตรงกับ model เดียวใน SUPPORTED_MODELS)
+        - fingerprint ยังไม่รู้ จะผูกกับ fingerprint ของไฟล์ชื่อเดียวกันที่อัพโหลดครั้งแรก
+          (เหมือนที่รุ่นแรกค้นหา store จากชื่อไฟล์)
+        store ที่แปลงไม่ได้หรือหา model ไม่ได้จะถูกลบ
+
+        Args:
+            params: ค่าการประมวลผลที่ใช้เป็น key (ค่าเริ่มต้นของ ingest_params)
+
+        Returns:
+            dict: imported = ชื่อไฟล์ที่นำเข้า, removed = (ชื่อไฟล์, เหตุผล) ที่ถูกลบ
+        """
+        result = {'imported': [], 'removed': []}
+        with self._lock:
+            if self._legacy_imported:
+                return result
+            legacy_dirs = sorted(
+                entry for entry in os.listdir(root)
+                if entry.endswith(LEGACY_SUFFIX) and os.path.isdir(os.path.join(root, entry))
+            ) if os.path.isdir(root) else []
+            for dirname in legacy_dirs:
+                name = dirname[:-len(LEGACY_SUFFIX)]
+                try:
+                    self._import_legacy_store(os.path.join(root, dirname), name, params)
+                    result['imported'].append(name)
+                except Exception as e:
+                    shutil.rmtree(os.path.join(root, dirname), ignore_errors=True)
+                    result['removed'].append((name, str(e)))
+            self._legacy_imported = True
+            self._save()
+        return result
+
+    def _import_legacy_store(self, legacy_path, name, params):
+        from embeddings_config import EmbeddingFactory
+        from vector_store_format import convert_legacy_store, is_legacy_store, is_native_store, load_store
+
+        if is_legacy_store(legacy_path):
+            convert_legacy_store(legacy_path)
+        elif not is_native_store(legacy_path):
+            raise ValueError("ไม่พบไฟล์ของ vector store")
+
+        vectorstore = load_store(legacy_path, None, mmap_index=False)
+        dimension = vectorstore.index.d
+        models = [
+            model for model, info in EmbeddingFactory.get_all_models().items()
+            if info.get('dimension') == dimension
+        ]
+        if len(models) != 1:
+            raise ValueError(f"ไม่ทราบ embedding model ของ vector ขนาด {dimension} มิติ")
+
+        documents = [vectorstore.docstore.search(doc_id) for doc_id in vectorstore.index_to_docstore_id.values()]
+        key = "legacy-" + hashlib.sha256(name.encode("utf-8")).hexdigest()
+        path = self.path_for(key)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+        shutil.move(legacy_path, path)
+
+        now = time.time()
+        self._entries[key] = {
+            'fingerprint': None,  # ผูกกับไฟล์ที่อัพโหลดด้วยชื่อนี้ครั้งแรก (_adopt_legacy)
+            'embedding_model': models[0],
+            'params': params,
+            'names': [name],
+            'info': {
+                'num_pages': len({(doc.metadata.get('source'), doc.metadata.get('page')) for doc in documents}),
+                'total_chars': sum(len(doc.page_content) for doc in documents),
+                'num_chunks': len(documents),
+                'legacy': True
+            },
+            'size_bytes': _directory_size(path),
+            'created_at': now,
+            'last_used': now
+        }
+
+    def _adopt_legacy(self, key, fingerprint, embedding_model, params, name):
+        """ผูก store รุ่นแรกที่มีชื่อไฟล์ตรงกันเข้ากับ fingerprint ของไฟล์ที่อัพโหลด"""
+        if not name or key in self._entries:
+            return
+        for legacy_key, entry in self._entries.items():
+            if (entry['fingerprint'] is None and name in entry['names']
+                    and entry['embedding_model'] == embedding_model and entry['params'] == params):
+                break
+        else:
+            return
+        os.replace(self.path_for(legacy_key), self.path_for(key))
+        del self._entries[legacy_key]
+        self._entries[key] = dict(entry, fingerprint=fingerprint)
+        self._save()
+
+    def _evict(self, keep=None):
+        total = sum(entry['size_bytes'] for entry in self._entries.values())
+        for key in sorted(self._entries, key=lambda key: self._entries[key]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._entries[key]['size_bytes']
+            self._remove(key)
+            self.evictions += 1
+
+    def _remove(self, key):
+        del self._entries[key]
+        shutil.rmtree(self.path_for(key), ignore_errors=True)
+
+    def remove(self, key):
+        """ลบ artifact ออกจาก cache"""
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            self._save()
+            return True
+
+    def entries_for(self, fingerprint):
+        """artifact ทั้งหมดของเอกสาร (ทุก embedding model / ค่าการประมวลผล)"""
+        with self._lock:
+            return [
+                dict(entry, key=key, path=self.path_for(key))
+                for key, entry in self._entries.items()
+                if entry['fingerprint'] == fingerprint
+            ]
+
+    def ingest_speed(self, embedding_model):
+        """ความเร็วเฉลี่ยในการประมวลผล (chunks/วินาที) ที่วัดได้ของ embedding model หรือ None"""
+        with self._lock:
+            speeds = [
+                entry['info']['chunks_per_sec']
+                for entry in self._entries.values()
+                if entry['embedding_model'] == embedding_model and entry['info'].get('chunks_per_sec')
+            ]
+        return sum(speeds) / len(speeds) if speeds else None
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(entry['size_bytes'] for entry in self._entries.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'total_bytes': self.total_bytes(),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+_artifact_cache = None
+_artifact_cache_lock = threading.Lock()
+
+
+def get_artifact_cache():
+    """คืน ArtifactCache ที่ใช้ร่วมกันทั้ง process"""
+    global _artifact_cache
+    with _artifact_cache_lock:
+        if _artifact_cache is None:
+            _artifact_cache = ArtifactCache()
+        return _artifact_cache
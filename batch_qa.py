@@ -0,0 +1,357 @@
+"""
+Batch Question Answering
+ตอบคำถามจำนวนมากจากเอกสารเดียว (เช่น สร้าง FAQ หรือตรวจคำตอบซ้ำหลัง Process PDF ใหม่)
+
+    python batch_qa.py questions.txt --document <sha256 ของ PDF> --output answers.jsonl
+    python batch_qa.py questions.jsonl --vectorstore vectorstore_cache/artifacts/... --workers 4
+
+- คำถาม: ไฟล์ .txt (บรรทัดละคำถาม) หรือ .jsonl ({"id": ..., "question": ...})
+- embed คำถามเป็น batch แล้วค้นหา FAISS ครั้งเดียวสำหรับทุกคำถาม (matrix search)
+- คำถามที่ซ้ำกันตอบครั้งเดียว และคำถามที่ได้ context ชุดเดียวกันถูกส่งไป LLM ติดกัน
+  (prompt ขึ้นต้นด้วย context เหมือนกัน Ollama จึงใช้ KV cache ของส่วนนั้นซ้ำได้)
+- generate พร้อมกันไม่เกิน --workers คำถาม
+- ผลลัพธ์ (คำตอบ, แหล่งอ้างอิง, เวลาแต่ละคำถาม) เขียนลง JSONL ทีละบรรทัด
+  รันคำสั่งเดิมซ้ำจะข้ามคำถามที่ตอบแล้ว (ทำต่อหลังถูกขัดจังหวะ)
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import faiss
+import numpy as np
+
+from answer_cache import normalize_question
+from artifact_cache import get_artifact_cache
+from embeddings_config import DEFAULT_EMBEDDING_MODEL
+from llm_config import DEFAULT_LLM_MODEL, ADAPTIVE_MAX_K, select_k, create_qa_chain, StreamingAnswer
+from ollama_client import DEFAULT_BASE_URL
+from parallel_embeddings import ParallelEmbeddings, DEFAULT_BATCH_SIZE, DEFAULT_MAX_CONCURRENCY
+from pdf_processor import load_vectorstore
+from tracing import Trace, get_metrics_sink
+
+
+# จำนวนคำถามที่ generate พร้อมกัน
+DEFAULT_WORKERS = int(os.environ.get("BORNZI_BATCH_QA_WORKERS", 2))
+# search_kwargs ของ retriever ที่ batch_search ทำได้เหมือนการถามทีละคำถาม
+SUPPORTED_SEARCH_KWARGS = ("k", "filter", "fetch_k", "score_threshold")
+
+
+def question_id(question):
+    """id ของคำถามที่ไม่ได้ระบุ id มา (คงเดิมแม้ลำดับในไฟล์เปลี่ยน)"""
+    return hashlib.sha1(normalize_question(question).encode("utf-8")).hexdigest()[:12]
+
+
+def load_questions(path):
+    """
+    อ่านคำถามจากไฟล์ .txt (บรรทัดละคำถาม) หรือ .jsonl
+
+    Returns:
+        list ของ (id, question) ไม่มี id ซ้ำ
+    """
+    questions = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                item = json.loads(line)
+                question = item['question'].strip()
+                qid = str(item.get('id') or question_id(question))
+            else:
+                question = line
+                qid = question_id(question)
+            questions.setdefault(qid, question)
+    return list(questions.items())
+
+
+def truncate_partial_line(output_path):
+    """ตัดบรรทัดสุดท้ายที่เขียนไม่ครบ (โปรแกรมถูกหยุดระหว่างเขียน) ก่อนเขียนต่อท้าย"""
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def load_done_ids(output_path):
+    """id ของคำถามที่ตอบสำเร็จแล้วในไฟล์ผลลัพธ์ (บรรทัดที่เขียนไม่ครบหรือ error จะถูกตอบใหม่)"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get('error') is None and 'answer' in record:
+                done.add(record['id'])
+    return done
+
+
+def resolve_vectorstore(document_id=None, vectorstore_path=None,
+                        embedding_model=DEFAULT_EMBEDDING_MODEL, base_url=DEFAULT_BASE_URL):
+    """Vector Store จาก path หรือ artifact ล่าสุดของเอกสารใน artifact cache"""
+    if vectorstore_path is None:
+        entries = [
+            entry for entry in get_artifact_cache().entries_for(document_id)
+            if entry['embedding_model'] == embedding_model
+        ]
+        if not entries:
+            raise ValueError(f"ไม่พบเอกสาร {document_id} ที่ประมวลผลด้วย {embedding_model}")
+        vectorstore_path = max(entries, key=lambda entry: entry['last_used'])['path']
+    return load_vectorstore(vectorstore_path, embedding_model, base_url)
+
+
+def batch_search(vectorstore, embeddings, k, filter=None, fetch_k=20, score_threshold=None):
+    """
+    ค้นหาทุกคำถามด้วย FAISS search ครั้งเดียว
+
+    filter, fetch_k และ score_threshold ทำงานแบบเดียวกับ FAISS.similarity_search_with_score_by_vector
+    (retriever ของ QA chain) ผลลัพธ์จึงตรงกับการถามทีละคำถาม
+
+    Returns:
+        (scores, indices) ขนาด (จำนวนคำถาม, k) - index -1 = ไม่มีผลลัพธ์
+    """
+    from langchain_community.vectorstores.utils import DistanceStrategy
+
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if getattr(vectorstore, "_normalize_L2", False):
+        faiss.normalize_L2(matrix)
+    scores, indices = vectorstore.index.search(matrix, k if filter is None else fetch_k)
+    if filter is None and score_threshold is None:
+        return scores, indices
+
+    keep_chunk = vectorstore._create_filter_func(filter) if filter is not None else None
+    higher_is_better = vectorstore.distance_strategy in (
+        DistanceStrategy.MAX_INNER_PRODUCT, DistanceStrategy.JACCARD
+    )
+    matches = {}  # ผลของ filter ต่อ chunk (หลายคำถามมักได้ chunk เดียวกัน)
+
+    def keep(score, i):
+        if keep_chunk is not None:
+            if i not in matches:
+                doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[i])
+                matches[i] = keep_chunk(doc.metadata)
+            if not matches[i]:
+                return False
+        if score_threshold is not None:
+            return score >= score_threshold if higher_is_better else score <= score_threshold
+        return True
+
+    kept_scores = np.zeros((len(matrix), k), dtype=np.float32)
+    kept_indices = np.full((len(matrix), k), -1, dtype=np.int64)
+    for row, (row_scores, row_indices) in enumerate(zip(scores, indices)):
+        kept = [(score, i) for score, i in zip(row_scores, row_indices) if i >= 0 and keep(score, i)][:k]
+        for column, (score, i) in enumerate(kept):
+            kept_scores[row, column] = score
+            kept_indices[row, column] = i
+    return kept_scores, kept_indices
+
+
+def select_hits(scores, indices, k, adaptive):
+    """ตำแหน่งใน index ที่ใช้ตอบของแต่ละคำถาม (ตัดด้วย select_k เมื่อ adaptive)"""
+    hits = []
+    for row_scores, row_indices in zip(scores, indices):
+        valid = [(float(score), int(i)) for score, i in zip(row_scores, row_indices) if i >= 0]
+        n = select_k([score for score, _ in valid], max_k=k) if adaptive else min(k, len(valid))
+        hits.append([i for _, i in valid[:n]])
+    return hits
+
+
+def _source_payload(doc):
+    return {'page_content': doc.page_content, 'metadata': doc.metadata}
+
+
+class BatchAnswerer:
+    """
+    ตอบคำถามหลายข้อจาก Vector Store เดียว
+
+    Args:
+        vectorstore: FAISS vectorstore ของเอกสาร
+        output_path: ไฟล์ JSONL สำหรับผลลัพธ์ (เขียนต่อท้าย)
+        workers: จำนวนคำถามที่ generate พร้อมกัน
+        batch_size: จำนวนคำถามต่อ 1 embedding request
+        search_kwargs: ค่าเพิ่มเติมของ retriever แบบเดียวกับ create_qa_chain (SUPPORTED_SEARCH_KWARGS)
+    """
+
+    def __init__(self, vectorstore, output_path, llm_model=DEFAULT_LLM_MODEL, base_url=DEFAULT_BASE_URL,
+                 adaptive=True, workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE,
+                 embed_concurrency=DEFAULT_MAX_CONCURRENCY, search_kwargs=None):
+        unsupported = set(search_kwargs or {}) - set(SUPPORTED_SEARCH_KWARGS)
+        if unsupported:
+            raise ValueError(f"batch_search ไม่รองรับ search_kwargs: {', '.join(sorted(unsupported))}")
+        self.vectorstore = vectorstore
+        self.output_path = output_path
+        self.llm_model = llm_model
+        self.adaptive = adaptive
+        self.workers = max(1, workers)
+        self.embeddings = ParallelEmbeddings(
+            vectorstore.embeddings, batch_size=batch_size, max_concurrency=embed_concurrency
+        )
+        self.qa_chain = create_qa_chain(vectorstore, llm_model, base_url, search_kwargs=search_kwargs)
+        self.stats = {'questions': 0, 'skipped': 0, 'answered': 0, 'errors': 0,
+                      'unique_contexts': 0, 'embed_requests': 0}
+        self._write_lock = threading.Lock()
+
+    def run(self, questions, trace=None):
+        """
+        ตอบคำถามที่ยังไม่มีในไฟล์ผลลัพธ์
+
+        Args:
+            questions: list ของ (id, question)
+
+        Returns:
+            stats
+        """
+        trace = trace or Trace("batch_qa", llm_model=self.llm_model)
+        truncate_partial_line(self.output_path)
+        done = load_done_ids(self.output_path)
+        # คำถามที่เหมือนกัน (หลัง normalize) แต่ต่าง id ตอบครั้งเดียวแล้วบันทึกให้ทุก id
+        unanswered = {}
+        for qid, question in questions:
+            if qid not in done:
+                unanswered.setdefault(normalize_question(question), (question, []))[1].append(qid)
+        pending = [(qids, question) for question, qids in unanswered.values()]
+        self.stats.update(
+            questions=len(questions),
+            skipped=len(questions) - sum(len(qids) for qids, _ in pending)
+        )
+        if not pending:
+            return self.stats
+
+        # 1) embed คำถามทั้งหมดเป็น batch
+        started = time.perf_counter()
+        with trace.span("embed"):
+            vectors = self.embeddings.embed_documents([question for _, question in pending])
+        self.stats['embed_requests'] = self.embeddings.requests
+        embed_time = time.perf_counter() - started
+
+        # 2) FAISS search ครั้งเดียวสำหรับทุกคำถาม
+        # ใช้ search_kwargs ชุดเดียวกับ retriever ของ QA chain (เหมือนถามทีละคำถาม)
+        search_kwargs = dict(self.qa_chain.retriever.search_kwargs)
+        k = search_kwargs.pop("k", ADAPTIVE_MAX_K)
+        started = time.perf_counter()
+        with trace.span("retrieval"):
+            scores, indices = batch_search(self.vectorstore, vectors, k, **search_kwargs)
+            hits = select_hits(scores, indices, k, self.adaptive)
+            # ดึงข้อความของแต่ละ chunk ครั้งเดียว แม้หลายคำถามใช้ chunk เดียวกัน
+            documents = {
+                i: self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[i])
+                for i in set().union(*hits)
+            }
+        search_time = time.perf_counter() - started
+        trace.count("questions", len(pending))
+        trace.count("unique_chunks", len(documents))
+
+        # 3) จัดกลุ่มคำถามที่ได้ context ชุดเดียวกัน ให้ถูก generate ติดกัน
+        groups = {}
+        for item, row in zip(pending, hits):
+            groups.setdefault(tuple(sorted(row)), []).append((item, row))
+        self.stats['unique_contexts'] = len(groups)
+        trace.count("unique_contexts", len(groups))
+
+        shared_timings = {
+            'embed': embed_time / len(pending),
+            'search': search_time / len(pending)
+        }
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch-qa") as executor:
+            futures = [
+                executor.submit(self._answer, qids, question, [documents[i] for i in row], shared_timings, trace)
+                for members in groups.values()
+                for (qids, question), row in members
+            ]
+            try:
+                for future in as_completed(futures):
+                    ok, count = future.result()
+                    self.stats['answered' if ok else 'errors'] += count
+            except KeyboardInterrupt:
+                # คำถามที่ตอบเสร็จถูกบันทึกแล้ว รันใหม่จะทำต่อจากที่ค้าง
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+        return self.stats
+
+    def _answer(self, qids, question, source_documents, shared_timings, trace):
+        """ตอบ 1 คำถามแล้วบันทึกผลของทุก id ที่ถามคำถามนี้ (คืน (สำเร็จหรือไม่, จำนวน id))"""
+        record = {'question': question}
+        try:
+            answer_stream = StreamingAnswer(
+                self.qa_chain, question, adaptive=self.adaptive, trace=trace,
+                source_documents=source_documents
+            )
+            for _ in answer_stream:
+                pass
+            record.update(
+                answer=answer_stream.result,
+                sources=[_source_payload(doc) for doc in source_documents],
+                timings={**shared_timings, **answer_stream.timings},
+                packing=answer_stream.packing,
+                error=None
+            )
+        except Exception as e:
+            record.update(error=str(e))
+        self._write([{'id': qid, **record} for qid in qids])
+        return record['error'] is None, len(qids)
+
+    def _write(self, records):
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        with self._write_lock:
+            with open(self.output_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ตอบคำถามจำนวนมากจากเอกสาร แล้วบันทึกเป็น JSONL")
+    parser.add_argument("questions", help="ไฟล์คำถาม .txt (บรรทัดละคำถาม) หรือ .jsonl")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--document", help="document_id (sha256 ของ PDF) ใน artifact cache")
+    source.add_argument("--vectorstore", help="path ของ Vector Store")
+    parser.add_argument("--output", default="answers.jsonl")
+    parser.add_argument("--embedding-model", default=DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument("--llm-model", default=DEFAULT_LLM_MODEL)
+    parser.add_argument("--ollama-url", default=DEFAULT_BASE_URL)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="จำนวนคำถามที่ generate พร้อมกัน")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="จำนวนคำถามต่อ 1 embedding request")
+    parser.add_argument("--no-adaptive", action="store_true", help="ใช้ k และ num_ctx คงที่")
+    args = parser.parse_args(argv)
+
+    questions = load_questions(args.questions)
+    vectorstore = resolve_vectorstore(args.document, args.vectorstore, args.embedding_model, args.ollama_url)
+    answerer = BatchAnswerer(
+        vectorstore, args.output,
+        llm_model=args.llm_model,
+        base_url=args.ollama_url,
+        adaptive=not args.no_adaptive,
+        workers=args.workers,
+        batch_size=args.batch_size
+    )
+
+    trace = Trace("batch_qa", llm_model=args.llm_model, embedding_model=args.embedding_model)
+    try:
+        stats = answerer.run(questions, trace)
+    except KeyboardInterrupt:
+        print(f"⏸️ หยุดแล้ว - รันคำสั่งเดิมอีกครั้งเพื่อทำต่อ ({args.output})", file=sys.stderr)
+        return 130
+    trace.finish()
+    get_metrics_sink().record(trace)
+
+    print(
+        f"✅ {stats['answered']} คำตอบ | ข้าม {stats['skipped']} (ตอบแล้ว) | error {stats['errors']} | "
+        f"{stats['unique_contexts']} context ไม่ซ้ำ | {stats['embed_requests']} embedding requests | "
+        f"{trace.total_time:.1f} วิ"
+    )
+    return 1 if stats['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,313 @@
+"""
+Fake Ollama Server
+HTTP server ที่จำลอง API ของ Ollama สำหรับ benchmark โดยไม่ต้องใช้ GPU
+
+- /api/embed, /api/embeddings  embedding แบบ deterministic (feature hashing ของ character n-grams)
+                                ข้อความที่คล้ายกันได้ vector ที่ใกล้กัน จึงวัด retrieval ได้จริง
+- /api/generate                 ส่ง token แบบ streaming (NDJSON) พร้อม latency ที่กำหนดได้
+                                prompt ว่าง = โหลด model อย่างเดียว (นับใน load_calls)
+- /api/tags, /api/ps            รายการ models
+
+รันแยกได้:
+    python -m benchmarks.fake_ollama --port 11435
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+DEFAULT_DIMENSION = 1024
+NGRAM = 3
+
+
+def fake_embedding(text, dimension=DEFAULT_DIMENSION):
+    """
+    embedding แบบ deterministic จาก character 3-grams (ใช้ได้กับภาษาไทยที่ไม่มีช่องว่าง)
+
+    แต่ละ n-gram ถูก hash ไปยังตำแหน่งหนึ่งใน vector พร้อมเครื่องหมาย +/- แล้ว normalize
+    """
+    vector = np.zeros(dimension, dtype=np.float32)
+    text = " ".join(text.lower().split())
+    for i in range(max(len(text) - NGRAM + 1, 1)):
+        digest = hashlib.blake2b(text[i:i + NGRAM].encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        vector[value % dimension] += 1.0 if value >> 63 else -1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeOllamaServer:
+    """
+    Ollama จำลองที่รันใน thread แยก
+
+    Args:
+        port: 0 = เลือก port ว่างอัตโนมัติ
+        dimension: ขนาดของ embedding
+        embed_latency: เวลาคงที่ต่อ 1 request ของ /api/embed (วินาที)
+        embed_latency_per_item: เวลาเพิ่มต่อ 1 ข้อความใน request (วินาที)
+        first_token_latency: เวลาก่อนได้ token แรก (จำลอง prefill)
+        token_latency: เวลาต่อ 1 token (จำลอง decode)
+        response_tokens: จำนวน token ของคำตอบ
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, dimension=DEFAULT_DIMENSION,
+                 embed_latency=0.0, embed_latency_per_item=0.0,
+                 first_token_latency=0.0, token_latency=0.0, response_tokens=64):
+        self.dimension = dimension
+        self.embed_latency = embed_latency
+        self.embed_latency_per_item = embed_latency_per_item
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.response_tokens = response_tokens
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # ไม่ให้ delayed ACK เพิ่ม latency ~40ms ต่อ request
+
+            def log_message(self, format, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def _read_json(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def _send_json(self, payload, status=200):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json(server.tags())
+                elif self.path == "/api/ps":
+                    self._send_json(server.ps())
+                elif self.path == "/":
+                    self._send_json({"status": "Ollama is running"})
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self):
+                request = self._read_json()
+                if self.path == "/api/embed":
+                    self._send_json(server.embed(request))
+                elif self.path == "/api/embeddings":
+                    result = server.embed({"model": request.get("model"), "input": request.get("prompt", "")})
+                    self._send_json({"embedding": result["embeddings"][0]})
+                elif self.path == "/api/generate":
+                    self._generate(request)
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def _generate(self, request):
+                if not request.get("prompt"):
+                    self._send_json(server.load(request))
+                    return
+                if not request.get("stream", True):
+                    self._send_json(server.generate_complete(request))
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for message in server.generate_stream(request):
+                    line = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+                    self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """รันใน thread ปัจจุบัน (ใช้ตอนรันเป็นโปรแกรมแยก)"""
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_stats(self):
+        with self._lock:
+            self.embed_calls = 0
+            self.embed_inputs = 0
+            self.generate_calls = 0
+            self.load_calls = 0
+            self.connections = 0
+            self.prompt_chars = 0
+            self.models_seen = set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'embed_calls': self.embed_calls,
+                'embed_inputs': self.embed_inputs,
+                'generate_calls': self.generate_calls,
+                'load_calls': self.load_calls,
+                'connections': self.connections,
+                'prompt_chars': self.prompt_chars
+            }
+
+    def embed(self, request):
+        inputs = request.get("input", "")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        with self._lock:
+            self.embed_calls += 1
+            self.embed_inputs += len(inputs)
+            self.models_seen.add(request.get("model"))
+
+        delay = self.embed_latency + self.embed_latency_per_item * len(inputs)
+        if delay:
+            time.sleep(delay)
+        return {
+            "model": request.get("model"),
+            "embeddings": [fake_embedding(text, self.dimension) for text in inputs],
+            "total_duration": int(delay * 1e9),
+            "prompt_eval_count": sum(len(text) for text in inputs)
+        }
+
+    def _answer_tokens(self, prompt):
+        """คำตอบ deterministic: ตัดคำจากท้าย prompt ซ้ำจนครบจำนวน token"""
+        words = prompt.split()[-32:] or ["ok"]
+        return [words[i % len(words)] + " " for i in range(self.response_tokens)]
+
+    def _final_message(self, request, tokens, started):
+        return {
+            "model": request.get("model"),
+            "created_at": _now(),
+            "response": "",
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int((time.perf_counter() - started) * 1e9),
+            "prompt_eval_count": len(request.get("prompt", "")) // 3,
+            "eval_count": len(tokens)
+        }
+
+    def load(self, request):
+        """เหมือน Ollama: generate ที่ไม่มี prompt แค่โหลด model เข้า memory"""
+        with self._lock:
+            self.load_calls += 1
+            self.models_seen.add(request.get("model"))
+        return {"model": request.get("model"), "created_at": _now(), "response": "",
+                "done": True, "done_reason": "load"}
+
+    def generate_stream(self, request):
+        started = time.perf_counter()
+        prompt = request.get("prompt", "")
+        with self._lock:
+            self.generate_calls += 1
+            self.prompt_chars += len(prompt)
+            self.models_seen.add(request.get("model"))
+
+        tokens = self._answer_tokens(prompt)
+        if self.first_token_latency:
+            time.sleep(self.first_token_latency)
+        for i, token in enumerate(tokens):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            yield {"model": request.get("model"), "created_at": _now(), "response": token, "done": False}
+        yield self._final_message(request, tokens, started)
+
+    def generate_complete(self, request):
+        started = time.perf_counter()
+        tokens = [message["response"] for message in self.generate_stream(request)]
+        return dict(self._final_message(request, tokens, started), response="".join(tokens))
+
+    def _model_entries(self):
+        with self._lock:
+            models = sorted(model for model in self.models_seen if model)
+        return [
+            {
+                "name": model,
+                "model": model,
+                "modified_at": _now(),
+                "size": 0,
+                "digest": hashlib.sha256(model.encode()).hexdigest(),
+                "details": {"format": "gguf", "family": "fake", "parameter_size": "0B", "quantization_level": "F32"}
+            }
+            for model in models
+        ]
+
+    def tags(self):
+        return {"models": self._model_entries()}
+
+    def ps(self):
+        return {
+            "models": [
+                dict(entry, expires_at=_now(), size_vram=0)
+                for entry in self._model_entries()
+            ]
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Ollama server สำหรับ benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--dimension", type=int, default=DEFAULT_DIMENSION)
+    parser.add_argument("--embed-latency", type=float, default=0.0)
+    parser.add_argument("--embed-latency-per-item", type=float, default=0.0)
+    parser.add_argument("--first-token-latency", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--response-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    fake = FakeOllamaServer(
+        host=args.host,
+        port=args.port,
+        dimension=args.dimension,
+        embed_latency=args.embed_latency,
+        embed_latency_per_item=args.embed_latency_per_item,
+        first_token_latency=args.first_token_latency,
+        token_latency=args.token_latency,
+        response_tokens=args.response_tokens
+    )
+    print(f"🦙 Fake Ollama: {fake.url}")
+    try:
+        fake.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
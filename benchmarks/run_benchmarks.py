@@ -0,0 +1,249 @@
+"""
+Benchmark Suite
+วัดความเร็วของ ingestion (process_pdf), retrieval และ QA (get_answer) กับ Fake Ollama
+ไม่ต้องใช้ GPU หรือ Ollama จริง ผลลัพธ์เปรียบเทียบกับ baseline ที่บันทึกไว้ได้
+
+ตัวอย่าง:
+    python -m benchmarks.run_benchmarks --sizes small,medium --langs th,en --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --sizes small,medium --langs th,en --baseline benchmarks/baseline.json
+"""
+import argparse
+import io
+import json
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.fake_ollama import FakeOllamaServer, DEFAULT_DIMENSION
+from benchmarks.synthetic_pdf import SIZES, make_pdf
+from embeddings_config import DEFAULT_EMBEDDING_MODEL
+from llm_config import DEFAULT_LLM_MODEL, create_qa_chain, get_answer
+from pdf_processor import process_pdf, SPLITTERS, DEFAULT_SPLITTER
+
+
+# ทิศทางของแต่ละ metric: +1 = มากดีกว่า, -1 = น้อยดีกว่า
+METRICS = {
+    'pages_per_sec': +1,
+    'chunks_per_sec': +1,
+    'num_chunks': 0,
+    'duplicate_chunks': 0,
+    'embed_calls': -1,
+    'embed_inputs': -1,
+    'retrieval_p50_ms': -1,
+    'retrieval_p99_ms': -1,
+    'recall_at_k': +1,
+    'ttft_p50_ms': -1,
+    'qa_p50_ms': -1,
+    'qa_p99_ms': -1,
+    'prompt_chars_per_query': -1
+}
+DEFAULT_TOLERANCE = 0.10
+
+
+def _percentile_ms(values, q):
+    return float(np.percentile(values, q) * 1000) if values else None
+
+
+def run_case(server, size, lang, args):
+    """
+    benchmark เอกสาร 1 ชุด (ขนาด x ภาษา)
+
+    Returns:
+        dict ของ metrics (ดู METRICS)
+    """
+    num_pages = SIZES[size]
+    pdf_bytes, questions = make_pdf(num_pages, lang, seed=args.seed)
+    uploaded_file = io.BytesIO(pdf_bytes)
+    uploaded_file.name = f"bench-{size}-{lang}.pdf"
+
+    # ---------- ingestion ----------
+    server.reset_stats()
+    result = process_pdf(
+        uploaded_file,
+        args.embedding_model,
+        base_url=server.url,
+        use_cache=args.use_cache,
+        extraction_workers=args.extraction_workers,
+        index_type=args.index_type,
+        splitter=args.splitter
+    )
+    ingest_stats = server.stats()
+    vectorstore = result['vectorstore']
+
+    rng = random.Random(args.seed)
+
+    # ---------- retrieval ----------
+    retrieval_questions = rng.sample(questions, min(args.queries, len(questions)))
+    latencies, hits = [], 0
+    for item in retrieval_questions:
+        start = time.perf_counter()
+        docs = vectorstore.similarity_search(item['question'], k=args.k)
+        latencies.append(time.perf_counter() - start)
+        if any(doc.metadata.get('page') == item['page'] for doc in docs):
+            hits += 1
+
+    # ---------- QA (retrieval + prompt + streaming) ----------
+    qa_chain = create_qa_chain(vectorstore, args.llm_model, server.url)
+    qa_questions = rng.sample(questions, min(args.qa_queries, len(questions)))
+    server.reset_stats()
+    qa_latencies, ttfts = [], []
+    for item in qa_questions:
+        start = time.perf_counter()
+        response = get_answer(qa_chain, item['question'], adaptive=args.adaptive)
+        qa_latencies.append(time.perf_counter() - start)
+        if response['timings']['time_to_first_token'] is not None:
+            ttfts.append(response['timings']['time_to_first_token'])
+    qa_stats = server.stats()
+
+    return {
+        'num_pages': num_pages,
+        'num_chunks': result['num_chunks'],
+        'duplicate_chunks': (result['split_stats'] or {}).get('duplicate_chunks', 0),
+        'ingest_time': result['elapsed'],
+        'pages_per_sec': result['pages_per_sec'],
+        'chunks_per_sec': result['chunks_per_sec'],
+        'embed_calls': ingest_stats['embed_calls'],
+        'embed_inputs': ingest_stats['embed_inputs'],
+        'retrieval_p50_ms': _percentile_ms(latencies, 50),
+        'retrieval_p99_ms': _percentile_ms(latencies, 99),
+        'recall_at_k': hits / len(retrieval_questions) if retrieval_questions else None,
+        'ttft_p50_ms': _percentile_ms(ttfts, 50),
+        'qa_p50_ms': _percentile_ms(qa_latencies, 50),
+        'qa_p99_ms': _percentile_ms(qa_latencies, 99),
+        'prompt_chars_per_query': qa_stats['prompt_chars'] / max(qa_stats['generate_calls'], 1)
+    }
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    เปรียบเทียบผลลัพธ์กับ baseline
+
+    Returns:
+        list ของ {'case', 'metric', 'baseline', 'current', 'change', 'status'}
+        status: 'better', 'worse' (แย่ลงเกิน tolerance) หรือ 'same'
+    """
+    rows = []
+    for case, metrics in results['cases'].items():
+        base_metrics = baseline['cases'].get(case)
+        if base_metrics is None:
+            continue
+        for metric, direction in METRICS.items():
+            current, base = metrics.get(metric), base_metrics.get(metric)
+            if current is None or base is None:
+                continue
+            change = (current - base) / base if base else 0.0
+            status = 'same'
+            if direction and abs(change) > tolerance:
+                status = 'better' if change * direction > 0 else 'worse'
+            rows.append({
+                'case': case,
+                'metric': metric,
+                'baseline': base,
+                'current': current,
+                'change': change,
+                'status': status
+            })
+    return rows
+
+
+def _format_value(value):
+    if value is None:
+        return "-"
+    return f"{value:,.2f}" if isinstance(value, float) else f"{value:,}"
+
+
+def print_results(results):
+    metrics = ['num_pages', 'num_chunks'] + [metric for metric in METRICS if metric != 'num_chunks']
+    cases = list(results['cases'])
+    width = max(len(metric) for metric in metrics) + 2
+    print("metric".ljust(width) + "".join(case.rjust(16) for case in cases))
+    for metric in metrics:
+        row = "".join(_format_value(results['cases'][case].get(metric)).rjust(16) for case in cases)
+        print(metric.ljust(width) + row)
+
+
+def print_comparison(rows):
+    marks = {'better': "✅", 'worse': "❌", 'same': "  "}
+    for row in rows:
+        print(
+            f"{marks[row['status']]} {row['case']:<14} {row['metric']:<24} "
+            f"{_format_value(row['baseline']):>12} -> {_format_value(row['current']):>12} "
+            f"({row['change'] * 100:+.1f}%)"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingestion/retrieval/QA กับ Fake Ollama")
+    parser.add_argument("--sizes", default="small,medium", help=f"ขนาดเอกสาร: {', '.join(SIZES)}")
+    parser.add_argument("--langs", default="th,en", help="ภาษา: th, en")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embedding-model", default=DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument("--llm-model", default=DEFAULT_LLM_MODEL)
+    parser.add_argument("--index-type", default="auto")
+    parser.add_argument("--splitter", default=DEFAULT_SPLITTER, choices=SPLITTERS)
+    parser.add_argument("--extraction-workers", type=int, default=1)
+    parser.add_argument("--use-cache", action="store_true", help="ใช้ embedding cache (ค่าเริ่มต้นปิด เพื่อวัดการ embed จริง)")
+    parser.add_argument("--adaptive", action="store_true", help="ใช้ adaptive retrieval ตอนวัด QA")
+    parser.add_argument("--k", type=int, default=30, help="จำนวนเอกสารที่ค้นหาตอนวัด retrieval")
+    parser.add_argument("--queries", type=int, default=100, help="จำนวนคำถามที่ใช้วัด retrieval")
+    parser.add_argument("--qa-queries", type=int, default=10, help="จำนวนคำถามที่ใช้วัด QA")
+    parser.add_argument("--dimension", type=int, default=DEFAULT_DIMENSION)
+    parser.add_argument("--embed-latency", type=float, default=0.005, help="วินาทีต่อ request ของ /api/embed")
+    parser.add_argument("--embed-latency-per-item", type=float, default=0.001, help="วินาทีต่อข้อความ")
+    parser.add_argument("--first-token-latency", type=float, default=0.05, help="วินาทีก่อน token แรก")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="วินาทีต่อ token")
+    parser.add_argument("--response-tokens", type=int, default=64)
+    parser.add_argument("--output", help="บันทึกผลลัพธ์เป็น JSON")
+    parser.add_argument("--save-baseline", help="บันทึกผลลัพธ์เป็น baseline")
+    parser.add_argument("--baseline", help="เปรียบเทียบกับ baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="สัดส่วนที่ถือว่าแย่ลง (0.10 = 10%%)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit code 1 ถ้ามี metric แย่ลง")
+    args = parser.parse_args(argv)
+
+    results = {
+        'created_at': time.time(),
+        'python': platform.python_version(),
+        'config': {
+            key: value for key, value in vars(args).items()
+            if key not in ('output', 'save_baseline', 'baseline', 'fail_on_regression')
+        },
+        'cases': {}
+    }
+
+    with FakeOllamaServer(
+        dimension=args.dimension,
+        embed_latency=args.embed_latency,
+        embed_latency_per_item=args.embed_latency_per_item,
+        first_token_latency=args.first_token_latency,
+        token_latency=args.token_latency,
+        response_tokens=args.response_tokens
+    ) as server:
+        for size in args.sizes.split(","):
+            for lang in args.langs.split(","):
+                case = f"{size}-{lang}"
+                print(f"⏳ {case} ({SIZES[size]} หน้า)...", file=sys.stderr)
+                results['cases'][case] = run_case(server, size, lang, args)
+
+    print_results(results)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, args.tolerance)
+        print()
+        print_comparison(rows)
+        if args.fail_on_regression and any(row['status'] == 'worse' for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
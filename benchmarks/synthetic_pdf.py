@@ -0,0 +1,201 @@
+"""
+Synthetic PDF Generator
+สร้าง PDF สังเคราะห์ (ภาษาไทย/อังกฤษ) หลายขนาด พร้อมคำถามที่รู้คำตอบและหน้าที่มีคำตอบ
+
+ข้อความภาษาไทยใช้ font แบบ Type0 (Identity-H) ที่มี ToUnicode CMap
+pypdf จึง extract ข้อความไทยกลับมาได้ถูกต้องโดยไม่ต้องฝัง font จริง
+"""
+import random
+
+
+CHARS_PER_LINE = 90
+FACTS_PER_PAGE = 3
+
+SIZES = {
+    'small': 5,
+    'medium': 50,
+    'large': 300
+}
+
+_THAI_WORDS = [
+    "การศึกษา", "หลักสูตร", "นักศึกษา", "มหาวิทยาลัย", "การเรียนรู้", "ภาคปฏิบัติ", "ทฤษฎี",
+    "ระบบ", "ข้อมูล", "การวิเคราะห์", "การออกแบบ", "เทคโนโลยี", "คอมพิวเตอร์", "เครือข่าย",
+    "ความปลอดภัย", "การพัฒนา", "ซอฟต์แวร์", "โครงงาน", "การประเมินผล", "กิจกรรม", "ชั้นเรียน",
+    "อาจารย์", "เนื้อหา", "พื้นฐาน", "ขั้นสูง", "การจัดการ", "ฐานข้อมูล", "ปัญญาประดิษฐ์",
+    "และ", "ของ", "ใน", "เพื่อ", "โดย", "ที่", "กับ", "สำหรับ", "ซึ่ง", "ได้", "มี", "เป็น"
+]
+_THAI_SUBJECTS = [
+    "การเขียนโปรแกรมเบื้องต้น", "โครงสร้างข้อมูล", "ระบบปฏิบัติการ", "เครือข่ายคอมพิวเตอร์",
+    "วิศวกรรมซอฟต์แวร์", "ระบบฐานข้อมูล", "ปัญญาประดิษฐ์", "การเรียนรู้ของเครื่อง",
+    "ความมั่นคงปลอดภัยไซเบอร์", "คณิตศาสตร์ดิสครีต", "สถิติสำหรับวิศวกร", "การประมวลผลภาษาธรรมชาติ"
+]
+
+_EN_WORDS = [
+    "education", "curriculum", "student", "university", "learning", "practice", "theory",
+    "system", "data", "analysis", "design", "technology", "computer", "network",
+    "security", "development", "software", "project", "assessment", "activity", "classroom",
+    "lecturer", "content", "fundamental", "advanced", "management", "database", "intelligence",
+    "and", "of", "in", "for", "by", "the", "with", "which", "can", "has", "is", "to"
+]
+_EN_SUBJECTS = [
+    "Introduction to Programming", "Data Structures", "Operating Systems", "Computer Networks",
+    "Software Engineering", "Database Systems", "Artificial Intelligence", "Machine Learning",
+    "Cyber Security", "Discrete Mathematics", "Engineering Statistics", "Natural Language Processing"
+]
+
+
+def _sentence(rng, words, lang):
+    count = rng.randint(8, 16)
+    separator = "" if lang == 'th' else " "
+    text = separator.join(rng.choice(words) for _ in range(count))
+    return text + (" " if lang == 'th' else ". ")
+
+
+def _fact(rng, code, lang):
+    year, term, credits = rng.randint(1, 4), rng.randint(1, 2), rng.randint(1, 4)
+    if lang == 'th':
+        subject = rng.choice(_THAI_SUBJECTS)
+        text = f"รายวิชา {code} {subject} มี {credits} หน่วยกิต เรียนในชั้นปีที่ {year} ภาคเรียนที่ {term} "
+        question = f"รายวิชา {code} มีกี่หน่วยกิต"
+    else:
+        subject = rng.choice(_EN_SUBJECTS)
+        text = f"Course {code} {subject} has {credits} credits and is taught in year {year} term {term}. "
+        question = f"How many credits does course {code} have?"
+    return text, question, str(credits)
+
+
+def _wrap(text, width=CHARS_PER_LINE):
+    lines, line = [], ""
+    for word in text.split(" "):
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def generate_document(num_pages, lang='th', seed=0):
+    """
+    สร้างข้อความของเอกสารสังเคราะห์
+
+    Returns:
+        (pages, questions)
+        pages: list ของข้อความแต่ละหน้า (list ของบรรทัด)
+        questions: list ของ {'question', 'answer', 'page'}
+    """
+    rng = random.Random(seed)
+    words = _THAI_WORDS if lang == 'th' else _EN_WORDS
+    pages, questions = [], []
+
+    for page in range(num_pages):
+        text = ""
+        fact_slots = set(rng.sample(range(10), FACTS_PER_PAGE))
+        for slot in range(10):
+            text += "".join(_sentence(rng, words, lang) for _ in range(2))
+            if slot in fact_slots:
+                code = f"{rng.randint(100, 999)}{page:03d}{slot}"
+                fact_text, question, answer = _fact(rng, code, lang)
+                text += fact_text
+                questions.append({'question': question, 'answer': answer, 'page': page})
+        pages.append(_wrap(text))
+
+    return pages, questions
+
+
+def _escape_latin(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _to_unicode_cmap(code_points):
+    """ToUnicode CMap ที่ map CID (= Unicode code point) กลับเป็น Unicode"""
+    blocks = sorted({cp >> 8 for cp in code_points})
+    ranges = "\n".join(f"<{b:02X}00> <{b:02X}FF> <{b:02X}00>" for b in blocks)
+    return (
+        "/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n"
+        "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n"
+        "/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n"
+        "1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n"
+        f"{len(blocks)} beginbfrange\n{ranges}\nendbfrange\n"
+        "endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend"
+    )
+
+
+def build_pdf(pages, lang='th'):
+    """
+    เขียน PDF จากข้อความแต่ละหน้า
+
+    lang='th' ใช้ Type0 font (ข้อความเป็น CID 2 ไบต์ = Unicode code point)
+    lang='en' ใช้ Helvetica
+    """
+    objects = []
+
+    def add(obj):
+        objects.append(obj)
+        return len(objects)
+
+    catalog = add(None)
+    pages_obj = add(None)
+
+    if lang == 'th':
+        code_points = {ord(ch) for page in pages for line in page for ch in line}
+        cmap = _to_unicode_cmap(code_points).encode("latin-1")
+        to_unicode = add(b"<< /Length %d >>\nstream\n" % len(cmap) + cmap + b"\nendstream")
+        descriptor = add(
+            b"<< /Type /FontDescriptor /FontName /Synthetic /Flags 32 /FontBBox [0 -200 1000 900] "
+            b"/ItalicAngle 0 /Ascent 900 /Descent -200 /CapHeight 700 /StemV 80 >>"
+        )
+        cid_font = add(
+            b"<< /Type /Font /Subtype /CIDFontType2 /BaseFont /Synthetic "
+            b"/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+            b"/FontDescriptor %d 0 R /DW 500 /CIDToGIDMap /Identity >>" % descriptor
+        )
+        font = add(
+            b"<< /Type /Font /Subtype /Type0 /BaseFont /Synthetic /Encoding /Identity-H "
+            b"/DescendantFonts [%d 0 R] /ToUnicode %d 0 R >>" % (cid_font, to_unicode)
+        )
+    else:
+        font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    page_ids = []
+    for lines in pages:
+        if lang == 'th':
+            shown = " ".join(
+                "<" + "".join(f"{ord(ch):04X}" for ch in line) + "> Tj T*" for line in lines
+            )
+        else:
+            shown = " ".join(f"({_escape_latin(line)}) Tj T*" for line in lines)
+        content = f"BT /F1 10 Tf 40 800 Td 16 TL {shown} ET".encode("latin-1")
+        stream = add(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_obj, font, stream)
+        ))
+
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_obj
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[pages_obj - 1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return bytes(out)
+
+
+def make_pdf(num_pages, lang='th', seed=0):
+    """
+    สร้าง PDF สังเคราะห์
+
+    Returns:
+        (pdf_bytes, questions)
+    """
+    pages, questions = generate_document(num_pages, lang, seed)
+    return build_pdf(pages, lang), questions
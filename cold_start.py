@@ -0,0 +1,155 @@
+"""
+Cold Start
+import dependency ที่หนัก (langchain, FAISS, pypdf, ollama) ใน background thread หลังหน้าเว็บแสดงผลครั้งแรก
+และรายงานเวลา import ของแต่ละ module
+
+    python cold_start.py              # รายงานเวลา import (วัดใน process ใหม่ทุกครั้ง)
+    python cold_start.py --top 20     # แสดง package ที่ใช้เวลามากที่สุด 20 อันดับ
+    python cold_start.py faiss pypdf  # วัดเฉพาะ module ที่ระบุ
+
+BORNZI_STARTUP_MODE:
+    background (ค่าเริ่มต้น)  แสดงหน้าเว็บก่อน แล้วจึง import dependency ที่หนักใน background thread
+    eager                     import ทั้งหมดก่อนแสดงหน้าเว็บ (แบบเดิม)
+    lazy                      import เมื่อใช้งานจริงเท่านั้น (Process PDF, โหลด index, ถามคำถาม)
+"""
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import time
+
+
+STARTUP_MODES = ("background", "eager", "lazy")
+STARTUP_MODE = os.environ.get("BORNZI_STARTUP_MODE", "background")
+
+# module ที่ streamlit_app ใช้ก่อนแสดงหน้าเว็บครั้งแรก - ต้องไม่ import dependency ที่หนักตอนโหลด
+FIRST_PAINT_MODULES = (
+    "embeddings_config", "pdf_processor", "llm_config", "answer_cache", "artifact_cache",
+    "ingest_jobs", "resource_registry", "corpus_index", "tracing", "ollama_client", "conversation"
+)
+
+# dependency ที่หนักซึ่งถูก import ตอนใช้งานจริง เรียงตามลำดับที่ผู้ใช้มักต้องใช้
+PRELOAD_MODULES = (
+    "vector_store_format",                       # โหลด Vector Store (faiss, langchain_core)
+    "langchain_community.vectorstores.faiss",
+    "langchain_ollama",                          # embedding / LLM
+    "langchain.chains",                          # QA chain
+    "langchain.prompts",
+    "embedding_cache",                           # Process PDF
+    "parallel_embeddings",
+    "thai_splitter",
+    "langchain.text_splitter",
+    "pypdf",
+    "ollama",
+)
+
+_preload_state = {'status': "idle", 'seconds': None, 'modules': {}, 'errors': {}}
+_preload_thread = None
+_preload_lock = threading.Lock()
+
+
+def preload(modules=PRELOAD_MODULES):
+    """
+    import modules ใน thread ปัจจุบัน (module ที่ import แล้วจะไม่เสียเวลาซ้ำ)
+
+    Returns:
+        dict ของเวลา import (วินาที) ต่อ module
+    """
+    _preload_state['status'] = "running"
+    started = time.perf_counter()
+    for name in modules:
+        module_started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            # dependency ที่ไม่ได้ติดตั้งจะ error ตอนใช้งานจริงแทน ไม่ควรทำให้หน้าเว็บพัง
+            _preload_state['errors'][name] = str(e)
+        _preload_state['modules'][name] = time.perf_counter() - module_started
+    _preload_state['seconds'] = time.perf_counter() - started
+    _preload_state['status'] = "done"
+    return dict(_preload_state['modules'])
+
+
+def start_preload(modules=PRELOAD_MODULES):
+    """เริ่ม preload ใน daemon thread (ครั้งเดียวต่อ process เรียกซ้ำได้ทุก rerun)"""
+    global _preload_thread
+    with _preload_lock:
+        if _preload_thread is None:
+            _preload_thread = threading.Thread(target=preload, args=(modules,), daemon=True, name="preload")
+            _preload_thread.start()
+        return _preload_thread
+
+
+def preload_status():
+    """สถานะของ preload: status ('idle', 'running', 'done'), seconds, modules, errors"""
+    return {
+        'status': _preload_state['status'],
+        'seconds': _preload_state['seconds'],
+        'modules': dict(_preload_state['modules']),
+        'errors': dict(_preload_state['errors'])
+    }
+
+
+# ---------- import-time profiling ----------
+
+def profile_imports(modules, python=sys.executable):
+    """
+    วัดเวลา import ของ modules ใน process ใหม่ (python -X importtime)
+
+    Returns:
+        dict: total_ms (เวลารวมของ modules ทั้งหมด),
+              packages [(package ระดับบนสุด, เวลาของ package นั้นเอง ms)] เรียงจากมากไปน้อย
+    """
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+        capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    total_us = 0
+    packages = {}
+    for line in result.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not name[1:].startswith(" "):
+            total_us += int(cumulative_us)  # module ระดับบนสุด (ไม่ได้ถูก import โดย module อื่น)
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+
+    return {
+        'total_ms': total_us / 1000,
+        'packages': sorted(((name, us / 1000) for name, us in packages.items()), key=lambda item: -item[1])
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="รายงานเวลา import ของแอพ")
+    parser.add_argument("modules", nargs="*", help="module ที่ต้องการวัด (ค่าเริ่มต้น: ทั้งหน้าแรกและ preload)")
+    parser.add_argument("--top", type=int, default=10, help="จำนวน package ที่ใช้เวลามากที่สุดที่แสดง")
+    args = parser.parse_args(argv)
+
+    groups = [("ที่ระบุ", args.modules)] if args.modules else [
+        ("หน้าเว็บครั้งแรก", FIRST_PAINT_MODULES),
+        ("preload / ตอนใช้งาน", PRELOAD_MODULES)
+    ]
+    for title, modules in groups:
+        report = profile_imports(modules)
+        print(f"\n== {title}: {report['total_ms']:.0f} ms ({len(modules)} modules)")
+        for package, ms in report['packages'][:args.top]:
+            print(f"   {package:<32} {ms:8.1f} ms")
+
+    if not args.modules:
+        # เวลาที่แต่ละ action ต้องรอถ้ายังไม่ได้ preload (แต่ละ module วัดแยกใน process ใหม่)
+        print("\n== แต่ละ module แยกกัน (process ใหม่)")
+        for module in PRELOAD_MODULES:
+            print(f"   {module:<42} {profile_imports([module])['total_ms']:8.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Context Packing
+รวม chunks ที่ซ้อนทับกัน (overlap สูง) จากหน้าเดียวกันกลับเป็นช่วงข้อความต่อเนื่อง
+ตัดข้อความซ้ำ แล้วจัดเรียงตามตำแหน่งในเอกสารก่อนใส่ลง prompt
+"""
+import math
+
+
+DEFAULT_MAX_CONTEXT_TOKENS = 16000
+CHARS_PER_TOKEN = 3  # ค่าเฉลี่ยคร่าวๆ ของข้อความไทย/อังกฤษปนกัน
+MIN_OVERLAP_PROBE = 32  # ความยาวขั้นต่ำของข้อความที่ใช้ตรวจหา overlap เมื่อไม่มี start_index
+
+
+def estimate_tokens(text):
+    """ประมาณจำนวน token จากจำนวนตัวอักษร (ไม่ต้องโหลด tokenizer)"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _span_key(doc):
+    return (doc.metadata.get('source'), doc.metadata.get('page'))
+
+
+def _merge_text(left, right):
+    """
+    ต่อข้อความ 2 ส่วนที่ท้ายของ left ซ้อนกับต้นของ right
+
+    Returns:
+        ข้อความที่ต่อแล้ว หรือ None ถ้าไม่ซ้อนกัน
+    """
+    if right in left:
+        return left
+    probe = right[:MIN_OVERLAP_PROBE]
+    if len(probe) < MIN_OVERLAP_PROBE:
+        return None
+    position = left.find(probe)
+    while position != -1:
+        if right.startswith(left[position:]):
+            return left + right[len(left) - position:]
+        position = left.find(probe, position + 1)
+    return None
+
+
+def _merge_group(chunks):
+    """
+    รวม chunks ของหน้าเดียวกันเป็นช่วงข้อความต่อเนื่อง
+
+    chunks: list ของ (rank, Document) - rank คือลำดับความเกี่ยวข้องจาก retriever
+    """
+    spans = []  # [text, start, end, best_rank, chunk_count]
+
+    indexed = [item for item in chunks if item[1].metadata.get('start_index') is not None]
+    if len(indexed) == len(chunks):
+        # มีตำแหน่งเริ่มของทุก chunk - รวมแบบ interval merge
+        for rank, doc in sorted(chunks, key=lambda item: item[1].metadata['start_index']):
+            start = doc.metadata['start_index']
+            end = start + len(doc.page_content)
+            if spans and start <= spans[-1][2]:
+                span = spans[-1]
+                if end > span[2]:
+                    span[0] += doc.page_content[span[2] - start:]
+                    span[2] = end
+                span[3] = min(span[3], rank)
+                span[4] += 1
+            else:
+                spans.append([doc.page_content, start, end, rank, 1])
+        return spans
+
+    # index เก่าที่ไม่มี start_index - หา overlap จากเนื้อหาโดยตรง
+    # (ไม่รู้ตำแหน่งในหน้า จึงใช้ลำดับความเกี่ยวข้องแทนตำแหน่งเริ่ม)
+    for rank, doc in chunks:
+        text = doc.page_content
+        for span in spans:
+            merged = _merge_text(span[0], text) or _merge_text(text, span[0])
+            if merged is not None:
+                span[0] = merged
+                span[3] = min(span[3], rank)
+                span[4] += 1
+                break
+        else:
+            spans.append([text, rank, rank, rank, 1])
+    return spans
+
+
+def pack_context(documents, max_tokens=DEFAULT_MAX_CONTEXT_TOKENS):
+    """
+    รวม ตัดซ้ำ และจัดเรียง context ให้อยู่ภายใน token budget
+
+    Args:
+        documents: เอกสารจาก retriever เรียงตามความเกี่ยวข้อง
+        max_tokens: จำนวน token สูงสุดของ context ทั้งหมด
+
+    Returns:
+        (packed_documents, stats)
+        packed_documents เรียงตามตำแหน่งในเอกสาร (แหล่ง, หน้า, ตำแหน่งในหน้า)
+        stats: {'original_tokens', 'packed_tokens', 'saved_tokens',
+                'num_chunks', 'num_spans', 'dropped_spans'}
+    """
+    from langchain_core.documents import Document
+
+    groups = {}
+    seen = set()
+    for rank, doc in enumerate(documents):
+        # ตัดข้อความที่ซ้ำกันทุกตัวอักษร
+        key = (_span_key(doc), doc.page_content)
+        if key in seen:
+            continue
+        seen.add(key)
+        groups.setdefault(_span_key(doc), []).append((rank, doc))
+
+    spans = []
+    for (source, page), chunks in groups.items():
+        for text, start, _, best_rank, chunk_count in _merge_group(chunks):
+            spans.append({
+                'text': text,
+                'source': source,
+                'page': page,
+                'start': start,
+                'rank': best_rank,
+                'chunk_count': chunk_count,
+                'tokens': estimate_tokens(text)
+            })
+
+    # เลือกช่วงที่เกี่ยวข้องที่สุดก่อนจนเต็ม budget
+    selected = []
+    used_tokens = 0
+    for span in sorted(spans, key=lambda span: span['rank']):
+        if used_tokens + span['tokens'] > max_tokens:
+            continue
+        selected.append(span)
+        used_tokens += span['tokens']
+
+    # จัดเรียงตามตำแหน่งในเอกสาร
+    selected.sort(key=lambda span: (str(span['source']), span['page'] if span['page'] is not None else -1, span['start']))
+
+    packed = [
+        Document(
+            page_content=span['text'],
+            metadata={
+                'source': span['source'],
+                'page': span['page'],
+                'merged_chunks': span['chunk_count']
+            }
+        )
+        for span in selected
+    ]
+
+    original_tokens = sum(estimate_tokens(doc.page_content) for doc in documents)
+    return packed, {
+        'original_tokens': original_tokens,
+        'packed_tokens': used_tokens,
+        'saved_tokens': original_tokens - used_tokens,
+        'num_chunks': len(documents),
+        'num_spans': len(selected),
+        'dropped_spans': len(spans) - len(selected)
+    }
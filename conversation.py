@@ -0,0 +1,191 @@
+"""
+Conversation Mode
+ถามต่อเนื่องหลายรอบโดยให้ prompt ของทุกรอบขึ้นต้นด้วยข้อความเดิม (stable prefix)
+Ollama จึงใช้ KV cache ของรอบก่อนซ้ำ และ prefill เฉพาะ context ใหม่กับคำถามใหม่
+"""
+import os
+
+import numpy as np
+
+from context_packing import estimate_tokens, DEFAULT_MAX_CONTEXT_TOKENS
+from llm_config import (
+    QA_INSTRUCTIONS, MIN_NUM_PREDICT, StreamingAnswer, model_context_limit, size_llm_options
+)
+
+
+# คำถามที่ cosine similarity กับคำถามที่ค้นหาครั้งล่าสุดถึงค่านี้ ถือเป็นคำถามต่อเนื่อง (ใช้ผลค้นหาเดิม)
+DEFAULT_FOLLOWUP_SIMILARITY = float(os.environ.get("BORNZI_FOLLOWUP_SIMILARITY", 0.75))
+# เริ่มบทสนทนาใหม่เมื่อ transcript ยาวเกินสัดส่วนนี้ของ num_ctx (เหลือที่ให้ context ใหม่และคำตอบ)
+TRANSCRIPT_RESET_RATIO = 0.6
+# context ใหม่ต่อรอบไม่เกินสัดส่วนนี้ของ num_ctx เพื่อให้หลายรอบอยู่ใน prefix เดียวกันได้
+TURN_CONTEXT_RATIO = 0.25
+
+CONVERSATION_NOTE = "\n- เอกสารอ้างอิงของแต่ละคำถามสะสมต่อกันในบทสนทนา ใช้ได้ทุกส่วนที่ให้มาแล้ว"
+
+
+def _chunk_key(doc):
+    return (doc.metadata.get('source'), doc.metadata.get('page'), doc.page_content)
+
+
+def _normalize(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class Conversation:
+    """
+    บทสนทนาหลายรอบบน QA chain เดียว
+
+    prompt ของแต่ละรอบ = transcript ของรอบก่อน (คำสั่ง + context + คำถาม + คำตอบ ทุกรอบ)
+    ต่อท้ายด้วย chunks ที่ยังไม่เคยอยู่ในบทสนทนาและคำถามใหม่
+    ข้อความเดิมไม่ถูกแก้หรือเรียงใหม่ prompt ของรอบก่อนจึงเป็น prefix ของ prompt รอบนี้ทุกตัวอักษร
+
+    OllamaLLM ส่ง prompt ผ่าน chat template ของ model (ไม่ใช่ raw mode)
+    KV cache จึงตรงกันถึงแค่ท้าย prompt ของรอบก่อน คำตอบของรอบก่อนต้อง prefill ใหม่
+
+    num_ctx คงที่ตลอดบทสนทนา (context window ของ model) เพราะถ้า num_ctx เปลี่ยน
+    Ollama จะโหลด model ใหม่และ cache หายทั้งหมด
+
+    คำถามที่ความหมายใกล้กับคำถามที่ใช้ค้นหาครั้งล่าสุด (is_followup) ใช้ผลค้นหาเดิม
+    ไม่ต้องค้นหาใหม่และไม่มี context ใหม่ต่อท้าย
+    """
+
+    def __init__(self, qa_chain, followup_similarity=DEFAULT_FOLLOWUP_SIMILARITY):
+        self.qa_chain = qa_chain
+        self.followup_similarity = followup_similarity
+        llm = qa_chain.combine_documents_chain.llm_chain.llm
+        self.num_ctx = model_context_limit(llm.model)
+        self.cached_text = ""  # prompt ของรอบล่าสุด (ส่วนที่ใช้ KV cache ซ้ำได้)
+        self.stats = {
+            'turns': 0,
+            'followups': 0,
+            'resets': 0,
+            'prompt_tokens': 0,
+            'prefill_tokens_saved': 0
+        }
+        self.reset()
+
+    def reset(self):
+        """เริ่มบทสนทนาใหม่ (ล้าง transcript และผลค้นหา)"""
+        self.transcript = QA_INSTRUCTIONS + CONVERSATION_NOTE
+        self.chunk_keys = set()
+        self.last_sources = []
+        self.anchor_embedding = None
+
+    def is_followup(self, query_embedding):
+        """คำถามนี้ใกล้กับคำถามที่ค้นหาครั้งล่าสุดพอจะใช้ผลค้นหาเดิมหรือไม่"""
+        if self.anchor_embedding is None or query_embedding is None:
+            return False
+        similarity = float(np.dot(self.anchor_embedding, _normalize(query_embedding)))
+        return similarity >= self.followup_similarity
+
+    def build_prompt(self, documents, question):
+        """transcript + context ใหม่ (ถ้ามี) + คำถามใหม่"""
+        from langchain_core.prompts import format_document
+
+        parts = [self.transcript]
+        if documents:
+            combine_chain = self.qa_chain.combine_documents_chain
+            context = combine_chain.document_separator.join(
+                format_document(doc, combine_chain.document_prompt) for doc in documents
+            )
+            parts.append(f"\n\n📚 เอกสารอ้างอิง:\n{context}")
+        parts.append(f"\n\n❓ คำถาม: {question}\n\n💬 คำตอบ:")
+        return "".join(parts)
+
+    def ask(self, question, query_embedding=None, adaptive=False, trace=None):
+        """
+        เริ่มรอบใหม่ของบทสนทนา (วนลูปเพื่อรับ token เหมือน stream_answer)
+
+        Returns:
+            ConversationTurn
+        """
+        if estimate_tokens(self.transcript) > self.num_ctx * TRANSCRIPT_RESET_RATIO:
+            self.reset()
+            self.stats['resets'] += 1
+        return ConversationTurn(self, question, query_embedding, adaptive=adaptive, trace=trace)
+
+    def commit(self, turn):
+        """
+        บันทึกรอบที่ตอบเสร็จแล้ว: prompt + คำตอบกลายเป็น prefix ของรอบถัดไป
+
+        Returns:
+            dict: prompt_tokens, cached_tokens (prefix ที่ตรงกับ prompt ของรอบก่อน), new_tokens
+        """
+        prompt_tokens = estimate_tokens(turn.prompt)
+        cached_tokens = estimate_tokens(os.path.commonprefix([self.cached_text, turn.prompt]))
+
+        self.transcript = turn.prompt + turn.result
+        # chat template ปิด turn ของผู้ใช้หลัง prompt คำตอบจึงไม่อยู่ใน prefix ที่ cache ไว้
+        self.cached_text = turn.prompt
+
+        # chunk ที่ pack_context ตัดทิ้งเพราะเกินงบ ยังไม่อยู่ในบทสนทนา
+        for doc in turn._pack_candidates():
+            if any(doc.page_content in packed.page_content for packed in turn.context_documents):
+                self.chunk_keys.add(_chunk_key(doc))
+        if turn.reused_retrieval:
+            self.stats['followups'] += 1
+        else:
+            self.last_sources = turn.source_documents
+            self.anchor_embedding = (
+                _normalize(turn.query_embedding) if turn.query_embedding is not None else None
+            )
+
+        self.stats['turns'] += 1
+        self.stats['prompt_tokens'] += prompt_tokens
+        self.stats['prefill_tokens_saved'] += cached_tokens
+        return {
+            'prompt_tokens': prompt_tokens,
+            'cached_tokens': cached_tokens,
+            'new_tokens': prompt_tokens - cached_tokens
+        }
+
+
+class ConversationTurn(StreamingAnswer):
+    """
+    หนึ่งรอบของ Conversation
+
+    ใช้ขั้นตอนเดียวกับ StreamingAnswer แต่ prompt ต่อท้ายจาก transcript
+    ใส่เฉพาะ chunks ที่ยังไม่อยู่ในบทสนทนา และใช้ num_ctx คงที่ของบทสนทนา
+    """
+
+    def __init__(self, conversation, question, query_embedding=None, adaptive=False, trace=None):
+        self.conversation = conversation
+        self.reused_retrieval = conversation.is_followup(query_embedding)
+        # เหลือที่ให้ transcript, คำถาม และคำตอบขั้นต่ำภายใน num_ctx ของบทสนทนา
+        overhead = estimate_tokens(conversation.build_prompt([], question))
+        max_context_tokens = max(0, min(
+            DEFAULT_MAX_CONTEXT_TOKENS,
+            int(conversation.num_ctx * TURN_CONTEXT_RATIO),
+            conversation.num_ctx - overhead - MIN_NUM_PREDICT
+        ))
+        super().__init__(
+            conversation.qa_chain, question, query_embedding,
+            max_context_tokens=max_context_tokens, adaptive=adaptive, trace=trace,
+            source_documents=conversation.last_sources if self.reused_retrieval else None
+        )
+        self.prefill = None
+
+    def _pack_candidates(self):
+        return [doc for doc in self.source_documents if _chunk_key(doc) not in self.conversation.chunk_keys]
+
+    def _build_prompt(self, documents):
+        return self.conversation.build_prompt(documents, self.question)
+
+    def _llm_options(self, llm, prompt_tokens):
+        options = size_llm_options(llm, prompt_tokens)
+        options['num_ctx'] = self.conversation.num_ctx
+        return options
+
+    def __iter__(self):
+        yield from super().__iter__()
+        self.prefill = self.conversation.commit(self)
+        self.trace.count("prefill_tokens_saved", self.prefill['cached_tokens'])
+        self.trace.count("followup_reuse", int(self.reused_retrieval))
+
+    def as_response(self):
+        response = super().as_response()
+        response['prefill'] = self.prefill
+        response['reused_retrieval'] = self.reused_retrieval
+        return response
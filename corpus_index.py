@@ -0,0 +1,195 @@
+"""
+Multi-document Corpus Index
+รวมหลายเอกสารไว้ใน FAISS index เดียว เพิ่ม/ลบเอกสารได้โดยไม่ต้องสร้าง index ของเอกสารอื่นใหม่
+และจำกัดการค้นหาเฉพาะบางเอกสารด้วย metadata filter
+"""
+import json
+import os
+import re
+import threading
+import time
+
+from pdf_processor import get_index_vectors, load_vectorstore, save_vectorstore
+
+
+CORPUS_DIR = os.path.join("vectorstore_cache", "corpus")
+MANIFEST_NAME = "manifest.json"
+
+
+def _safe_name(model_name):
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
+
+
+class CorpusIndex:
+    """
+    Corpus ของหลายเอกสาร (1 corpus ต่อ 1 embedding model เพราะขนาด vector ต้องเท่ากัน)
+
+    manifest.json เก็บข้อมูลของแต่ละเอกสารและ chunk IDs ของเอกสารนั้น
+    ทำให้ลบเอกสารออกได้ทันทีโดยไม่แตะ chunks ของเอกสารอื่น
+    corpus ใช้ flat index เสมอ เพราะ index ชนิดนี้รองรับการลบ vector
+    """
+
+    def __init__(self, embedding_model, base_url="http://localhost:11434", directory=CORPUS_DIR):
+        self.embedding_model = embedding_model
+        self.base_url = base_url
+        self.directory = os.path.join(directory, _safe_name(embedding_model))
+        self.manifest_path = os.path.join(self.directory, MANIFEST_NAME)
+        self.manifest = {'embedding_model': embedding_model, 'version': 0, 'documents': {}}
+        self._vectorstore = None
+        self._vectorstore_loaded = False
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, encoding="utf-8") as f:
+            self.manifest = json.load(f)
+
+    @property
+    def vectorstore(self):
+        """FAISS index ของ corpus (โหลดจากดิสก์ครั้งแรกที่ใช้ ไม่ใช่ตอนเปิดหน้าเว็บ)"""
+        with self._lock:
+            if not self._vectorstore_loaded:
+                if self.manifest['documents']:
+                    self._vectorstore = load_vectorstore(
+                        self.directory, self.embedding_model, self.base_url, mmap_index=False
+                    )
+                self._vectorstore_loaded = True
+            return self._vectorstore
+
+    @vectorstore.setter
+    def vectorstore(self, vectorstore):
+        with self._lock:
+            self._vectorstore = vectorstore
+            self._vectorstore_loaded = True
+
+    def save(self):
+        """บันทึก index และ manifest (เขียนไฟล์ใหม่ก่อนแล้วจึงแทนที่ เพื่อไม่ให้ manifest เสียกลางทาง)"""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            if self.vectorstore is not None:
+                save_vectorstore(self.vectorstore, self.directory)
+            tmp_path = self.manifest_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+
+    @property
+    def version(self):
+        """เพิ่มขึ้นทุกครั้งที่เพิ่ม/ลบเอกสาร ใช้เป็นส่วนหนึ่งของ fingerprint ของ cache"""
+        return self.manifest['version']
+
+    def fingerprint(self, doc_ids=None):
+        """fingerprint ของ corpus ตามขอบเขตเอกสารที่ค้นหา (ใช้กับ answer cache และ registry)"""
+        scope = ",".join(sorted(doc_ids)) if doc_ids else "*"
+        return f"corpus:{self.embedding_model}:{self.version}:{scope}"
+
+    def documents(self):
+        """รายการเอกสารใน corpus: {doc_id: {'name', 'num_chunks', 'chunk_ids', 'added_at', ...}}"""
+        return self.manifest['documents']
+
+    def __contains__(self, doc_id):
+        return doc_id in self.manifest['documents']
+
+    def add_document(self, doc_id, name, vectorstore, num_pages=None):
+        """
+        เพิ่มเอกสารเข้า corpus โดยใช้ vectors จาก vectorstore ของเอกสาร (ไม่ต้อง embed ใหม่)
+
+        ถ้ามีเอกสาร doc_id อยู่แล้ว จะแทนที่ chunks เดิมทั้งหมด
+        """
+        vectors = get_index_vectors(vectorstore.index)
+        documents = [
+            vectorstore.docstore.search(vectorstore.index_to_docstore_id[i])
+            for i in range(vectorstore.index.ntotal)
+        ]
+
+        chunk_ids = [f"{doc_id}:{i}" for i in range(len(documents))]
+        metadatas = [
+            dict(doc.metadata, doc_id=doc_id, doc_name=name)
+            for doc in documents
+        ]
+        text_embeddings = [
+            (doc.page_content, vector.tolist())
+            for doc, vector in zip(documents, vectors)
+        ]
+
+        with self._lock:
+            if doc_id in self:
+                self._remove_chunks(doc_id)
+
+            if self.vectorstore is None:
+                from langchain_community.vectorstores import FAISS
+                
+                self.vectorstore = FAISS.from_embeddings(
+                    text_embeddings,
+                    vectorstore.embedding_function,
+                    metadatas=metadatas,
+                    ids=chunk_ids
+                )
+            else:
+                self.vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=chunk_ids)
+
+            self.manifest['documents'][doc_id] = {
+                'name': name,
+                'num_chunks': len(chunk_ids),
+                'num_pages': num_pages,
+                'chunk_ids': chunk_ids,
+                'added_at': time.time()
+            }
+            self.manifest['version'] += 1
+            self.save()
+
+    def _remove_chunks(self, doc_id):
+        chunk_ids = self.manifest['documents'][doc_id]['chunk_ids']
+        if chunk_ids:
+            self.vectorstore.delete(chunk_ids)
+        del self.manifest['documents'][doc_id]
+
+    def remove_document(self, doc_id):
+        """ลบเอกสารออกจาก corpus (ลบเฉพาะ chunks ของเอกสารนี้)"""
+        with self._lock:
+            if doc_id not in self:
+                return False
+            self._remove_chunks(doc_id)
+            self.manifest['version'] += 1
+            if not self.manifest['documents']:
+                from vector_store_format import delete_store
+                
+                self.vectorstore = None
+                delete_store(self.directory)
+            self.save()
+            return True
+
+    def search_kwargs(self, doc_ids=None, k=30):
+        """
+        search_kwargs สำหรับ retriever ที่จำกัดการค้นหาเฉพาะ doc_ids
+
+        FAISS กรอง metadata หลังค้นหา จึงต้องดึง (fetch_k) มากขึ้นตามสัดส่วน
+        ของ chunks ที่อยู่นอกขอบเขต เพื่อให้ยังได้ k รายการหลังกรอง
+        """
+        if not doc_ids:
+            return {"k": k}
+
+        documents = self.documents()
+        total_chunks = sum(doc['num_chunks'] for doc in documents.values())
+        scoped_chunks = sum(documents[doc_id]['num_chunks'] for doc_id in doc_ids if doc_id in documents)
+        fetch_k = k * 2 * total_chunks // max(scoped_chunks, 1)
+        return {
+            "k": k,
+            "filter": {"doc_id": list(doc_ids)},
+            "fetch_k": min(max(fetch_k, k), max(total_chunks, k))
+        }
+
+
+_corpora = {}
+_corpora_lock = threading.Lock()
+
+
+def get_corpus(embedding_model, base_url="http://localhost:11434"):
+    """คืน CorpusIndex ที่ใช้ร่วมกันทั้ง process ต่อ embedding model"""
+    with _corpora_lock:
+        key = (embedding_model, base_url)
+        if key not in _corpora:
+            _corpora[key] = CorpusIndex(embedding_model, base_url)
+        return _corpora[key]
@@ -0,0 +1,232 @@
+"""
+Persistent Embedding Cache
+เก็บ embedding ของแต่ละ chunk ลงดิสก์ โดยใช้ (embedding model, hash ของข้อความ) เป็น key
+เพื่อให้ Process PDF ซ้ำ หรือ PDF ฉบับแก้ไข จ่ายค่า embed เฉพาะ chunk ที่เปลี่ยนเท่านั้น
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+DEFAULT_CACHE_PATH = os.path.join("vectorstore_cache", "embedding_cache.sqlite3")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # 2 GB
+
+
+def chunk_key(model_name: str, text: str) -> str:
+    """สร้าง key แบบ content-addressed จากชื่อ model และข้อความของ chunk"""
+    digest = hashlib.sha256()
+    digest.update(model_name.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _pack(vector) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+class EmbeddingCache:
+    """
+    Cache ของ embedding บนดิสก์ (SQLite) จำกัดขนาดด้วย LRU eviction
+
+    ใช้ร่วมกันได้ทุกเอกสาร เพราะ key ขึ้นกับเนื้อหาของ chunk ไม่ใช่ชื่อไฟล์
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)"
+        )
+        self._conn.commit()
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """ดึง embedding ของหลายข้อความ คืน None สำหรับข้อความที่ยังไม่มีใน cache"""
+        keys = [chunk_key(model_name, text) for text in texts]
+        found = {}
+
+        with self._lock:
+            # SQLite จำกัดจำนวน parameter ต่อ query จึงดึงเป็นช่วงๆ
+            for start in range(0, len(keys), 500):
+                batch = list(set(keys[start:start + 500]))
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                found.update(rows)
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            results = [found.get(key) for key in keys]
+            hits = sum(blob is not None for blob in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+
+        return [_unpack(blob) if blob is not None else None for blob in results]
+
+    def put_many(self, model_name: str, texts: List[str], vectors: List[List[float]]):
+        """บันทึก embedding ลง cache แล้ว evict รายการเก่าถ้าเกินขนาดที่กำหนด"""
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = _pack(vector)
+            rows.append((chunk_key(model_name, text), model_name, blob, len(blob), now))
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self):
+        """ลบรายการที่ใช้ล่าสุดนานที่สุด (LRU) จนขนาดรวมไม่เกิน max_bytes"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM embeddings ORDER BY last_access ASC"
+        ):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+        self._conn.commit()
+        self.evictions += len(victims)
+
+    def stats(self) -> dict:
+        """สถิติของ cache: hit/miss, จำนวนรายการ และขนาดบนดิสก์"""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings"
+            ).fetchone()
+            hits, misses, evictions = self.hits, self.misses, self.evictions
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'evictions': evictions,
+            'entries': entries,
+            'size_bytes': size,
+            'max_bytes': self.max_bytes
+        }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def clear(self):
+        """ลบข้อมูลทั้งหมดใน cache"""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+        self.reset_stats()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper ที่ตรวจสอบ EmbeddingCache ก่อนเรียก Ollama
+
+    embed เฉพาะข้อความที่ยังไม่มีใน cache แล้วเก็บผลลัพธ์ไว้ใช้ครั้งต่อไป
+    hits/misses นับเฉพาะของ wrapper นี้ (หนึ่งงาน) ส่วน EmbeddingCache นับรวมทั้ง process
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.get_many(self.model_name, texts)
+        hits = sum(vector is not None for vector in vectors)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(vectors) - hits
+
+        # embed เฉพาะข้อความที่ไม่ซ้ำและยังไม่มีใน cache
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(texts[i], []).append(i)
+
+        if missing:
+            missing_texts = list(missing)
+            new_vectors = self.embeddings.embed_documents(missing_texts)
+            self.cache.put_many(self.model_name, missing_texts, new_vectors)
+            for text, vector in zip(missing_texts, new_vectors):
+                for i in missing[text]:
+                    vectors[i] = list(vector)
+
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        # query ไม่ต้อง cache เพราะแทบไม่ซ้ำกับ chunk
+        return self.embeddings.embed_query(text)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_embedding_cache(path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES) -> EmbeddingCache:
+    """คืน EmbeddingCache ที่ใช้ร่วมกันทั้ง process"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None or _default_cache.path != path:
+            _default_cache = EmbeddingCache(path, max_bytes)
+        return _default_cache
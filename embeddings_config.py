@@ -3,46 +3,87 @@ Embedding Models Configuration
 รวบรวม embedding models ต่างๆ ที่ใช้ได้
 """
 
-from langchain_ollama import OllamaEmbeddings
-from typing import Literal
+from typing import TYPE_CHECKING
+
+from ollama_client import get_ollama_pool
+
+if TYPE_CHECKING:
+    from langchain_ollama import OllamaEmbeddings
+
+
+DEFAULT_EMBEDDING_MODEL = "bge-m3"
 
 class EmbeddingFactory:
     """Factory class สำหรับสร้าง embedding models"""
     
     # รายการ models ที่รองรับ (ตรงกับที่ติดตั้งใน Ollama)
+    # type: "embedding" = model สำหรับ embedding โดยเฉพาะ (เล็ก เร็ว vector สั้น)
+    #       "llm"       = LLM ขนาดใหญ่ (รองรับไว้สำหรับ index เดิมที่สร้างด้วย model เหล่านี้)
+    # dimension: ขนาดของ vector ต่อ chunk
     SUPPORTED_MODELS = {
+        "bge-m3": {
+            "name": "BGE-M3",
+            "description": "Embedding model หลายภาษา รองรับภาษาไทยดี (แนะนำ)",
+            "size": "567M parameters",
+            "type": "embedding",
+            "dimension": 1024
+        },
+        "nomic-embed-text": {
+            "name": "Nomic Embed Text",
+            "description": "Embedding model ขนาดเล็ก เร็วที่สุด เหมาะกับเอกสารภาษาอังกฤษ",
+            "size": "137M parameters",
+            "type": "embedding",
+            "dimension": 768
+        },
+        "mxbai-embed-large": {
+            "name": "mxbai Embed Large",
+            "description": "Embedding model ความแม่นยำสูง (ภาษาอังกฤษ)",
+            "size": "335M parameters",
+            "type": "embedding",
+            "dimension": 1024
+        },
         "deepseek-r1:14b": {
             "name": "DeepSeek R1 14B",
-            "description": "Model DeepSeek เน้นความเข้าใจลึก มีเหตุผล (แนะนำ)",
-            "size": "14B parameters"
+            "description": "LLM - ใช้ embed ได้แต่ช้ามากและ vector ใหญ่ (สำหรับ index เดิม)",
+            "size": "14B parameters",
+            "type": "llm",
+            "dimension": 5120
         },
         "gemma2:27b": {
             "name": "Gemma 2 27B",
-            "description": "Model ใหญ่ที่สุด ความแม่นยำสูง แต่ช้ากว่า",
-            "size": "27B parameters"
+            "description": "LLM - ใช้ embed ได้แต่ช้ามากและ vector ใหญ่ (สำหรับ index เดิม)",
+            "size": "27B parameters",
+            "type": "llm",
+            "dimension": 4608
         },
         "gemma2:9b": {
             "name": "Gemma 2 9B", 
-            "description": "Model กลาง สมดุลระหว่างความเร็วและความแม่นยำ",
-            "size": "9B parameters"
+            "description": "LLM - ใช้ embed ได้แต่ช้าและ vector ใหญ่ (สำหรับ index เดิม)",
+            "size": "9B parameters",
+            "type": "llm",
+            "dimension": 3584
         },
         "llama3.1:8b": {
             "name": "Llama 3.1 8B",
-            "description": "Model จาก Meta เร็วและมีประสิทธิภาพ",
-            "size": "8B parameters"
+            "description": "LLM - ใช้ embed ได้แต่ช้าและ vector ใหญ่ (สำหรับ index เดิม)",
+            "size": "8B parameters",
+            "type": "llm",
+            "dimension": 4096
         },
         "gemma3:12b": {
             "name": "Gemma 3 12B",
-            "description": "Model Gemma รุ่นใหม่ ประสิทธิภาพดีขึ้น",
-            "size": "12B parameters"
+            "description": "LLM - ใช้ embed ได้แต่ช้าและ vector ใหญ่ (สำหรับ index เดิม)",
+            "size": "12B parameters",
+            "type": "llm",
+            "dimension": 3840
         }
     }
     
     @staticmethod
     def create_embeddings(
-        model_name: str = "gemma2:27b",
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
         base_url: str = "http://localhost:11434"
-    ) -> OllamaEmbeddings:
+    ) -> "OllamaEmbeddings":
         """
         สร้าง embedding model
         
@@ -53,15 +94,19 @@ class EmbeddingFactory:
         Returns:
             OllamaEmbeddings instance
         """
+        from langchain_ollama import OllamaEmbeddings  # import ตอนใช้งานจริง (ช้า ~1 วินาที)
+        
         if model_name not in EmbeddingFactory.SUPPORTED_MODELS:
             raise ValueError(
                 f"Model '{model_name}' ไม่รองรับ. "
                 f"Models ที่ใช้ได้: {list(EmbeddingFactory.SUPPORTED_MODELS.keys())}"
             )
         
+        # ใช้ connection pool และ keep_alive ร่วมกับ client อื่นของ Ollama server เดียวกัน
         return OllamaEmbeddings(
             model=model_name,
-            base_url=base_url
+            base_url=base_url,
+            **get_ollama_pool().langchain_kwargs(base_url)
         )
     
     @staticmethod
@@ -73,11 +118,16 @@ class EmbeddingFactory:
     def get_all_models() -> dict:
         """ดึงรายการ models ทั้งหมด"""
         return EmbeddingFactory.SUPPORTED_MODELS
+    
+    @staticmethod
+    def vector_bytes(model_name: str) -> int:
+        """ขนาดของ vector 1 chunk ใน index (float32)"""
+        return EmbeddingFactory.get_model_info(model_name).get("dimension", 0) * 4
 
 
 def get_recommended_model(document_size: int) -> str:
     """
-    แนะนำ model ตามขนาดเอกสาร
+    แนะนำ LLM สำหรับตอบคำถามตามขนาดเอกสาร (ดู LLM_MODELS ใน llm_config)
     
     Args:
         document_size: จำนวนตัวอักษรในเอกสาร
@@ -0,0 +1,458 @@
+"""
+Background Ingestion Jobs
+ประมวลผล PDF เป็นงานเบื้องหลังด้วย worker pool ขนาดจำกัด แทนการรันใน Streamlit script
+คิวและสถานะของงานเก็บใน SQLite งานที่ถูกขัดจังหวะ (ปิดโปรแกรม/ล้มเหลว) ทำต่อจาก checkpoint ล่าสุดได้
+"""
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from answer_cache import get_answer_cache
+from artifact_cache import get_artifact_cache
+from pdf_processor import ingest_pdf_stream, load_vectorstore, save_vectorstore
+from resource_registry import invalidate_document
+from tracing import Trace, get_metrics_sink
+
+
+JOBS_DIR = os.path.join("vectorstore_cache", "jobs")
+DB_NAME = "jobs.sqlite3"
+DEFAULT_MAX_WORKERS = int(os.environ.get("BORNZI_INGEST_WORKERS", 2))
+# บันทึก checkpoint ไม่บ่อยกว่าทุก N วินาที (บันทึกแต่ละครั้งเขียน index ทั้งชุดใหม่)
+DEFAULT_CHECKPOINT_INTERVAL = float(os.environ.get("BORNZI_CHECKPOINT_INTERVAL", 10.0))
+# งาน running ที่ไม่มี heartbeat นานเกินนี้ (วินาที) ถือว่า process ที่ทำอยู่หยุดไปแล้ว
+DEFAULT_LEASE_TIMEOUT = float(os.environ.get("BORNZI_JOB_LEASE_TIMEOUT", 60.0))
+HEARTBEAT_INTERVAL = 10.0
+
+ACTIVE_STATUSES = ("queued", "running")
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+JSON_COLUMNS = ("params", "options", "checkpoint", "result")
+
+# ข้อมูลของการประมวลผลที่เก็บใน artifact cache (เหมือนกับการ Process ใน session)
+ARTIFACT_INFO_KEYS = (
+    'num_pages', 'total_chars', 'num_chunks', 'chunk_size', 'chunk_overlap', 'index_type', 'chunks_per_sec'
+)
+RESULT_KEYS = ARTIFACT_INFO_KEYS + (
+    'chunk_info', 'elapsed', 'pages_per_sec', 'recommended_model', 'cache_stats', 'split_stats', 'index_report'
+)
+
+
+class JobCancelled(Exception):
+    """งานถูกยกเลิกระหว่างประมวลผล"""
+
+
+class IngestJobManager:
+    """
+    คิวงาน Process PDF พร้อม worker threads จำนวนจำกัด
+
+    - งานใหม่อยู่ในสถานะ queued จนกว่าจะมี worker ว่าง (ไม่เกิน max_workers งานพร้อมกัน)
+    - ระหว่างประมวลผลบันทึก checkpoint (index ของหน้าที่เสร็จแล้ว) ทุก checkpoint_interval วินาที
+    - งานที่ถูก claim มีเจ้าของ (claimed_by) และ heartbeat ทุก HEARTBEAT_INTERVAL วินาที
+      หลาย process (Streamlit, api_server) ใช้ database เดียวกันได้ งานหนึ่งถูกทำโดย process เดียว
+    - งาน running ที่ heartbeat หยุดนานเกิน lease_timeout (process ปิดไปแล้ว)
+      จะกลับเข้าคิวและทำต่อจาก checkpoint
+    - เมื่อเสร็จ บันทึก Vector Store ลง artifact cache แล้วลบไฟล์ชั่วคราวของงาน
+
+    จำนวน request ไป Ollama ของทุกงานรวมกันถูกจำกัดด้วย parallel_embeddings.ollama_slot
+
+    Args:
+        directory: โฟลเดอร์ของ database และไฟล์ของแต่ละงาน
+        max_workers: จำนวนงานที่ประมวลผลพร้อมกันได้สูงสุด
+        checkpoint_interval: เวลาขั้นต่ำ (วินาที) ระหว่าง checkpoint
+        lease_timeout: เวลา (วินาที) ที่งาน running ไม่มี heartbeat แล้วให้ process อื่นทำต่อได้
+    """
+
+    def __init__(self, directory=JOBS_DIR, max_workers=DEFAULT_MAX_WORKERS,
+                 checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL, lease_timeout=DEFAULT_LEASE_TIMEOUT):
+        self.directory = directory
+        self.max_workers = max(1, max_workers)
+        self.checkpoint_interval = checkpoint_interval
+        self.lease_timeout = lease_timeout
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._heartbeat_stop = threading.Event()
+        self._cancel_requested = set()
+        self._stopped = False
+
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(directory, DB_NAME), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                name TEXT NOT NULL,
+                pdf_path TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                embedding_model TEXT NOT NULL,
+                base_url TEXT NOT NULL,
+                params TEXT NOT NULL,
+                options TEXT NOT NULL,
+                pages_done INTEGER NOT NULL DEFAULT 0,
+                num_pages INTEGER,
+                chunks_done INTEGER NOT NULL DEFAULT 0,
+                checkpoint TEXT,
+                error TEXT,
+                result TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                claimed_by TEXT,
+                heartbeat_at REAL
+            )
+            """
+        )
+        # database ของรุ่นก่อนที่ยังไม่มีคอลัมน์ของ lease
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("claimed_by", "TEXT"), ("heartbeat_at", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        self._conn.commit()
+        self._requeue_expired()
+
+        self._workers = [
+            threading.Thread(target=self._worker_loop, name=f"ingest-worker-{i}", daemon=True)
+            for i in range(self.max_workers)
+        ]
+        self._workers.append(threading.Thread(target=self._heartbeat_loop, name="ingest-heartbeat", daemon=True))
+        for worker in self._workers:
+            worker.start()
+
+    # ---------- database ----------
+
+    def _row_to_job(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        for column in JSON_COLUMNS:
+            job[column] = json.loads(job[column]) if job[column] else None
+        return job
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        for column in JSON_COLUMNS:
+            if column in fields and fields[column] is not None:
+                fields[column] = json.dumps(fields[column], ensure_ascii=False)
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def get(self, job_id):
+        """ข้อมูลของงาน (dict) หรือ None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def list_jobs(self, limit=20, statuses=None):
+        """งานล่าสุด (ใหม่ก่อน) กรองตามสถานะได้"""
+        query, args = "SELECT * FROM jobs", []
+        if statuses:
+            query += f" WHERE status IN ({', '.join('?' * len(statuses))})"
+            args.extend(statuses)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, args).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def find_active(self, fingerprint, embedding_model, params):
+        """งานที่ยังไม่เสร็จของเอกสารเดียวกัน (model และค่าการประมวลผลเดียวกัน) หรือ None"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE fingerprint = ? AND embedding_model = ? AND status IN (?, ?) "
+                "ORDER BY created_at",
+                (fingerprint, embedding_model, *ACTIVE_STATUSES)
+            ).fetchall()
+        for row in rows:
+            job = self._row_to_job(row)
+            if job['params'] == params:
+                return job
+        return None
+
+    # ---------- API ----------
+
+    def submit(self, uploaded_file, fingerprint, embedding_model, params, name=None,
+               base_url="http://localhost:11434", extraction_workers=1, compare_indexes=False):
+        """
+        เพิ่มงาน Process PDF เข้าคิว
+
+        ถ้ามีงานของเอกสารเดียวกันที่ยังไม่เสร็จอยู่แล้ว จะคืนงานนั้นแทนการสร้างงานใหม่
+
+        Args:
+            uploaded_file: ไฟล์ PDF (file-like) จะถูกคัดลอกไปเก็บในโฟลเดอร์ของงาน
+            params: ค่าการประมวลผลจาก pdf_processor.ingest_params (ใช้เป็น key ของ artifact)
+
+        Returns:
+            id ของงาน
+        """
+        existing = self.find_active(fingerprint, embedding_model, params)
+        if existing is not None:
+            return existing['id']
+
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = os.path.join(self.directory, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        pdf_path = os.path.join(job_dir, "source.pdf")
+        uploaded_file.seek(0)
+        with open(pdf_path, "wb") as f:
+            shutil.copyfileobj(uploaded_file, f, length=1024 * 1024)
+        uploaded_file.seek(0)
+
+        now = time.time()
+        options = {'extraction_workers': extraction_workers, 'compare_indexes': compare_indexes}
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, name, pdf_path, fingerprint, embedding_model, base_url, "
+                "params, options, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id, name or getattr(uploaded_file, "name", job_id), pdf_path, fingerprint,
+                    embedding_model, base_url, json.dumps(params), json.dumps(options), now, now
+                )
+            )
+            self._conn.commit()
+
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def cancel(self, job_id):
+        """
+        ยกเลิกงาน งานที่กำลังประมวลผลจะหยุดหลังจบกลุ่มหน้าปัจจุบัน
+
+        Returns:
+            True ถ้างานยังไม่เสร็จและถูกยกเลิก
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (time.time(), time.time(), job_id)
+            )
+            self._conn.commit()
+            if cursor.rowcount:
+                self._remove_files(job_id)
+                return True
+
+            row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row['status'] != 'running':
+                return False
+            self._cancel_requested.add(job_id)
+            return True
+
+    def retry(self, job_id):
+        """นำงานที่ล้มเหลวกลับเข้าคิว (ทำต่อจาก checkpoint ถ้ามี)"""
+        job = self.get(job_id)
+        if job is None or job['status'] != 'failed' or not os.path.exists(job['pdf_path']):
+            return False
+        self._update(job_id, status='queued', error=None, finished_at=None)
+        with self._wakeup:
+            self._wakeup.notify()
+        return True
+
+    def partial_vectorstore(self, job):
+        """
+        index ของหน้าที่ประมวลผลแล้วจาก checkpoint ล่าสุด (อ่านอย่างเดียว) หรือ None
+
+        ใช้ถามคำถามระหว่างที่งานยังประมวลผลไม่ครบ
+        """
+        checkpoint = job['checkpoint']
+        if not checkpoint or not os.path.exists(checkpoint['path']):
+            return None
+        return load_vectorstore(checkpoint['path'], job['embedding_model'], job['base_url'])
+
+    def stop(self):
+        """หยุด worker ทั้งหมด (งานที่ค้างจะทำต่อเมื่อเริ่มโปรแกรมใหม่)"""
+        self._stopped = True
+        self._heartbeat_stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    # ---------- worker ----------
+
+    def _requeue_expired(self):
+        """งาน running ที่ heartbeat หมดอายุ (process ที่ทำอยู่ปิดไปแล้ว) กลับเข้าคิวเพื่อทำต่อจาก checkpoint"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', claimed_by = NULL "
+                "WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (time.time() - self.lease_timeout,)
+            )
+            self._conn.commit()
+
+    def _claim(self):
+        """
+        เลือกงานที่รอนานที่สุดและเปลี่ยนสถานะเป็น running
+
+        UPDATE มีเงื่อนไข status = 'queued' จึงมีเพียง process เดียวที่ claim งานหนึ่งได้
+        (SQLite ให้เขียนได้ทีละ connection) ถ้า process อื่น claim ไปก่อนจะลองงานถัดไป
+        """
+        self._requeue_expired()
+        with self._lock:
+            candidates = self._conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 10"
+            ).fetchall()
+            for candidate in candidates:
+                now = time.time()
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET status = 'running', claimed_by = ?, heartbeat_at = ?, "
+                    "started_at = COALESCE(started_at, ?), updated_at = ? WHERE id = ? AND status = 'queued'",
+                    (self.owner, now, now, now, candidate['id'])
+                )
+                self._conn.commit()
+                if cursor.rowcount == 1:
+                    row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (candidate['id'],)).fetchone()
+                    return self._row_to_job(row)
+        return None
+
+    def _heartbeat_loop(self):
+        """ต่อ lease ของงานที่ process นี้กำลังทำ"""
+        while not self._stopped:
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE jobs SET heartbeat_at = ? WHERE claimed_by = ? AND status = 'running'",
+                    (time.time(), self.owner)
+                )
+                self._conn.commit()
+            self._heartbeat_stop.wait(timeout=HEARTBEAT_INTERVAL)
+
+    def _worker_loop(self):
+        while not self._stopped:
+            job = self._claim()
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(timeout=1.0)
+                continue
+
+            try:
+                self._run(job)
+            except JobCancelled:
+                self._update(job['id'], status='cancelled', finished_at=time.time())
+                self._remove_files(job['id'])
+            except Exception as e:
+                # เก็บไฟล์และ checkpoint ไว้ให้ retry ได้
+                self._update(job['id'], status='failed', error=str(e), finished_at=time.time())
+            finally:
+                with self._lock:
+                    self._cancel_requested.discard(job['id'])
+
+    def _load_resume(self, job):
+        checkpoint = job['checkpoint']
+        if not checkpoint or not os.path.exists(checkpoint['path']):
+            return None
+        try:
+            vectorstore = load_vectorstore(
+                checkpoint['path'], job['embedding_model'], job['base_url'], mmap_index=False
+            )
+        except Exception:
+            return None  # checkpoint เสียหาย - เริ่มใหม่ทั้งหมด
+        return dict(checkpoint, vectorstore=vectorstore)
+
+    def _checkpoint(self, job_id, progress):
+        """
+        บันทึก index ของหน้าที่เสร็จแล้วลงโฟลเดอร์ใหม่ แล้วจึงชี้ database ไปที่โฟลเดอร์นั้น
+
+        checkpoint เดิมถูกลบหลังจาก database ชี้ไปที่อันใหม่แล้ว
+        ถ้าโปรแกรมหยุดระหว่างบันทึก จะยังมี checkpoint ที่สมบูรณ์อยู่เสมอ
+        """
+        job_dir = os.path.join(self.directory, job_id)
+        name = f"checkpoint-{progress['pages_done']:06d}"
+        path = os.path.join(job_dir, name)
+        save_vectorstore(progress['vectorstore'], path)
+        self._update(job_id, checkpoint={
+            'path': path,
+            'pages_done': progress['pages_done'],
+            'chunks_done': progress['chunks_done'],
+            'total_chars': progress['total_chars'],
+            'chunk_params': progress['chunk_params'],
+            'splitter_state': progress['splitter_state']
+        })
+        for entry in os.listdir(job_dir):
+            if entry.startswith("checkpoint-") and entry != name:
+                shutil.rmtree(os.path.join(job_dir, entry), ignore_errors=True)
+
+    def _remove_files(self, job_id):
+        shutil.rmtree(os.path.join(self.directory, job_id), ignore_errors=True)
+
+    def _run(self, job):
+        job_id = job['id']
+        trace = Trace("ingest", document=job['name'], embedding_model=job['embedding_model'], job_id=job_id)
+        resume = self._load_resume(job)
+        if resume is not None:
+            trace.count("resumed_pages", resume['pages_done'])
+
+        params, options = job['params'], job['options']
+        last_checkpoint = time.monotonic()
+        with open(job['pdf_path'], "rb") as pdf_file:
+            stream = ingest_pdf_stream(
+                pdf_file,
+                job['embedding_model'],
+                base_url=job['base_url'],
+                pages_per_batch=params['pages_per_batch'],
+                index_type=params['index_type'],
+                extraction_workers=options['extraction_workers'],
+                compare_indexes=options['compare_indexes'],
+                trace=trace,
+                resume=resume,
+                splitter=params.get('splitter', "recursive")
+            )
+            try:
+                for progress in stream:
+                    if job_id in self._cancel_requested:
+                        raise JobCancelled(job_id)
+                    self._update(
+                        job_id,
+                        pages_done=progress['pages_done'],
+                        num_pages=progress['num_pages'],
+                        chunks_done=progress['chunks_done']
+                    )
+                    due = time.monotonic() - last_checkpoint >= self.checkpoint_interval
+                    if not progress['done'] and progress['vectorstore'] is not None and due:
+                        with trace.span("checkpoint"):
+                            self._checkpoint(job_id, progress)
+                        last_checkpoint = time.monotonic()
+            finally:
+                stream.close()  # ลบไฟล์ชั่วคราวของ ingest_pdf_stream เมื่อหยุดกลางคัน
+
+        result = progress
+        # เอกสารนี้มี index ใหม่ - ลบ index/chain/คำตอบเดิมที่ใช้ร่วมกันอยู่
+        invalidate_document(job['fingerprint'])
+        get_answer_cache().invalidate(job['fingerprint'])
+        with trace.span("save"):
+            entry = get_artifact_cache().store(
+                job['fingerprint'],
+                job['embedding_model'],
+                params,
+                result['vectorstore'],
+                name=job['name'],
+                info={key: result[key] for key in ARTIFACT_INFO_KEYS}
+            )
+        get_metrics_sink().record(trace)
+
+        summary = {key: result[key] for key in RESULT_KEYS}
+        summary['artifact_path'] = entry['path']
+        summary['trace'] = trace.to_dict()
+        self._update(job_id, status='done', result=summary, checkpoint=None, finished_at=time.time())
+        self._remove_files(job_id)
+
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """คืน IngestJobManager ที่ใช้ร่วมกันทั้ง process (เริ่ม workers ครั้งแรกที่ถูกเรียก)"""
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = IngestJobManager()
+        return _job_manager
@@ -1,15 +1,64 @@
 """
 LLM and QA Chain Configuration
+
+langchain ถูก import ในฟังก์ชันที่สร้าง LLM/chain เท่านั้น
+รายการ models และค่าคงที่จึงใช้ได้ทันทีโดยไม่ทำให้หน้าเว็บเปิดช้า
 """
-from langchain_ollama import OllamaLLM
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
+import math
+import time
+from context_packing import pack_context, estimate_tokens, DEFAULT_MAX_CONTEXT_TOKENS
+from tracing import NULL_TRACE
+from ollama_client import get_ollama_pool
 
 
-def create_qa_prompt():
-    """สร้าง Prompt Template ที่บังคับให้อ่านและตอบตามเอกสารเท่านั้น"""
-    
-    template = """คุณเป็น AI ที่ตอบคำถามจากเอกสาร ห้ามใช้ความรู้ภายนอกเด็ดขาด
+# LLM ที่ใช้ตอบคำถาม (เลือกแยกจาก embedding model)
+# context_length: context window ที่ model รองรับ (tokens) - ใช้จำกัด num_ctx ในโหมด adaptive
+DEFAULT_LLM_MODEL = "gemma2:27b"
+LLM_MODELS = {
+    "deepseek-r1:14b": {
+        "name": "DeepSeek R1 14B",
+        "description": "Model DeepSeek เน้นความเข้าใจลึก มีเหตุผล (แนะนำ)",
+        "size": "14B parameters",
+        "context_length": 131072
+    },
+    "gemma2:27b": {
+        "name": "Gemma 2 27B",
+        "description": "Model ใหญ่ที่สุด ความแม่นยำสูง แต่ช้ากว่า",
+        "size": "27B parameters",
+        "context_length": 8192
+    },
+    "gemma2:9b": {
+        "name": "Gemma 2 9B",
+        "description": "Model กลาง สมดุลระหว่างความเร็วและความแม่นยำ",
+        "size": "9B parameters",
+        "context_length": 8192
+    },
+    "llama3.1:8b": {
+        "name": "Llama 3.1 8B",
+        "description": "Model จาก Meta เร็วและมีประสิทธิภาพ",
+        "size": "8B parameters",
+        "context_length": 131072
+    },
+    "gemma3:12b": {
+        "name": "Gemma 3 12B",
+        "description": "Model Gemma รุ่นใหม่ ประสิทธิภาพดีขึ้น",
+        "size": "12B parameters",
+        "context_length": 131072
+    }
+}
+MAX_NUM_CTX = 32768       # เพดานเดิมของ create_llm
+MAX_NUM_PREDICT = 4096
+MIN_NUM_PREDICT = 512
+NUM_CTX_STEP = 2048       # ปัดขึ้นเป็นช่วงละ 2k เพื่อให้ Ollama ใช้ KV cache ขนาดเดิมซ้ำได้บ่อย
+
+ADAPTIVE_MIN_K = 4
+ADAPTIVE_MAX_K = 30
+ADAPTIVE_SCORE_CUTOFF = 0.5  # เก็บเอกสารที่ระยะห่างไม่เกินระยะที่ดีที่สุด x (1 + cutoff)
+ADAPTIVE_ELBOW_RATIO = 3.0   # ช่องว่างของ score ที่ใหญ่กว่าค่าเฉลี่ยกี่เท่าถึงจะถือเป็น elbow
+
+
+# คำสั่งของ prompt (ใช้ร่วมกับโหมดสนทนาต่อเนื่องใน conversation.py)
+QA_INSTRUCTIONS = """คุณเป็น AI ที่ตอบคำถามจากเอกสาร ห้ามใช้ความรู้ภายนอกเด็ดขาด
 
 ⚠️ ขั้นตอนการทำงาน (ต้องทำทุกขั้น):
 
@@ -36,7 +85,13 @@ def create_qa_prompt():
 - ห้ามใช้ความรู้ที่มีอยู่แล้ว
 - ห้ามเดาหรือสันนิษฐาน
 - ห้ามสรุปหรือตัดทอน
-- ห้ามแต่งเติม
+- ห้ามแต่งเติม"""
+
+
+def create_qa_prompt():
+    """สร้าง Prompt Template ที่บังคับให้อ่านและตอบตามเอกสารเท่านั้น"""
+    
+    template = QA_INSTRUCTIONS + """
 
 📚 เอกสารอ้างอิง:
 {context}
@@ -51,14 +106,17 @@ def create_qa_prompt():
 
 💬 คำตอบ:"""
     
+    from langchain.prompts import PromptTemplate
+    
     return PromptTemplate(
         template=template,
         input_variables=["context", "question"]
     )
 
 
-def create_llm(model="gemma2:27b", base_url="http://localhost:11434"):
+def create_llm(model=DEFAULT_LLM_MODEL, base_url="http://localhost:11434"):
     """สร้าง LLM instance"""
+    from langchain_ollama import OllamaLLM
     
     return OllamaLLM(
         model=model,
@@ -68,11 +126,85 @@ def create_llm(model="gemma2:27b", base_url="http://localhost:11434"):
         num_predict=4096,       # จำนวน token เพิ่มความยาวคำตอบ
         top_k=1,               # เลือกคำที่แน่ใจสุด
         top_p=0.05,            # ลดลงเพื่อความแม่นยำสูงสุด
-        repeat_penalty=1.2      # เพิ่มเพื่อป้องกันซ้ำ
+        repeat_penalty=1.2,     # เพิ่มเพื่อป้องกันซ้ำ
+        **get_ollama_pool().langchain_kwargs(base_url)  # connection pool + keep_alive
     )
 
 
-def create_qa_chain(vectorstore, llm_model="gemma2:27b", base_url="http://localhost:11434"):
+def select_k(scores, min_k=ADAPTIVE_MIN_K, max_k=ADAPTIVE_MAX_K,
+             score_cutoff=ADAPTIVE_SCORE_CUTOFF, elbow_ratio=ADAPTIVE_ELBOW_RATIO):
+    """
+    เลือกจำนวนเอกสาร k จากการกระจายของ score
+    
+    Args:
+        scores: ระยะห่าง (L2 distance จาก FAISS, ค่าน้อย = ใกล้) เรียงจากน้อยไปมาก
+    
+    Returns:
+        k ที่เลือก อยู่ระหว่าง min_k และ max_k
+    """
+    scores = list(scores)[:max_k]
+    if len(scores) <= min_k:
+        return len(scores)
+    
+    # 1) score cutoff: ตัดเอกสารที่ไกลกว่าเอกสารที่ดีที่สุดเกินสัดส่วนที่กำหนด
+    limit = scores[0] * (1 + score_cutoff) if scores[0] > 0 else float('inf')
+    k = max(min_k, sum(1 for score in scores if score <= limit))
+    
+    # 2) elbow: ตัดที่ช่องว่างของ score ที่กว้างผิดปกติ (หลัง min_k)
+    gaps = [scores[i + 1] - scores[i] for i in range(len(scores) - 1)]
+    mean_gap = sum(gaps) / len(gaps)
+    if mean_gap > 0:
+        for i in range(min_k - 1, k - 1):
+            if gaps[i] > elbow_ratio * mean_gap:
+                k = i + 1
+                break
+    
+    return k
+
+
+def get_llm_info(model):
+    """ดึงข้อมูลของ LLM"""
+    return LLM_MODELS.get(model, {})
+
+
+def model_context_limit(model):
+    """context window สูงสุดที่ใช้กับ model (ไม่เกิน MAX_NUM_CTX)"""
+    return min(get_llm_info(model).get("context_length", MAX_NUM_CTX), MAX_NUM_CTX)
+
+
+def size_llm_options(llm, prompt_tokens, model=None):
+    """
+    กำหนด num_ctx และ num_predict ตามความยาว prompt จริง
+    
+    Returns:
+        dict options สำหรับส่งให้ OllamaLLM (ค่าอื่นคงเดิมตามที่ตั้งไว้ใน create_llm)
+    """
+    model_limit = model_context_limit(model or llm.model)
+    num_predict = max(MIN_NUM_PREDICT, min(MAX_NUM_PREDICT, model_limit - prompt_tokens))
+    num_ctx = math.ceil((prompt_tokens + num_predict) / NUM_CTX_STEP) * NUM_CTX_STEP
+    num_ctx = min(num_ctx, model_limit)
+    
+    return {
+        "mirostat": llm.mirostat,
+        "mirostat_eta": llm.mirostat_eta,
+        "mirostat_tau": llm.mirostat_tau,
+        "num_ctx": num_ctx,
+        "num_gpu": llm.num_gpu,
+        "num_thread": llm.num_thread,
+        "num_predict": num_predict,
+        "repeat_last_n": llm.repeat_last_n,
+        "repeat_penalty": llm.repeat_penalty,
+        "temperature": llm.temperature,
+        "seed": llm.seed,
+        "stop": llm.stop,
+        "tfs_z": llm.tfs_z,
+        "top_k": llm.top_k,
+        "top_p": llm.top_p
+    }
+
+
+def create_qa_chain(vectorstore, llm_model=DEFAULT_LLM_MODEL, base_url="http://localhost:11434", llm=None,
+                    search_kwargs=None):
     """
     สร้าง QA Chain
     
@@ -80,19 +212,24 @@ def create_qa_chain(vectorstore, llm_model="gemma2:27b", base_url="http://localh
         vectorstore: FAISS vectorstore
         llm_model: ชื่อ LLM model
         base_url: Ollama base URL
+        llm: LLM instance ที่สร้างไว้แล้ว (ถ้าไม่ระบุจะสร้างใหม่)
+        search_kwargs: ค่าเพิ่มเติมของ retriever เช่น filter/fetch_k สำหรับจำกัดเอกสารใน corpus
         
     Returns:
         RetrievalQA chain
     """
+    from langchain.chains import RetrievalQA
     
     prompt = create_qa_prompt()
-    llm = create_llm(llm_model, base_url)
+    if llm is None:
+        llm = create_llm(llm_model, base_url)
     
     # ใช้ similarity search และดึงเยอะมากๆ เนื่องจาก chunk เล็ก
     retriever = vectorstore.as_retriever(
         search_type="similarity",
         search_kwargs={
             "k": 30,  # เพิ่มเป็น 30 เพราะ chunk เล็กลง
+            **(search_kwargs or {})
         }
     )
     
@@ -106,6 +243,166 @@ def create_qa_chain(vectorstore, llm_model="gemma2:27b", base_url="http://localh
     )
 
 
-def get_answer(qa_chain, question):
-    """รับคำตอบจาก QA Chain"""
-    return qa_chain({"query": question})
+def get_answer(qa_chain, question, adaptive=False, trace=None):
+    """รับคำตอบจาก QA Chain (ใช้ขั้นตอนเดียวกับ stream_answer แต่รอจนได้คำตอบครบ)"""
+    answer = StreamingAnswer(qa_chain, question, adaptive=adaptive, trace=trace)
+    for _ in answer:
+        pass
+    return answer.as_response()
+
+
+class StreamingAnswer:
+    """
+    คำตอบแบบ streaming จาก QA Chain
+    
+    ค้นหาเอกสารก่อน (retrieve) แล้วจึงส่ง token ของคำตอบออกมาทีละส่วนเมื่อวนลูป
+    พร้อมจับเวลา retrieval, time-to-first-token และเวลารวม
+    
+    ก่อนสร้าง prompt จะรวม chunks ที่ซ้อนทับกันเป็นช่วงข้อความต่อเนื่อง (pack_context)
+    เพื่อไม่ให้ model ต้อง prefill ข้อความซ้ำ
+    
+    adaptive=True จะเลือก k จากการกระจายของ similarity score (select_k)
+    และกำหนด num_ctx/num_predict จากความยาว prompt จริง (size_llm_options)
+    แทนการใช้ k=30 และ num_ctx=32768 ทุกครั้ง
+    
+    trace (tracing.Trace) จะได้เวลาของขั้นตอน retrieval, packing, llm_prefill, llm_decode
+    Ollama ไม่ส่งเวลา prefill/decode มากับ stream จึงประมาณ prefill = เวลาจนได้ token แรก
+    และ decode = เวลาที่เหลือจนจบ
+    """
+    
+    def __init__(self, qa_chain, question, query_embedding=None,
+                 max_context_tokens=DEFAULT_MAX_CONTEXT_TOKENS, adaptive=False, trace=None,
+                 source_documents=None):
+        self.qa_chain = qa_chain
+        self.question = question
+        self.query_embedding = query_embedding
+        self.max_context_tokens = max_context_tokens
+        self.adaptive = adaptive
+        self.trace = trace or NULL_TRACE
+        self.llm_options = None
+        self.source_documents = source_documents  # ค้นหาไว้แล้ว (เช่น batch_qa) จะข้ามการค้นหา
+        self.context_documents = None
+        self.packing = None
+        self.prompt = None
+        self.result = ""
+        self.timings = {
+            'retrieval_time': None,
+            'time_to_first_token': None,
+            'total_time': None
+        }
+        self._start = None
+    
+    def retrieve(self):
+        """ดึงเอกสารที่เกี่ยวข้อง (เรียกซ้ำได้ จะค้นหาแค่ครั้งแรก)"""
+        if self.context_documents is None:
+            self._start = time.perf_counter()
+            retriever = self.qa_chain.retriever
+            if self.source_documents is None:
+                with self.trace.span("retrieval"):
+                    if self.adaptive and retriever.search_type == "similarity":
+                        self.source_documents = self._retrieve_adaptive(retriever)
+                    elif self.query_embedding is not None and retriever.search_type == "similarity":
+                        # ใช้ embedding ของคำถามที่คำนวณไว้แล้ว (เช่นจาก answer cache) ไม่ต้อง embed ซ้ำ
+                        self.source_documents = retriever.vectorstore.similarity_search_by_vector(
+                            list(self.query_embedding), **retriever.search_kwargs
+                        )
+                    else:
+                        self.source_documents = retriever.invoke(self.question)
+            self.trace.count("retrieved_chunks", len(self.source_documents))
+            max_context_tokens = self.max_context_tokens
+            if self.adaptive:
+                # เหลือที่ให้ instruction ของ prompt และคำตอบขั้นต่ำ
+                llm = self.qa_chain.combine_documents_chain.llm_chain.llm
+                prompt_overhead = estimate_tokens(self._build_prompt([]))
+                max_context_tokens = min(
+                    max_context_tokens,
+                    model_context_limit(llm.model) - prompt_overhead - MIN_NUM_PREDICT
+                )
+            with self.trace.span("packing"):
+                self.context_documents, self.packing = pack_context(
+                    self._pack_candidates(), max_context_tokens
+                )
+            self.timings['retrieval_time'] = time.perf_counter() - self._start
+        return self.source_documents
+    
+    def _retrieve_adaptive(self, retriever):
+        """ดึงเอกสารสูงสุด k ของ retriever แล้วตัดเหลือเท่าที่ score บอกว่าเกี่ยวข้อง"""
+        search_kwargs = dict(retriever.search_kwargs)
+        max_k = search_kwargs.pop("k", ADAPTIVE_MAX_K)
+        vectorstore = retriever.vectorstore
+        
+        if self.query_embedding is not None:
+            scored = vectorstore.similarity_search_with_score_by_vector(
+                list(self.query_embedding), k=max_k, **search_kwargs
+            )
+        else:
+            scored = vectorstore.similarity_search_with_score(self.question, k=max_k, **search_kwargs)
+        
+        k = select_k([score for _, score in scored], max_k=max_k)
+        return [doc for doc, _ in scored[:k]]
+    
+    def _pack_candidates(self):
+        """chunks ที่จะใส่ลง prompt (ConversationTurn ตัด chunks ที่อยู่ในบทสนทนาแล้วออก)"""
+        return self.source_documents
+    
+    def _llm_options(self, llm, prompt_tokens):
+        """options ของ LLM สำหรับ prompt นี้ (None = ใช้ค่าที่ตั้งไว้ใน create_llm)"""
+        if self.adaptive:
+            return size_llm_options(llm, prompt_tokens)
+        return None
+    
+    def _build_prompt(self, documents):
+        """สร้าง prompt แบบเดียวกับ "stuff" chain ของ RetrievalQA"""
+        from langchain_core.prompts import format_document
+        
+        combine_chain = self.qa_chain.combine_documents_chain
+        context = combine_chain.document_separator.join(
+            format_document(doc, combine_chain.document_prompt) for doc in documents
+        )
+        return combine_chain.llm_chain.prompt.format(context=context, question=self.question)
+    
+    def __iter__(self):
+        self.retrieve()
+        llm = self.qa_chain.combine_documents_chain.llm_chain.llm
+        prompt = self.prompt = self._build_prompt(self.context_documents)
+        
+        prompt_tokens = estimate_tokens(prompt)
+        self.trace.count("prompt_tokens", prompt_tokens)
+        
+        stream_kwargs = {}
+        self.llm_options = self._llm_options(llm, prompt_tokens)
+        if self.llm_options:
+            stream_kwargs["options"] = self.llm_options
+        
+        llm_start = time.perf_counter()
+        first_token_at = None
+        output_tokens = 0
+        for token in llm.stream(prompt, **stream_kwargs):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                self.timings['time_to_first_token'] = first_token_at - self._start
+            output_tokens += 1
+            self.result += token
+            yield token
+        
+        end = time.perf_counter()
+        self.timings['total_time'] = end - self._start
+        self.trace.add("llm_prefill", (first_token_at or end) - llm_start)
+        self.trace.add("llm_decode", end - (first_token_at or end))
+        self.trace.count("output_tokens", output_tokens)
+    
+    def as_response(self):
+        """คืนผลลัพธ์ในรูปแบบเดียวกับ get_answer"""
+        return {
+            'query': self.question,
+            'result': self.result,
+            'source_documents': self.source_documents or [],
+            'timings': self.timings,
+            'packing': self.packing,
+            'llm_options': self.llm_options
+        }
+
+
+def stream_answer(qa_chain, question, query_embedding=None, adaptive=False, trace=None):
+    """รับคำตอบจาก QA Chain แบบ streaming (วนลูปเพื่อรับ token)"""
+    return StreamingAnswer(qa_chain, question, query_embedding, adaptive=adaptive, trace=trace)
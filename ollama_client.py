@@ -0,0 +1,210 @@
+"""
+Shared Ollama Client Layer
+connection pool ของ HTTP ไป Ollama ที่ LLM และ embedding ทุกตัวใช้ร่วมกัน
+พร้อม keep_alive ให้ model อยู่ใน memory, warm-up model ตอนเริ่มแอพ และ probe สุขภาพ/latency
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+import httpx
+
+
+DEFAULT_BASE_URL = "http://localhost:11434"
+# เวลาที่ Ollama เก็บ model ไว้ใน memory หลัง request สุดท้าย (วินาที, -1 = ตลอดไป)
+DEFAULT_KEEP_ALIVE = int(os.environ.get("BORNZI_OLLAMA_KEEP_ALIVE", 30 * 60))
+POOL_MAX_CONNECTIONS = int(os.environ.get("BORNZI_OLLAMA_POOL_SIZE", 16))
+POOL_KEEPALIVE_EXPIRY = 60.0  # ปิด connection ที่ว่างนานเกินนี้ (วินาที)
+PROBE_TTL = 5.0               # ใช้ผล probe เดิมซ้ำภายในช่วงนี้ (วินาที)
+PROBE_TIMEOUT = 3.0
+WARM_UP_INPUT = "warm-up"
+
+
+class OllamaPool:
+    """
+    connection pool ต่อ Ollama server (หนึ่ง pool ต่อ base_url)
+
+    LangChain สร้าง httpx client ใหม่ทุกครั้งที่สร้าง OllamaLLM/OllamaEmbeddings
+    ซึ่งต้องโหลด SSL context และเปิด TCP connection ใหม่
+    pool นี้ให้ทุก instance ใช้ transport (connection ที่เปิดค้างไว้) และ SSL context ชุดเดียวกัน
+
+    warm_up() โหลด model เข้า memory ของ Ollama ใน background thread
+    probe() วัด latency ของ Ollama และดึงรายการ model ที่โหลดอยู่ (/api/ps)
+    """
+
+    def __init__(self, max_connections=POOL_MAX_CONNECTIONS, keep_alive=DEFAULT_KEEP_ALIVE):
+        self.max_connections = max_connections
+        self.keep_alive = keep_alive
+        self._ssl_context = None
+        self._transports = {}  # base_url -> httpx.HTTPTransport
+        self._clients = {}     # (base_url, timeout) -> ollama.Client, (base_url, "probe") -> httpx.Client
+        self._warm_ups = {}    # (base_url, model) -> สถานะการ warm-up
+        self._probes = {}      # base_url -> ผล probe ล่าสุด
+        self._lock = threading.Lock()
+
+    def ssl_context(self):
+        with self._lock:
+            if self._ssl_context is None:
+                self._ssl_context = httpx.create_ssl_context()
+            return self._ssl_context
+
+    def transport(self, base_url=DEFAULT_BASE_URL):
+        """httpx transport ที่แชร์กันของ base_url (thread-safe)"""
+        ssl_context = self.ssl_context()
+        with self._lock:
+            if base_url not in self._transports:
+                self._transports[base_url] = httpx.HTTPTransport(
+                    verify=ssl_context,
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                        keepalive_expiry=POOL_KEEPALIVE_EXPIRY
+                    )
+                )
+            return self._transports[base_url]
+
+    def langchain_kwargs(self, base_url=DEFAULT_BASE_URL):
+        """
+        kwargs สำหรับ OllamaLLM/OllamaEmbeddings ให้ใช้ pool นี้
+
+        sync client ใช้ transport ร่วมกัน ส่วน async client ผูกกับ event loop
+        จึงแชร์ได้เพียง SSL context
+        """
+        return {
+            "keep_alive": self.keep_alive,
+            "sync_client_kwargs": {"transport": self.transport(base_url)},
+            "async_client_kwargs": {"verify": self.ssl_context()},
+        }
+
+    def client(self, base_url=DEFAULT_BASE_URL, timeout=None):
+        """ollama.Client ที่ใช้ transport ของ pool (timeout=None = รอจนกว่า model จะโหลดเสร็จ)"""
+        import ollama  # pydantic models ของ ollama ใช้เวลา import ~0.5 วินาที
+        
+        transport = self.transport(base_url)
+        with self._lock:
+            key = (base_url, timeout)
+            if key not in self._clients:
+                self._clients[key] = ollama.Client(host=base_url, timeout=timeout, transport=transport)
+            return self._clients[key]
+
+    # ---------- warm-up ----------
+
+    def warm_up(self, embedding_models=(), llm_models=(), base_url=DEFAULT_BASE_URL):
+        """
+        โหลด model เข้า memory ของ Ollama ใน background thread
+
+        model ที่ warm-up แล้วหรือกำลัง warm-up อยู่จะถูกข้าม
+        จึงเรียกได้ทุก rerun ของ Streamlit
+
+        Returns:
+            thread ที่ทำ warm-up หรือ None ถ้าไม่มี model ใหม่
+        """
+        pending = []
+        with self._lock:
+            for kind, models in (("embedding", embedding_models), ("llm", llm_models)):
+                for model in models:
+                    key = (base_url, model)
+                    if key in self._warm_ups and self._warm_ups[key]['status'] != "error":
+                        continue
+                    self._warm_ups[key] = {'model': model, 'kind': kind, 'status': "loading",
+                                           'seconds': None, 'error': None}
+                    pending.append((kind, model))
+        if not pending:
+            return None
+
+        thread = threading.Thread(target=self._warm_up, args=(pending, base_url), daemon=True)
+        thread.start()
+        return thread
+
+    def _warm_up(self, pending, base_url):
+        client = self.client(base_url)
+        for kind, model in pending:
+            started = time.perf_counter()
+            try:
+                if kind == "embedding":
+                    client.embed(model, WARM_UP_INPUT, keep_alive=self.keep_alive)
+                else:
+                    # prompt ว่าง = ให้ Ollama โหลด model อย่างเดียว ไม่ generate
+                    client.generate(model, "", keep_alive=self.keep_alive)
+                update = {'status': "ready", 'seconds': time.perf_counter() - started}
+            except Exception as e:
+                update = {'status': "error", 'error': str(e)}
+            with self._lock:
+                self._warm_ups[(base_url, model)].update(update)
+
+    def warm_up_status(self, base_url=DEFAULT_BASE_URL):
+        """สถานะการ warm-up ของแต่ละ model [{model, kind, status, seconds, error}]"""
+        with self._lock:
+            return [dict(state) for (url, _), state in self._warm_ups.items() if url == base_url]
+
+    # ---------- health ----------
+
+    def _probe_client(self, base_url):
+        transport = self.transport(base_url)
+        with self._lock:
+            key = (base_url, "probe")
+            if key not in self._clients:
+                self._clients[key] = httpx.Client(base_url=base_url, transport=transport, timeout=PROBE_TIMEOUT)
+            return self._clients[key]
+
+    def probe(self, base_url=DEFAULT_BASE_URL, max_age=PROBE_TTL):
+        """
+        ตรวจสอบว่า Ollama ตอบได้ และ model ใดโหลดอยู่บ้าง
+
+        Returns:
+            dict: ok, latency_ms, models [{name, size_vram, expires_at}], error, checked_at
+        """
+        with self._lock:
+            cached = self._probes.get(base_url)
+        if cached is not None and time.time() - cached['checked_at'] < max_age:
+            return cached
+
+        started = time.perf_counter()
+        try:
+            # เรียก /api/ps ด้วย httpx โดยตรง ไม่ต้อง import ollama ตอนแสดงหน้าเว็บครั้งแรก
+            response = self._probe_client(base_url).get("/api/ps")
+            response.raise_for_status()
+            result = {
+                'ok': True,
+                'models': [
+                    {
+                        'name': model.get('model') or model.get('name'),
+                        'size_vram': model.get('size_vram'),
+                        'expires_at': _parse_time(model.get('expires_at'))
+                    }
+                    for model in response.json().get('models', [])
+                ],
+                'error': None
+            }
+        except Exception as e:
+            result = {'ok': False, 'models': [], 'error': str(e)}
+        result['latency_ms'] = (time.perf_counter() - started) * 1000
+        result['checked_at'] = time.time()
+
+        with self._lock:
+            self._probes[base_url] = result
+        return result
+
+
+def _parse_time(value):
+    """เวลาแบบ RFC 3339 ของ Ollama (ทศนิยมวินาทีถึง 9 หลัก) -> datetime"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_ollama_pool():
+    """OllamaPool ชุดเดียวต่อ process"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = OllamaPool()
+        return _pool
@@ -0,0 +1,119 @@
+"""
+Concurrent Batched Embeddings
+ส่ง chunks ไป Ollama เป็น batch และให้มีหลาย request ทำงานพร้อมกัน
+โดยผลลัพธ์ยังเรียงตามลำดับ chunk เดิม
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 3
+
+# จำนวน embedding request ที่ส่งไป Ollama พร้อมกันได้ทั้ง process
+# (รวมทุก session และทุก ingestion job) ป้องกันหลายงานยิง Ollama พร้อมกันจนคิวล้น
+OLLAMA_MAX_CONCURRENCY = int(os.environ.get("BORNZI_OLLAMA_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+_ollama_semaphore = threading.BoundedSemaphore(max(1, OLLAMA_MAX_CONCURRENCY))
+
+
+def ollama_slot():
+    """
+    semaphore กลางของ process สำหรับ request ไป Ollama
+
+    ใช้เป็น context manager: with ollama_slot(): ...
+    """
+    return _ollama_semaphore
+
+
+class ParallelEmbeddings(Embeddings):
+    """
+    Embeddings wrapper ที่แบ่ง texts เป็น batch แล้วส่งพร้อมกันหลาย request
+
+    Args:
+        embeddings: embeddings ตัวจริง (เช่น OllamaEmbeddings)
+        batch_size: จำนวน chunk ต่อ 1 request
+        max_concurrency: จำนวน request ที่ส่งค้างไว้พร้อมกันได้สูงสุด
+        max_retries: จำนวนครั้งที่ลองใหม่เมื่อ request ล้มเหลว
+        retry_backoff: เวลารอ (วินาที) ก่อนลองใหม่ครั้งแรก จะเพิ่มเป็นเท่าตัวทุกครั้ง
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        retry_backoff: float = 1.0
+    ):
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.requests = 0
+        self.retries = 0
+        self._lock = threading.Lock()  # _embed_batch ทำงานใน thread pool
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """embed 1 batch พร้อม retry แบบ exponential backoff"""
+        delay = self.retry_backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._lock:
+                    self.requests += 1
+                with ollama_slot():
+                    return self.embeddings.embed_documents(texts)
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                with self._lock:
+                    self.retries += 1
+                time.sleep(delay)
+                delay *= 2
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        batches = [
+            (start, texts[start:start + self.batch_size])
+            for start in range(0, len(texts), self.batch_size)
+        ]
+        if len(batches) <= 1 or self.max_concurrency == 1:
+            vectors = []
+            for _, batch in batches:
+                vectors.extend(self._embed_batch(batch))
+            return vectors
+
+        vectors = [None] * len(texts)
+        pending = iter(batches)
+
+        # backpressure: ส่ง request ค้างไว้ไม่เกิน max_concurrency
+        # แล้วค่อยส่ง batch ถัดไปเมื่อมี request ทำเสร็จ
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            in_flight = {}
+            for start, batch in pending:
+                in_flight[executor.submit(self._embed_batch, batch)] = start
+                if len(in_flight) >= self.max_concurrency:
+                    break
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start = in_flight.pop(future)
+                    # วาง vectors กลับตามตำแหน่งเดิมของ batch
+                    for offset, vector in enumerate(future.result()):
+                        vectors[start + offset] = vector
+
+                    next_batch = next(pending, None)
+                    if next_batch is not None:
+                        next_start, batch = next_batch
+                        in_flight[executor.submit(self._embed_batch, batch)] = next_start
+
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
@@ -1,17 +1,62 @@
 """
 PDF Processing and Vector Store Management
+
+faiss, pypdf และ langchain ถูก import ในฟังก์ชันที่ใช้ (ตอน Process PDF / โหลด index)
+ค่าคงที่และ ingest_params/file_fingerprint จึงใช้ได้ทันทีโดยไม่ทำให้หน้าเว็บเปิดช้า
 """
+import hashlib
+import itertools
 import os
+import shutil
 import tempfile
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from embeddings_config import EmbeddingFactory, get_recommended_model
+from tracing import NULL_TRACE
+
+
+DEFAULT_PAGES_PER_BATCH = 10
+
+# เปลี่ยนค่านี้เมื่อแก้วิธีแบ่ง chunks (get_dynamic_chunk_params / _create_text_splitter)
+# เพื่อไม่ให้ใช้ index ใน artifact cache ที่แบ่ง chunks ด้วยวิธีเดิม
+CHUNKING_VERSION = 2
+
+# วิธีแบ่ง chunks
+# thai      = ตัดตามย่อหน้า/ประโยค/คำ ตัด header/footer และ chunks ที่เกือบซ้ำ (ค่าเริ่มต้น)
+# recursive = RecursiveCharacterTextSplitter แบบเดิม (overlap สูง)
+SPLITTERS = ("thai", "recursive")
+DEFAULT_SPLITTER = "thai"
 
+# ชนิดของ FAISS index ที่รองรับ
+# flat  = exact search (ค่าเริ่มต้นเดิม)
+# hnsw  = graph search เร็วมาก แต่ใช้ memory มากกว่า flat เล็กน้อย
+# ivf   = แบ่ง cluster ค้นหาเฉพาะบาง cluster
+# ivfpq = ivf + product quantization ใช้ memory น้อยที่สุด (ค่าโดยประมาณ)
+# sq8   = scalar quantization 8-bit ใช้ memory 1/4 ของ flat
+INDEX_TYPES = ("auto", "flat", "hnsw", "ivf", "ivfpq", "sq8")
 
-def get_dynamic_chunk_params(total_chars, num_pages):
+
+def get_dynamic_chunk_params(total_chars, num_pages, splitter="recursive"):
     """คำนวณ chunk size แบบ dynamic - ใช้ chunk เล็กมากและ overlap สูงมากเพื่อไม่ให้ข้อมูลหาย"""
     
+    if splitter == "thai":
+        # ตัดที่ขอบเขตประโยค/คำเสมอ จึงไม่ต้องใช้ overlap สูงเพื่อกันประโยคขาด
+        if total_chars < 10000:
+            chunk_size, size_name = 400, "เล็ก"
+        elif total_chars < 50000:
+            chunk_size, size_name = 500, "กลาง"
+        else:
+            chunk_size, size_name = 600, "ใหญ่"
+        chunk_overlap = chunk_size // 5
+        return {
+            'splitter': splitter,
+            'chunk_size': chunk_size,
+            'chunk_overlap': chunk_overlap,
+            'info': f"📄 เอกสารขนาด{size_name} ({num_pages} หน้า) - chunk: {chunk_size}, overlap: {chunk_overlap} (20%, ตัดตามประโยค)"
+        }
+    
     # ลด chunk size และเพิ่ม overlap เพื่อให้ context ละเอียดและครอบคลุมมากขึ้น
     if total_chars < 10000:
         return {
@@ -33,49 +78,317 @@ def get_dynamic_chunk_params(total_chars, num_pages):
         }
 
 
-def process_pdf(uploaded_file, embedding_model, base_url="http://localhost:11434"):
+def select_index_type(num_chunks):
+    """เลือกชนิด index ตามจำนวน chunks"""
+    if num_chunks < 10000:
+        return "flat"
+    elif num_chunks < 50000:
+        return "hnsw"
+    elif num_chunks < 200000:
+        return "sq8"
+    else:
+        return "ivfpq"
+
+
+def build_faiss_index(vectors, index_type):
     """
-    ประมวลผล PDF และสร้าง Vector Store
+    สร้าง FAISS index จาก vectors (numpy float32, shape = [n, d])
+    
+    index ที่ต้อง train จะถอยกลับไปใช้ชนิดที่ง่ายกว่าถ้ามี vectors ไม่พอ (ivfpq -> ivf -> flat)
+    """
+    import faiss
+    
+    num_vectors, dim = vectors.shape
+    
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, 32)
+        index.hnsw.efConstruction = 80
+        index.hnsw.efSearch = 64
+    elif index_type == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+    elif index_type in ("ivf", "ivfpq"):
+        # FAISS แนะนำให้มี vectors อย่างน้อย 39 ตัวต่อ 1 centroid ตอน train
+        nlist = max(1, min(int(4 * np.sqrt(num_vectors)), num_vectors // 39))
+        if index_type == "ivfpq":
+            # codebook ของ PQ 8-bit มี 256 centroid และจำนวน sub-quantizer ต้องหาร dimension ลงตัว
+            if num_vectors < 39 * 256:
+                return build_faiss_index(vectors, "ivf")
+            m = next(m for m in (64, 48, 32, 16, 8, 4, 2, 1) if dim % m == 0 and (dim // m >= 8 or m == 1))
+            index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist, m, 8)
+        else:
+            if num_vectors < 39:
+                return build_faiss_index(vectors, "flat")
+            index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+        index.nprobe = min(nlist, max(8, nlist // 8))
+    else:
+        raise ValueError(f"ไม่รองรับ index '{index_type}'. ชนิดที่ใช้ได้: {list(INDEX_TYPES)}")
+    
+    if not index.is_trained:
+        # train จากตัวอย่างบางส่วนก็เพียงพอ ไม่ต้องใช้ทุก vector
+        sample_size = min(num_vectors, 64 * max(getattr(index, "nlist", 1), 256))
+        sample = vectors[np.random.default_rng(0).choice(num_vectors, size=sample_size, replace=False)]
+        index.train(sample)
+    index.add(vectors)
+    return index
+
+
+def _index_type_name(index):
+    """ชื่อชนิดของ index ที่สร้างจริง"""
+    import faiss
+    
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "ivf"
+    if isinstance(index, faiss.IndexHNSWFlat):
+        return "hnsw"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "sq8"
+    return "flat"
+
+
+def get_index_vectors(index):
+    """ดึง vectors ทั้งหมดออกจาก index (ค่าโดยประมาณสำหรับ index แบบ quantized)"""
+    if hasattr(index, "make_direct_map"):
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def rebuild_index(vectorstore, index_type):
+    """เปลี่ยนชนิด index ของ vectorstore โดยใช้ vectors เดิม (ไม่ต้อง embed ใหม่)"""
+    if index_type == "auto":
+        index_type = select_index_type(vectorstore.index.ntotal)
+    vectorstore.index = build_faiss_index(get_index_vectors(vectorstore.index), index_type)
+    return vectorstore
+
+
+def compare_index_types(vectorstore, index_types=("flat", "hnsw", "ivf", "ivfpq", "sq8"), num_queries=100, k=10):
+    """
+    เปรียบเทียบ recall@k, latency และขนาดของ index แต่ละชนิดกับ exact (flat) index
+    
+    ใช้ vectors ที่อยู่ใน index สุ่มมาเป็น query
     
     Returns:
-        dict: {
-            'vectorstore': FAISS vectorstore,
-            'num_pages': จำนวนหน้า,
-            'total_chars': จำนวนตัวอักษร,
-            'num_chunks': จำนวน chunks,
-            'recommended_model': model ที่แนะนำ
-        }
+        list ของ dict: {'index_type', 'recall', 'latency_ms', 'size_bytes', 'build_time'}
     """
+    import faiss
     
-    # บันทึกไฟล์ชั่วคราว
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-        tmp_file.write(uploaded_file.getvalue())
-        tmp_file_path = tmp_file.name
+    vectors = get_index_vectors(vectorstore.index)
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)]
+    k = min(k, len(vectors))
     
-    try:
-        # โหลด PDF
-        loader = PyPDFLoader(tmp_file_path)
-        documents = loader.load()
-        
-        # คำนวณขนาด
-        total_chars = sum(len(doc.page_content) for doc in documents)
-        num_pages = len(documents)
+    exact = build_faiss_index(vectors, "flat")
+    _, truth = exact.search(queries, k)
+    
+    report = []
+    for index_type in index_types:
+        start = time.perf_counter()
+        index = build_faiss_index(vectors, index_type)
+        build_time = time.perf_counter() - start
         
-        # แนะนำ model
-        recommended_model = get_recommended_model(total_chars)
+        start = time.perf_counter()
+        _, found = index.search(queries, k)
+        latency = (time.perf_counter() - start) / len(queries)
         
-        # Dynamic chunk size
-        chunk_params = get_dynamic_chunk_params(total_chars, num_pages)
+        recall = np.mean([
+            len(set(found[i]) & set(truth[i])) / k for i in range(len(queries))
+        ])
+        report.append({
+            'index_type': _index_type_name(index),
+            'recall': float(recall),
+            'latency_ms': latency * 1000,
+            'size_bytes': len(faiss.serialize_index(index)),
+            'build_time': build_time
+        })
+    return report
+
+
+def ingest_params(pages_per_batch=DEFAULT_PAGES_PER_BATCH, index_type="auto", splitter=DEFAULT_SPLITTER):
+    """
+    ค่าการประมวลผลที่มีผลต่อ index ที่ได้ ใช้เป็นส่วนหนึ่งของ key ใน artifact cache
+
+    chunk size/overlap คำนวณจากเนื้อหาของกลุ่มหน้าแรก จึงขึ้นกับ pages_per_batch
+    """
+    return {
+        'chunking_version': CHUNKING_VERSION,
+        'pages_per_batch': pages_per_batch,
+        'index_type': index_type,
+        'splitter': splitter
+    }
+
+
+def file_fingerprint(uploaded_file):
+    """hash ของเนื้อหาไฟล์ (sha256) ใช้ระบุเอกสารโดยไม่ขึ้นกับชื่อไฟล์"""
+    digest = hashlib.sha256()
+    uploaded_file.seek(0)
+    for block in iter(lambda: uploaded_file.read(1024 * 1024), b""):
+        digest.update(block)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def _write_temp_pdf(uploaded_file):
+    """คัดลอกไฟล์ที่อัพโหลดลงไฟล์ชั่วคราวทีละส่วน โดยไม่ดึงทั้งไฟล์เข้า memory"""
+    uploaded_file.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
+        shutil.copyfileobj(uploaded_file, tmp_file, length=1024 * 1024)
+        return tmp_file.name
+
+
+def _create_text_splitter(chunk_params):
+    """แบ่งข้อความ - ใช้ chunk เล็กและ overlap สูงมากเพื่อความครอบคลุม"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from thai_splitter import ThaiTextSplitter
+    
+    if chunk_params.get('splitter') == "thai":
+        return ThaiTextSplitter(chunk_params['chunk_size'], chunk_params['chunk_overlap'])
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_params['chunk_size'],
+        chunk_overlap=chunk_params['chunk_overlap'],
+        length_function=len,
+        separators=["\n\n", "\n", " ", ""],  # ไม่ใช้ . เพื่อไม่ให้ตัดประโยค
+        keep_separator=True,  # เก็บ separator เพื่อรักษาโครงสร้าง
+        add_start_index=True  # เก็บตำแหน่งในหน้า ใช้รวม chunks ที่ซ้อนกันตอนสร้าง prompt
+    )
+
+
+def _extract_pages(reader, pdf_path, start, end):
+    """
+    Document ของหน้า [start, end)
+    
+    ทุกเส้นทาง (thread เดียว, หลาย process, ทำต่อจาก checkpoint) ใช้ฟังก์ชันนี้
+    ข้อความและ metadata จึงเหมือนกันไม่ว่าจะใช้ worker กี่ตัว (รูปแบบเดียวกับ PyPDFLoader เดิม)
+    """
+    from langchain_core.documents import Document
+    
+    total_pages = len(reader.pages)
+    page_labels = reader.page_labels
+    return [
+        Document(
+            page_content=reader.pages[i].extract_text().strip(),
+            metadata={'source': pdf_path, 'total_pages': total_pages, 'page': i, 'page_label': page_labels[i]}
+        )
+        for i in range(start, end)
+    ]
+
+
+def _extract_page_range(pdf_path, start, end):
+    """extract ข้อความของหน้า [start, end) - ทำงานใน worker process"""
+    from pypdf import PdfReader
+    
+    return _extract_pages(PdfReader(pdf_path), pdf_path, start, end)
+
+
+def _iter_page_batches_parallel(pdf_path, num_pages, pages_per_batch, num_workers, start_page=0):
+    """
+    extract ข้อความแบบแบ่งช่วงหน้าให้หลาย process ทำพร้อมกัน แล้วส่งออกตามลำดับหน้า
+    
+    ส่งงานล่วงหน้าไม่เกิน 2 เท่าของจำนวน worker เพื่อไม่ให้ข้อความค้างใน memory
+    ถ้าขั้นตอน embed ช้ากว่าการ extract
+    """
+    ranges = iter([
+        (start, min(start + pages_per_batch, num_pages))
+        for start in range(start_page, num_pages, pages_per_batch)
+    ])
+    
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        pending = deque()
+        for start, end in itertools.islice(ranges, num_workers * 2):
+            pending.append(executor.submit(_extract_page_range, pdf_path, start, end))
         
-        # แบ่งข้อความ - ใช้ chunk เล็กและ overlap สูงมากเพื่อความครอบคลุม
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_params['chunk_size'],
-            chunk_overlap=chunk_params['chunk_overlap'],
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""],  # ไม่ใช้ . เพื่อไม่ให้ตัดประโยค
-            keep_separator=True  # เก็บ separator เพื่อรักษาโครงสร้าง
+        while pending:
+            pages = pending.popleft().result()
+            next_range = next(ranges, None)
+            if next_range is not None:
+                pending.append(executor.submit(_extract_page_range, pdf_path, *next_range))
+            yield pages
+
+
+def _iter_page_batches(pdf_path, pages_per_batch, num_pages=None, extraction_workers=1, start_page=0):
+    """
+    อ่าน PDF ทีละหน้าแบบ lazy แล้วรวมเป็นกลุ่มละ pages_per_batch หน้า
+    
+    start_page > 0 ใช้ต่องานที่ถูกขัดจังหวะ (ไม่ต้อง extract หน้าที่ประมวลผลแล้วซ้ำ)
+    """
+    if extraction_workers > 1 and num_pages:
+        yield from _iter_page_batches_parallel(
+            pdf_path, num_pages, pages_per_batch, extraction_workers, start_page
         )
-        texts = text_splitter.split_documents(documents)
+        return
+    
+    from pypdf import PdfReader
+    
+    reader = PdfReader(pdf_path)
+    num_pages = len(reader.pages)
+    for start in range(start_page, num_pages, pages_per_batch):
+        yield _extract_pages(reader, pdf_path, start, min(start + pages_per_batch, num_pages))
+
+
+def ingest_pdf_stream(
+    uploaded_file,
+    embedding_model,
+    base_url="http://localhost:11434",
+    use_cache=True,
+    batch_size=None,
+    max_concurrency=None,
+    pages_per_batch=DEFAULT_PAGES_PER_BATCH,
+    extraction_workers=1,
+    index_type="auto",
+    compare_indexes=False,
+    trace=None,
+    resume=None,
+    splitter=DEFAULT_SPLITTER
+):
+    """
+    ประมวลผล PDF แบบ streaming: อ่าน -> แบ่ง -> embed -> เพิ่มเข้า index ทีละกลุ่มหน้า
+    
+    ใน memory มีเพียงหน้าของกลุ่มปัจจุบันและ index ที่สร้างไปแล้วเท่านั้น
+    vectorstore ที่ yield ออกมาระหว่างทางใช้ถามคำถามจากหน้าที่ประมวลผลแล้วได้ทันที
+    
+    extraction_workers > 1 จะแบ่งช่วงหน้าให้ process pool extract ข้อความพร้อมกัน
+    (pypdf ใช้ CPU ล้วน จึงได้ประโยชน์จากหลาย core สำหรับเอกสารหลายร้อยหน้า)
+    
+    ระหว่างประมวลผลใช้ flat index เสมอ เมื่อครบทุกหน้าแล้วจึงแปลงเป็น index_type
+    ("auto" = เลือกตามจำนวน chunks) เพราะ ivf/pq ต้องใช้ vectors ทั้งหมดในการ train
+    
+    splitter="thai" ตัด header/footer และ chunks ที่เกือบซ้ำก่อน embed (ดู thai_splitter)
+    จำนวนที่ตัดได้อยู่ใน 'split_stats' ของผลลัพธ์
+    
+    trace (tracing.Trace) จะได้เวลาของขั้นตอน write_temp, extract, split, embed,
+    index_add, index_build และตัวนับ pages, chunks, chars, cache_hits, cache_misses,
+    duplicate_chunks, boilerplate_lines
+    
+    resume ใช้ต่องานจาก checkpoint: {'vectorstore', 'pages_done', 'chunks_done',
+    'total_chars', 'chunk_params', 'splitter_state'} (ค่าเดียวกับที่ได้จาก progress dict ของรอบก่อน)
+    vectorstore ต้องเป็น flat index ที่แก้ไขได้
+    
+    Yields:
+        dict: ความคืบหน้า {
+            'done': ประมวลผลครบทุกหน้าแล้วหรือยัง,
+            'pages_done', 'num_pages', 'chunks_done',
+            'elapsed', 'pages_per_sec', 'chunks_per_sec',
+            'vectorstore': index ของหน้าที่ประมวลผลแล้ว (None ถ้ายังไม่มี chunk),
+            'total_chars', 'chunk_params', 'splitter_state': ใช้บันทึก checkpoint
+        }
+        รายการสุดท้าย (done=True) มีข้อมูลเดียวกับผลลัพธ์ของ process_pdf
+    """
+    
+    from langchain_community.vectorstores import FAISS
+    from pypdf import PdfReader
+    from embedding_cache import CachedEmbeddings, get_embedding_cache
+    from parallel_embeddings import ParallelEmbeddings, DEFAULT_BATCH_SIZE, DEFAULT_MAX_CONCURRENCY
+    
+    trace = trace or NULL_TRACE
+    with trace.span("write_temp"):
+        tmp_file_path = _write_temp_pdf(uploaded_file)
+    
+    try:
+        # นับจำนวนหน้าจากโครงสร้างไฟล์ ไม่ต้อง extract ข้อความ
+        with trace.span("extract"):
+            num_pages = len(PdfReader(tmp_file_path).pages)
         
         # สร้าง Embeddings
         embeddings = EmbeddingFactory.create_embeddings(
@@ -83,16 +396,148 @@ def process_pdf(uploaded_file, embedding_model, base_url="http://localhost:11434
             base_url=base_url
         )
         
-        # สร้าง Vector Store
-        vectorstore = FAISS.from_documents(texts, embeddings)
+        # ส่งเป็น batch และหลาย request พร้อมกัน แทนการส่งทีละ chunk
+        embeddings = ParallelEmbeddings(
+            embeddings,
+            batch_size=batch_size or DEFAULT_BATCH_SIZE,
+            max_concurrency=max_concurrency or DEFAULT_MAX_CONCURRENCY
+        )
         
-        return {
-            'vectorstore': vectorstore,
+        # ตรวจสอบ cache ก่อนเรียก Ollama - chunk ที่เคย embed แล้วไม่ต้อง embed ซ้ำ
+        if use_cache:
+            cache = get_embedding_cache()
+            embeddings = CachedEmbeddings(embeddings, embedding_model, cache)
+        
+        vectorstore = None
+        text_splitter = None
+        chunk_params = None
+        total_chars = 0
+        pages_done = 0
+        chunks_done = 0
+        if resume is not None:
+            vectorstore = resume['vectorstore']
+            chunk_params = resume['chunk_params']
+            text_splitter = _create_text_splitter(chunk_params)
+            if hasattr(text_splitter, 'load_state'):
+                # header/footer และ chunks ที่เคยเห็นของหน้าก่อน checkpoint
+                docstore = vectorstore.docstore
+                text_splitter.load_state(resume.get('splitter_state'), (
+                    docstore.search(doc_id).page_content
+                    for doc_id in vectorstore.index_to_docstore_id.values()
+                ))
+            total_chars = resume['total_chars']
+            pages_done = resume['pages_done']
+            chunks_done = resume['chunks_done']
+        start_pages, start_chunks = pages_done, chunks_done
+        start_time = time.perf_counter()
+        
+        page_batches = _iter_page_batches(
+            tmp_file_path, pages_per_batch, num_pages, extraction_workers, start_page=pages_done
+        )
+        while True:
+            # เวลาที่รอข้อความของกลุ่มหน้าถัดไป (extract ใน process อื่นอาจทำเสร็จไปก่อนแล้ว)
+            with trace.span("extract"):
+                pages = next(page_batches, None)
+            if pages is None:
+                break
+            
+            total_chars += sum(len(page.page_content) for page in pages)
+            pages_done += len(pages)
+            
+            # Dynamic chunk size - ประมาณขนาดเอกสารจากค่าเฉลี่ยของกลุ่มหน้าแรก
+            if text_splitter is None:
+                estimated_chars = total_chars * num_pages // max(pages_done, 1)
+                chunk_params = get_dynamic_chunk_params(estimated_chars, num_pages, splitter)
+                text_splitter = _create_text_splitter(chunk_params)
+            
+            with trace.span("split"):
+                texts = text_splitter.split_documents(pages)
+            trace.count("pages", len(pages))
+            trace.count("chunks", len(texts))
+            
+            # เพิ่ม chunks ของกลุ่มนี้เข้า index (embed แยกจากการเพิ่มเข้า FAISS เพื่อจับเวลาแยกกัน)
+            if texts:
+                with trace.span("embed"):
+                    vectors = embeddings.embed_documents([text.page_content for text in texts])
+                text_embeddings = list(zip((text.page_content for text in texts), vectors))
+                metadatas = [text.metadata for text in texts]
+                with trace.span("index_add"):
+                    if vectorstore is None:
+                        vectorstore = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas)
+                    else:
+                        vectorstore.add_embeddings(text_embeddings, metadatas=metadatas)
+                chunks_done += len(texts)
+            
+            elapsed = time.perf_counter() - start_time
+            yield {
+                'done': False,
+                'pages_done': pages_done,
+                'num_pages': num_pages,
+                'chunks_done': chunks_done,
+                'elapsed': elapsed,
+                'pages_per_sec': (pages_done - start_pages) / elapsed if elapsed else 0.0,
+                'chunks_per_sec': (chunks_done - start_chunks) / elapsed if elapsed else 0.0,
+                'vectorstore': vectorstore,
+                'total_chars': total_chars,
+                'chunk_params': chunk_params,
+                'splitter_state': text_splitter.state() if hasattr(text_splitter, 'state') else None
+            }
+        
+        if vectorstore is None:
+            raise ValueError("ไม่พบข้อความใน PDF (อาจเป็นไฟล์สแกนที่ยังไม่ได้ทำ OCR)")
+        
+        # เปรียบเทียบ recall/latency ก่อนแปลง index (ใช้ flat index เป็นค่าอ้างอิง)
+        index_report = None
+        if compare_indexes:
+            with trace.span("compare_indexes"):
+                index_report = compare_index_types(vectorstore)
+        
+        if index_type == "auto":
+            index_type = select_index_type(chunks_done)
+        if index_type != "flat":
+            with trace.span("index_build"):
+                rebuild_index(vectorstore, index_type)
+            index_type = _index_type_name(vectorstore.index)  # อาจถอยกลับถ้า vectors น้อยเกินไป
+        
+        cache_stats = None
+        if use_cache:
+            cache_stats = cache.stats()
+            # hit/miss ของงานนี้เท่านั้น (cache ใช้ร่วมกับงานอื่นที่ทำพร้อมกัน)
+            cache_stats['hits'] = embeddings.hits
+            cache_stats['misses'] = embeddings.misses
+            lookups = cache_stats['hits'] + cache_stats['misses']
+            cache_stats['hit_rate'] = cache_stats['hits'] / lookups if lookups else 0.0
+            trace.count("cache_hits", cache_stats['hits'])
+            trace.count("cache_misses", cache_stats['misses'])
+        trace.count("chars", total_chars)
+        
+        split_stats = getattr(text_splitter, 'stats', None)
+        if split_stats is not None:
+            split_stats = dict(split_stats, dedup_ratio=text_splitter.dedup_ratio())
+            trace.count("duplicate_chunks", split_stats['duplicate_chunks'])
+            trace.count("boilerplate_lines", split_stats['boilerplate_lines'])
+        
+        elapsed = time.perf_counter() - start_time
+        yield {
+            'done': True,
+            'pages_done': pages_done,
             'num_pages': num_pages,
+            'chunks_done': chunks_done,
+            'elapsed': elapsed,
+            'pages_per_sec': (pages_done - start_pages) / elapsed if elapsed else 0.0,
+            'chunks_per_sec': (chunks_done - start_chunks) / elapsed if elapsed else 0.0,
+            'vectorstore': vectorstore,
             'total_chars': total_chars,
-            'num_chunks': len(texts),
-            'recommended_model': recommended_model,
-            'chunk_info': chunk_params['info']
+            'chunk_params': chunk_params,
+            'num_chunks': chunks_done,
+            'recommended_model': get_recommended_model(total_chars),
+            'chunk_info': chunk_params['info'],
+            'chunk_size': chunk_params['chunk_size'],
+            'chunk_overlap': chunk_params['chunk_overlap'],
+            'cache_stats': cache_stats,
+            'split_stats': split_stats,
+            'index_type': index_type,
+            'index_report': index_report
         }
         
     finally:
@@ -100,21 +545,98 @@ def process_pdf(uploaded_file, embedding_model, base_url="http://localhost:11434
         os.unlink(tmp_file_path)
 
 
-def load_vectorstore(vectorstore_path, embedding_model, base_url="http://localhost:11434"):
-    """โหลด Vector Store จากไฟล์"""
+def process_pdf(
+    uploaded_file,
+    embedding_model,
+    base_url="http://localhost:11434",
+    use_cache=True,
+    batch_size=None,
+    max_concurrency=None,
+    pages_per_batch=DEFAULT_PAGES_PER_BATCH,
+    extraction_workers=1,
+    index_type="auto",
+    compare_indexes=False,
+    progress_callback=None,
+    trace=None,
+    resume=None,
+    splitter=DEFAULT_SPLITTER
+):
+    """
+    ประมวลผล PDF และสร้าง Vector Store
+    
+    Args:
+        use_cache: ใช้ embedding cache บนดิสก์ (embed เฉพาะ chunk ที่ยังไม่เคย embed)
+        batch_size: จำนวน chunk ต่อ 1 request ที่ส่งไป Ollama (None = DEFAULT_BATCH_SIZE ของ parallel_embeddings)
+        max_concurrency: จำนวน request ที่ส่งไป Ollama พร้อมกันได้สูงสุด (None = DEFAULT_MAX_CONCURRENCY)
+        pages_per_batch: จำนวนหน้าที่อ่านและ embed ต่อรอบ (จำกัดการใช้ memory)
+        extraction_workers: จำนวน process ที่ใช้ extract ข้อความ (1 = extract ใน thread เดียว)
+        index_type: ชนิดของ FAISS index (ดู INDEX_TYPES) "auto" = เลือกตามจำนวน chunks
+        compare_indexes: วัด recall/latency ของ index ทุกชนิดเทียบกับ exact index
+        progress_callback: ฟังก์ชันที่รับ dict ความคืบหน้าหลังแต่ละรอบ (ดู ingest_pdf_stream)
+        trace: tracing.Trace สำหรับจับเวลาแต่ละขั้นตอน (ไม่ระบุ = ไม่จับเวลา)
+        resume: ต่องานจาก checkpoint (ดู ingest_pdf_stream)
+        splitter: วิธีแบ่ง chunks (ดู SPLITTERS)
+    
+    Returns:
+        dict: {
+            'vectorstore': FAISS vectorstore,
+            'num_pages': จำนวนหน้า,
+            'total_chars': จำนวนตัวอักษร,
+            'num_chunks': จำนวน chunks,
+            'recommended_model': model ที่แนะนำ,
+            'cache_stats': สถิติ hit/miss ของ embedding cache (None ถ้าไม่ใช้ cache),
+            'split_stats': จำนวน chunks ที่ตัดเพราะซ้ำ/บรรทัด header-footer ที่ตัด (None ถ้าใช้ recursive),
+            'index_type': ชนิด index ที่ใช้,
+            'index_report': ผลเปรียบเทียบ index (None ถ้า compare_indexes=False)
+        }
+    """
+    
+    for progress in ingest_pdf_stream(
+        uploaded_file,
+        embedding_model,
+        base_url=base_url,
+        use_cache=use_cache,
+        batch_size=batch_size,
+        max_concurrency=max_concurrency,
+        pages_per_batch=pages_per_batch,
+        extraction_workers=extraction_workers,
+        index_type=index_type,
+        compare_indexes=compare_indexes,
+        trace=trace,
+        resume=resume,
+        splitter=splitter
+    ):
+        if progress_callback is not None:
+            progress_callback(progress)
+    
+    return progress
+
+
+def load_vectorstore(vectorstore_path, embedding_model, base_url="http://localhost:11434", mmap_index=True):
+    """
+    โหลด Vector Store จากไฟล์ (รูปแบบ native ไม่ใช้ pickle ดู vector_store_format)
+    
+    Args:
+        mmap_index: อ่าน index แบบ memory-map (อ่านอย่างเดียว) ใช้ False ถ้าจะเพิ่ม/ลบ chunks
+    """
+    from vector_store_format import is_legacy_store, load_store
+    
+    if is_legacy_store(vectorstore_path):
+        raise ValueError(
+            f"'{vectorstore_path}' เป็น cache รูปแบบเดิม (pickle) "
+            f"กรุณาแปลงก่อนด้วย: python vector_store_format.py convert {vectorstore_path}"
+        )
     
     embeddings = EmbeddingFactory.create_embeddings(
         model_name=embedding_model,
         base_url=base_url
     )
     
-    return FAISS.load_local(
-        vectorstore_path,
-        embeddings,
-        allow_dangerous_deserialization=True
-    )
+    return load_store(vectorstore_path, embeddings, mmap_index=mmap_index)
 
 
 def save_vectorstore(vectorstore, vectorstore_path):
     """บันทึก Vector Store ลงไฟล์"""
-    vectorstore.save_local(vectorstore_path)
+    from vector_store_format import save_store
+    
+    save_store(vectorstore, vectorstore_path)
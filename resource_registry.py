@@ -0,0 +1,245 @@
+"""
+Process-wide Resource Registry
+เก็บ LLM clients, QA chains และ vector stores ไว้ชุดเดียวต่อ process
+ให้ทุก rerun และทุก session ที่ใช้เอกสาร/model เดียวกันใช้ของชิ้นเดียวกัน
+"""
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+from llm_config import create_llm, create_qa_chain
+from pdf_processor import load_vectorstore
+
+
+DEFAULT_MAX_BYTES = int(os.environ.get("BORNZI_REGISTRY_MAX_BYTES", 8 * 1024 ** 3))  # 8 GB
+
+
+def estimate_vectorstore_bytes(vectorstore):
+    """ประมาณขนาด memory ของ FAISS vectorstore (vectors + ข้อความของ chunks)"""
+    index = vectorstore.index
+    total = index.ntotal * index.d * 4
+    docstore = vectorstore.docstore
+    if hasattr(docstore, "size_bytes"):
+        return total + docstore.size_bytes()  # LazyDocstore (รูปแบบ native)
+    for doc in getattr(docstore, "_dict", {}).values():
+        total += len(doc.page_content.encode("utf-8"))
+    return total
+
+
+class ResourceRegistry:
+    """
+    LRU registry ที่จำกัดขนาด memory รวม
+
+    แต่ละรายการมี key, ขนาดโดยประมาณ และ parent (ถ้ามี)
+    เมื่อ parent ถูก evict รายการลูก (เช่น QA chain ที่อ้างถึง vectorstore) จะถูก evict ด้วย
+
+    max_bytes เป็นขีดจำกัดแบบ soft: รายการที่ถูก evict แต่ session ยังถืออยู่ (เช่น vectorstore
+    ใน st.session_state) ยังอยู่ใน memory จนกว่าจะไม่มีใครใช้ รายการเหล่านี้ถูกจำไว้ด้วย weakref
+    ถ้ามีการขอ key เดิมอีกจะได้ของชิ้นเดิมกลับมา แทนการโหลดสำเนาที่สอง
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, size, parent)
+        self._lock = threading.RLock()
+        self._key_locks = {}
+        self._evicted = weakref.WeakValueDictionary()  # key -> ค่าที่ถูก evict แต่ยังมีผู้ใช้อยู่
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get_or_create(self, key, factory, size_fn=None, parent=None):
+        """
+        คืนค่าที่เก็บไว้ของ key หรือสร้างใหม่ด้วย factory()
+
+        ถ้าหลาย session ขอ key เดียวกันพร้อมกัน จะสร้างเพียงครั้งเดียว
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+
+        with self._key_lock(key):
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key][0]
+                value = self._evicted.pop(key, None)
+                revived = value is not None and (parent is None or parent in self._entries)
+
+            if not revived:
+                value = factory()
+            with self._lock:
+                self.put(key, value, size_fn(value) if size_fn else 0, parent)
+                if revived:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            return value
+
+    def put(self, key, value, size=0, parent=None):
+        """เพิ่มรายการแล้ว evict รายการที่ใช้ล่าสุดนานที่สุดจนไม่เกิน max_bytes"""
+        with self._lock:
+            self._entries[key] = (value, size, parent)
+            self._entries.move_to_end(key)
+
+            for victim in list(self._entries):
+                if self.total_bytes() <= self.max_bytes:
+                    break
+                if victim != key:
+                    self.evict(victim, keep_alive=True)
+
+    def evict(self, key, keep_alive=False):
+        """
+        ลบรายการและรายการลูกทั้งหมดที่อ้างถึงรายการนี้
+
+        Args:
+            keep_alive: ถ้าค่ายังถูกใช้อยู่ที่อื่น ให้ get_or_create คืนค่าเดิมแทนการสร้างใหม่
+                        (ใช้กับการ evict ตามขนาด ไม่ใช้กับค่าที่ไม่ถูกต้องแล้ว)
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            self._evicted.pop(key, None)
+            if entry is None:
+                return
+            if keep_alive:
+                try:
+                    self._evicted[key] = entry[0]
+                except TypeError:
+                    pass  # ค่าชนิดนี้อ้างถึงด้วย weakref ไม่ได้
+            self._key_locks.pop(key, None)
+            self.evictions += 1
+            for child, (_, _, parent) in list(self._entries.items()):
+                if parent == key:
+                    self.evict(child, keep_alive=keep_alive)
+
+    def find_key(self, value):
+        """หา key ของค่าที่เก็บไว้ (เทียบด้วย identity)"""
+        with self._lock:
+            for key, (stored, _, _) in self._entries.items():
+                if stored is value:
+                    return key
+        return None
+
+    def invalidate(self, predicate):
+        """ลบทุกรายการที่ predicate(key) เป็นจริง"""
+        with self._lock:
+            for key in list(self._entries):
+                if key in self._entries and predicate(key):
+                    self.evict(key)
+            for key in [key for key in list(self._evicted.keys()) if predicate(key)]:
+                self._evicted.pop(key, None)
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(size for _, size, _ in self._entries.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'size_bytes': self.total_bytes(),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+_registry = ResourceRegistry()
+
+
+def get_registry():
+    """คืน ResourceRegistry ที่ใช้ร่วมกันทั้ง process"""
+    return _registry
+
+
+def _vectorstore_key(fingerprint, embedding_model, base_url, vectorstore_path=None):
+    # เอกสารเดียวกันมีได้หลาย artifact (index_type/splitter ต่างกัน) จึงแยกตาม path ของ artifact
+    path = os.path.abspath(vectorstore_path) if vectorstore_path else None
+    return ('vectorstore', embedding_model, base_url, fingerprint, path)
+
+
+def get_llm(model, base_url="http://localhost:11434"):
+    """LLM client ที่ใช้ร่วมกันต่อ (model, base_url)"""
+    return _registry.get_or_create(
+        ('llm', model, base_url),
+        lambda: create_llm(model, base_url)
+    )
+
+
+def register_vectorstore(vectorstore, fingerprint, embedding_model, base_url="http://localhost:11434",
+                         vectorstore_path=None):
+    """
+    ลงทะเบียน vectorstore ที่เพิ่งสร้าง คืน instance ที่ใช้ร่วมกัน
+
+    ถ้ามี session อื่นลงทะเบียน artifact เดียวกันไว้แล้ว จะคืนของเดิมแทน
+    """
+    return _registry.get_or_create(
+        _vectorstore_key(fingerprint, embedding_model, base_url, vectorstore_path),
+        lambda: vectorstore,
+        size_fn=estimate_vectorstore_bytes
+    )
+
+
+def get_vectorstore(vectorstore_path, fingerprint, embedding_model, base_url="http://localhost:11434"):
+    """โหลด vectorstore จากดิสก์เพียงครั้งเดียวต่อ artifact (เอกสาร, embedding model, พารามิเตอร์)"""
+    return _registry.get_or_create(
+        _vectorstore_key(fingerprint, embedding_model, base_url, vectorstore_path),
+        lambda: load_vectorstore(vectorstore_path, embedding_model, base_url),
+        size_fn=estimate_vectorstore_bytes
+    )
+
+
+def get_qa_chain(vectorstore, fingerprint, llm_model, base_url="http://localhost:11434", search_kwargs=None):
+    """
+    QA chain ที่ใช้ร่วมกันต่อ (model, base_url, เอกสาร)
+
+    chain จะถูกเก็บเฉพาะเมื่อ vectorstore อยู่ใน registry และถูก evict ไปพร้อมกับ vectorstore
+    index ที่ยังประมวลผลไม่ครบ (ไม่ได้ลงทะเบียน) จะได้ chain ใหม่ทุกครั้ง
+    """
+    llm = get_llm(llm_model, base_url)
+    parent = _registry.find_key(vectorstore)
+    if parent is None:
+        return create_qa_chain(vectorstore, llm_model, base_url, llm=llm, search_kwargs=search_kwargs)
+
+    return _registry.get_or_create(
+        ('qa_chain', llm_model, base_url, fingerprint, parent, repr(search_kwargs)),
+        lambda: create_qa_chain(vectorstore, llm_model, base_url, llm=llm, search_kwargs=search_kwargs),
+        parent=parent
+    )
+
+
+def register_corpus(corpus):
+    """
+    ลงทะเบียน vectorstore ของ corpus คืน vectorstore นั้น
+
+    เรียก invalidate_document(corpus_key(...)) หลังเพิ่ม/ลบเอกสาร เพื่อคำนวณขนาดใหม่
+    และ evict QA chains เดิมของ corpus
+    """
+    key = _vectorstore_key(corpus_key(corpus.embedding_model), corpus.embedding_model, corpus.base_url)
+    if _registry.find_key(corpus.vectorstore) != key:
+        _registry.evict(key)
+    return _registry.get_or_create(key, lambda: corpus.vectorstore, size_fn=estimate_vectorstore_bytes)
+
+
+def vectorstore_path(vectorstore):
+    """path ของ artifact ที่ vectorstore ถูกโหลดมา (None ถ้าไม่ได้โหลดผ่าน get_vectorstore)"""
+    key = _registry.find_key(vectorstore)
+    return key[4] if key is not None and key[0] == 'vectorstore' else None
+
+
+def corpus_key(embedding_model):
+    return f"corpus:{embedding_model}"
+
+
+def invalidate_document(fingerprint):
+    """ลบทุกอย่างที่เกี่ยวกับเอกสาร (เรียกเมื่อ Process เอกสารใหม่)"""
+    _registry.invalidate(lambda key: fingerprint in key)
@@ -7,11 +7,28 @@ import streamlit as st
 import os
 
 # Import custom modules
-from embeddings_config import EmbeddingFactory
-from pdf_processor import process_pdf, load_vectorstore, save_vectorstore
+from embeddings_config import DEFAULT_EMBEDDING_MODEL
+from pdf_processor import file_fingerprint, ingest_params, DEFAULT_SPLITTER
 # from llm_config import create_qa_chain, get_answer
-from llm_config import create_qa_chain, get_answer
-from ui_components import render_sidebar, render_controls, render_instructions, display_source_documents
+from llm_config import stream_answer, DEFAULT_LLM_MODEL
+from answer_cache import cache_model, get_answer_cache
+from conversation import Conversation
+from artifact_cache import get_artifact_cache
+from ingest_jobs import get_job_manager
+from resource_registry import get_vectorstore, get_qa_chain, vectorstore_path
+from ui_components import (
+    render_sidebar, render_controls, render_instructions, display_source_documents,
+    render_corpus_panel, display_trace, render_ingest_job, render_job_queue, render_ollama_status
+)
+from corpus_index import get_corpus
+from tracing import Trace, get_metrics_sink
+from ollama_client import get_ollama_pool
+from cold_start import STARTUP_MODE, preload, start_preload
+
+# module ข้างบนไม่ import langchain/FAISS/pypdf ตอนโหลด (import เมื่อใช้งานจริง)
+# BORNZI_STARTUP_MODE=eager: import ทั้งหมดก่อนแสดงหน้าเว็บแบบเดิม
+if STARTUP_MODE == "eager":
+    preload()
 
 
 # ตั้งค่า Page
@@ -28,36 +45,126 @@ if 'pdf_processed' not in st.session_state:
     st.session_state.pdf_processed = False
 if 'current_pdf_name' not in st.session_state:
     st.session_state.current_pdf_name = None
+if 'doc_fingerprint' not in st.session_state:
+    st.session_state.doc_fingerprint = None  # hash ของ PDF ปัจจุบัน ใช้แชร์ index/chain ข้าม session
+if 'query_mode' not in st.session_state:
+    st.session_state.query_mode = "document"  # "document" = PDF เดียว, "corpus" = หลายเอกสาร
+if 'corpus_scope' not in st.session_state:
+    st.session_state.corpus_scope = []
+if 'search_kwargs' not in st.session_state:
+    st.session_state.search_kwargs = None  # filter ของ retriever เมื่อถามจาก corpus
+if 'ingest_partial' not in st.session_state:
+    st.session_state.ingest_partial = None  # (หน้าที่ประมวลผลแล้ว, จำนวนหน้าทั้งหมด) ระหว่าง Process PDF
+if 'ingest_job' not in st.session_state:
+    st.session_state.ingest_job = None  # id ของงาน Process PDF เบื้องหลังของ session นี้
+if 'extraction_workers' not in st.session_state:
+    st.session_state.extraction_workers = min(4, os.cpu_count() or 1)
+if 'index_type' not in st.session_state:
+    st.session_state.index_type = "auto"
+if 'splitter' not in st.session_state:
+    st.session_state.splitter = DEFAULT_SPLITTER
+if 'compare_indexes' not in st.session_state:
+    st.session_state.compare_indexes = False
+if 'adaptive_retrieval' not in st.session_state:
+    st.session_state.adaptive_retrieval = True
+if 'conversation_mode' not in st.session_state:
+    st.session_state.conversation_mode = False
+if 'conversation' not in st.session_state:
+    st.session_state.conversation = None  # conversation.Conversation ของแชทปัจจุบัน (โหมดสนทนาต่อเนื่อง)
 if 'embedding_model' not in st.session_state:
-    st.session_state.embedding_model = "gemma2:27b"  # ใช้ DeepSeek เป็นค่าเริ่มต้น
+    st.session_state.embedding_model = DEFAULT_EMBEDDING_MODEL  # model สำหรับสร้าง index
+if 'llm_model' not in st.session_state:
+    st.session_state.llm_model = DEFAULT_LLM_MODEL  # model สำหรับตอบคำถาม (เปลี่ยนได้โดยไม่ต้องสร้าง index ใหม่)
+
+# โหลด model ที่เลือกเข้า memory ของ Ollama ล่วงหน้า (background thread, ทำครั้งเดียวต่อ model)
+get_ollama_pool().warm_up(
+    embedding_models=[st.session_state.embedding_model],
+    llm_models=[st.session_state.llm_model]
+)
 
 # Constants
 VECTORSTORE_DIR = "vectorstore_cache"
 os.makedirs(VECTORSTORE_DIR, exist_ok=True)
 
+# vector store รุ่นแรก (<ชื่อไฟล์>.faiss) - นำเข้า artifact cache ครั้งเดียว
+if 'legacy_import' not in st.session_state:
+    st.session_state.legacy_import = get_artifact_cache().import_legacy_stores(VECTORSTORE_DIR, ingest_params())
+for legacy_name in st.session_state.legacy_import['imported']:
+    st.toast(f"♻️ นำเข้า Vector Store เดิมของ {legacy_name} แล้ว (ใช้ได้เมื่ออัพโหลดไฟล์ชื่อเดิม)")
+for legacy_name, reason in st.session_state.legacy_import['removed']:
+    st.warning(f"🗑️ ลบ Vector Store เดิมของ {legacy_name} เพราะนำเข้าไม่ได้ ({reason}) - กรุณา Process PDF ใหม่")
+st.session_state.legacy_import = {'imported': [], 'removed': []}  # แจ้งครั้งเดียว
+
+
+def upload_fingerprint(uploaded_file):
+    """hash ของไฟล์ที่อัพโหลด คำนวณครั้งเดียวต่อการอัพโหลด ไม่ต้องอ่านทั้งไฟล์ใหม่ทุก rerun"""
+    fingerprints = st.session_state.setdefault('upload_fingerprints', {})
+    if uploaded_file.file_id not in fingerprints:
+        fingerprints[uploaded_file.file_id] = file_fingerprint(uploaded_file)
+    return fingerprints[uploaded_file.file_id]
+
+
+def load_cached_document(uploaded_file, fingerprint, params):
+    """
+    โหลด Vector Store ของเอกสารจาก artifact cache แล้วตั้งเป็นเอกสารปัจจุบัน
+    
+    Returns:
+        entry ของ artifact หรือ None ถ้าไม่มีใน cache
+    """
+    entry = get_artifact_cache().lookup(
+        fingerprint, st.session_state.embedding_model, params, name=uploaded_file.name
+    )
+    if entry is None:
+        return None
+    
+    # ใช้ index ชุดเดียวกับ session อื่นที่เปิดเอกสารเดียวกันอยู่
+    st.session_state.vectorstore = get_vectorstore(
+        entry['path'],
+        fingerprint,
+        st.session_state.embedding_model
+    )
+    st.session_state.doc_fingerprint = fingerprint
+    st.session_state.query_mode = "document"
+    st.session_state.search_kwargs = None
+    st.session_state.pdf_processed = True
+    st.session_state.chat_history = []
+    st.session_state.current_pdf_name = uploaded_file.name
+    st.session_state.ingest_partial = None
+    st.session_state.ingest_job = None
+    return entry
+
 # ==================== SIDEBAR ====================
 with st.sidebar:
     # Render sidebar components
     uploaded_file, model_info = render_sidebar(VECTORSTORE_DIR)
     
-    # ตรวจสอบว่ามี Vector Store เก่าหรือไม่
+    # ตรวจสอบว่ามี Vector Store ของเอกสารนี้ใน cache หรือไม่ (ไม่ขึ้นกับชื่อไฟล์)
     if uploaded_file is not None:
-        vectorstore_path = os.path.join(VECTORSTORE_DIR, f"{uploaded_file.name}.faiss")
+        fingerprint = upload_fingerprint(uploaded_file)
+        artifact_params = ingest_params(index_type=st.session_state.index_type, splitter=st.session_state.splitter)
+        artifact_cache = get_artifact_cache()
+        cached_artifact = artifact_cache.peek(
+            fingerprint, st.session_state.embedding_model, artifact_params, name=uploaded_file.name
+        )
+        
+        # เอกสารนี้กำลังประมวลผลอยู่เบื้องหลัง (เช่น หลัง refresh หน้าเว็บ) - ติดตามงานเดิมต่อ
+        if st.session_state.ingest_job is None:
+            active_job = get_job_manager().find_active(fingerprint, st.session_state.embedding_model, artifact_params)
+            if active_job is not None:
+                st.session_state.ingest_job = active_job['id']
+                if not st.session_state.pdf_processed:
+                    st.session_state.doc_fingerprint = fingerprint
         
         # ปุ่มโหลด Vector Store ที่มีอยู่
-        if os.path.exists(vectorstore_path) and not st.session_state.pdf_processed:
+        if cached_artifact is not None and not st.session_state.pdf_processed:
+            known_names = ", ".join(cached_artifact['names'])
+            st.caption(f"♻️ เคยประมวลผลเอกสารนี้แล้ว ({known_names})")
             if st.button("⚡ โหลด Vector Store ที่มีอยู่", type="secondary"):
                 with st.spinner("กำลังโหลด Vector Store..."):
                     try:
-                        st.session_state.vectorstore = load_vectorstore(
-                            vectorstore_path,
-                            st.session_state.embedding_model
-                        )
-                        st.session_state.pdf_processed = True
-                        st.session_state.chat_history = []
-                        st.session_state.current_pdf_name = uploaded_file.name
+                        load_cached_document(uploaded_file, fingerprint, artifact_params)
                         st.success(f"✅ โหลด Vector Store สำเร็จ!")
-                        st.info(f"🤖 Model: {model_info['name']}")
+                        st.info(f"🧬 Embedding: {model_info['name']}")
                         st.rerun()
                     except Exception as e:
                         st.error(f"❌ ไม่สามารถโหลดได้: {str(e)}")
@@ -67,41 +174,46 @@ with st.sidebar:
         if st.button("🔄 Process PDF", type="primary"):
             with st.spinner("กำลังประมวลผล PDF..."):
                 try:
-                    # ประมวลผล PDF
-                    result = process_pdf(uploaded_file, st.session_state.embedding_model)
-                    
-                    # เก็บผลลัพธ์
-                    st.session_state.vectorstore = result['vectorstore']
-                    st.session_state.pdf_processed = True
-                    st.session_state.chat_history = []
-                    st.session_state.current_pdf_name = uploaded_file.name
-                    
-                    # บันทึก Vector Store
-                    vectorstore_path = os.path.join(VECTORSTORE_DIR, f"{uploaded_file.name}.faiss")
-                    save_vectorstore(result['vectorstore'], vectorstore_path)
-                    
-                    # แสดงข้อมูล
-                    st.success(f"✅ ประมวลผล PDF สำเร็จ!")
-                    st.info(f"📄 ไฟล์: {uploaded_file.name}")
-                    st.info(result['chunk_info'])
-                    st.info(f"📊 สถิติ: {result['num_pages']} หน้า | {result['total_chars']:,} ตัวอักษร | {result['num_chunks']} chunks")
-                    
-                    current_model_info = EmbeddingFactory.get_model_info(st.session_state.embedding_model)
-                    st.info(f"🤖 Model: {current_model_info['name']} (ใช้ทั้ง Embedding & LLM)")
-                    
-                    # แนะนำ model
-                    if result['recommended_model'] != st.session_state.embedding_model:
-                        rec_info = EmbeddingFactory.get_model_info(result['recommended_model'])
-                        st.warning(f"💡 แนะนำ: {rec_info['name']} สำหรับเอกสารขนาดนี้")
-                    
-                    st.info(f"💾 บันทึกที่: `{vectorstore_path}`")
+                    # เอกสารเดียวกัน (ชื่อใดก็ได้) ที่ประมวลผลด้วย model และค่าเดียวกันแล้ว - โหลดจาก cache
+                    entry = load_cached_document(uploaded_file, fingerprint, artifact_params)
+                    if entry is not None:
+                        info = entry['info']
+                        st.success(f"♻️ พบเอกสารนี้ใน cache - ไม่ต้องประมวลผลใหม่")
+                        st.info(f"📄 ไฟล์: {uploaded_file.name}")
+                        st.info(f"📊 สถิติ: {info['num_pages']} หน้า | {info['total_chars']:,} ตัวอักษร | {info['num_chunks']} chunks")
+                        st.info(f"💾 โหลดจาก: `{entry['path']}`")
+                    else:
+                        # ประมวลผลเป็นงานเบื้องหลัง - session ไม่ถูกบล็อก และ refresh หน้าเว็บแล้วงานไม่หาย
+                        st.session_state.ingest_job = get_job_manager().submit(
+                            uploaded_file,
+                            fingerprint,
+                            st.session_state.embedding_model,
+                            artifact_params,
+                            name=uploaded_file.name,
+                            extraction_workers=st.session_state.extraction_workers,
+                            compare_indexes=st.session_state.compare_indexes
+                        )
+                        st.session_state.vectorstore = None
+                        st.session_state.pdf_processed = False
+                        st.session_state.chat_history = []
+                        st.session_state.doc_fingerprint = fingerprint
+                        st.session_state.query_mode = "document"
+                        st.session_state.search_kwargs = None
+                        st.session_state.ingest_partial = None
                     
                 except Exception as e:
                     st.error(f"❌ เกิดข้อผิดพลาด: {str(e)}")
     
+    # ความคืบหน้า/ผลลัพธ์ของงาน Process PDF
+    if st.session_state.ingest_job is not None:
+        render_ingest_job(st.session_state.ingest_job)
+    render_job_queue()
+    render_ollama_status()
+    
     # แสดงคำแนะนำและปุ่มควบคุม
     render_instructions()
     render_controls()
+    render_corpus_panel(get_corpus(st.session_state.embedding_model))
 
 
 # ==================== MAIN CHAT INTERFACE ====================
@@ -124,31 +236,120 @@ else:
         
         # สร้างคำตอบ
         with st.chat_message("assistant"):
-            with st.spinner("กำลังคิด..."):
-                try:
-                    # สร้าง QA Chain โดยใช้ model ที่เลือกใน sidebar
-                    qa_chain = create_qa_chain(
-                        st.session_state.vectorstore,
-                        llm_model=st.session_state.embedding_model  # ใช้ model เดียวกัน
-                    )
-                    
-                    # รับคำตอบ
-                    response = get_answer(qa_chain, prompt)
-                    answer = response['result']
-                    
-                    # แสดงคำตอบ
+            try:
+                trace = Trace(
+                    "query",
+                    llm_model=st.session_state.llm_model,
+                    embedding_model=st.session_state.embedding_model
+                )
+                
+                # ใช้ QA Chain ที่แชร์กันทั้ง process (สร้างครั้งแรกที่ถูกเรียก)
+                qa_chain = get_qa_chain(
+                    st.session_state.vectorstore,
+                    st.session_state.doc_fingerprint,
+                    llm_model=st.session_state.llm_model,
+                    search_kwargs=st.session_state.search_kwargs
+                )
+                
+                # ตรวจสอบ answer cache ก่อน (ตรงตัว หรือคำถามที่ความหมายใกล้เคียง)
+                # ข้ามเมื่อ index ยังประมวลผลไม่ครบ เพราะคำตอบอาจยังไม่สมบูรณ์
+                answer_cache = get_answer_cache()
+                answer_cache_model = cache_model(
+                    st.session_state.llm_model,
+                    st.session_state.embedding_model,
+                    st.session_state.adaptive_retrieval,
+                    vectorstore_path(st.session_state.vectorstore)
+                )
+                # โหมดสนทนาต่อเนื่อง: คำตอบขึ้นกับรอบก่อนๆ จึงใช้ answer cache ไม่ได้
+                use_answer_cache = (
+                    st.session_state.ingest_partial is None and not st.session_state.conversation_mode
+                )
+                cached, query_embedding = None, None
+                if use_answer_cache:
+                    with trace.span("answer_cache"):
+                        cached, query_embedding = answer_cache.lookup(
+                            st.session_state.doc_fingerprint,
+                            answer_cache_model,
+                            prompt,
+                            st.session_state.vectorstore.embeddings.embed_query
+                        )
+                trace.count("answer_cache_hits", int(cached is not None))
+                
+                if cached is not None:
+                    answer = cached['result']
+                    display_source_documents(cached)
                     st.markdown(answer)
+                    st.caption(f"⚡ คำตอบจาก cache ({cached['match']}, similarity {cached['similarity']:.2f})")
+                else:
+                    # ค้นหาเอกสารก่อน แล้วแสดงแหล่งอ้างอิงทันที
+                    if st.session_state.conversation_mode:
+                        # prompt ต่อท้ายจากรอบก่อน - บทสนทนาใหม่เมื่อเปลี่ยนเอกสาร/LLM (chain เปลี่ยน)
+                        conversation = st.session_state.conversation
+                        if conversation is None or conversation.qa_chain is not qa_chain:
+                            conversation = st.session_state.conversation = Conversation(qa_chain)
+                        with trace.span("embed_query"):
+                            query_embedding = st.session_state.vectorstore.embeddings.embed_query(prompt)
+                        answer_stream = conversation.ask(
+                            prompt, query_embedding,
+                            adaptive=st.session_state.adaptive_retrieval,
+                            trace=trace
+                        )
+                    else:
+                        answer_stream = stream_answer(
+                            qa_chain, prompt, query_embedding,
+                            adaptive=st.session_state.adaptive_retrieval,
+                            trace=trace
+                        )
+                    with st.spinner("กำลังค้นหาเอกสาร..."):
+                        answer_stream.retrieve()
+                    display_source_documents(answer_stream.as_response())
                     
-                    # แสดง source documents
-                    display_source_documents(response)
+                    # แสดงคำตอบทีละ token
+                    with st.spinner("กำลังคิด..."):
+                        answer = st.write_stream(answer_stream)
                     
-                    # บันทึกประวัติ
-                    st.session_state.chat_history.append({"role": "assistant", "content": answer})
+                    timings = answer_stream.timings
+                    packing = answer_stream.packing
+                    st.caption(
+                        f"⏱️ ค้นหา {timings['retrieval_time']:.2f} วิ | "
+                        f"token แรก {timings['time_to_first_token'] or 0:.2f} วิ | "
+                        f"รวม {timings['total_time']:.2f} วิ | "
+                        f"🧩 {packing['num_chunks']} chunks → {packing['num_spans']} ช่วง "
+                        f"(ประหยัด ~{packing['saved_tokens']:,} tokens)"
+                    )
+                    if answer_stream.llm_options:
+                        st.caption(
+                            f"📐 num_ctx {answer_stream.llm_options['num_ctx']:,} | "
+                            f"num_predict {answer_stream.llm_options['num_predict']:,}"
+                        )
+                    if st.session_state.conversation_mode and answer_stream.prefill:
+                        prefill = answer_stream.prefill
+                        st.caption(
+                            f"💬 prefill ใหม่ ~{prefill['new_tokens']:,} tokens | "
+                            f"ใช้ cache ของรอบก่อน ~{prefill['cached_tokens']:,} tokens"
+                            + (" | ♻️ ใช้ผลค้นหาเดิม" if answer_stream.reused_retrieval else "")
+                        )
                     
-                except Exception as e:
-                    error_msg = f"❌ เกิดข้อผิดพลาด: {str(e)}"
-                    st.error(error_msg)
-                    st.session_state.chat_history.append({"role": "assistant", "content": error_msg})
+                    if use_answer_cache:
+                        answer_cache.store(
+                            st.session_state.doc_fingerprint,
+                            answer_cache_model,
+                            prompt,
+                            answer,
+                            answer_stream.source_documents,
+                            query_embedding
+                        )
+                
+                get_metrics_sink().record(trace)
+                display_trace(trace)
+                
+                # บันทึกประวัติ
+                st.session_state.chat_history.append({"role": "assistant", "content": answer})
+                
+            except Exception as e:
+                error_msg = f"❌ เกิดข้อผิดพลาด: {str(e)}"
+                st.error(error_msg)
+                st.session_state.chat_history.append({"role": "assistant", "content": error_msg})
 
 
 # ==================== FOOTER ====================
@@ -158,3 +359,7 @@ st.markdown("""
     <p>🤖 Powered by Gemma2:27b (Ollama) | 🦜 LangChain | 🎈 Streamlit</p>
 </div>
 """, unsafe_allow_html=True)
+
+# หน้าเว็บแสดงผลครบแล้ว - import dependency ที่หนักต่อใน background ก่อนผู้ใช้กด Process PDF หรือถามคำถาม
+if STARTUP_MODE == "background":
+    start_preload()
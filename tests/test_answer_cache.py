@@ -0,0 +1,30 @@
+"""
+Tests ของ answer_cache.AnswerCache
+"""
+from answer_cache import AnswerCache, cache_model
+
+
+def _same_embedding(question):
+    # ทุกคำถามมี embedding เดียวกัน: ผลขึ้นกับเงื่อนไขอื่นของ cache เท่านั้น
+    return [1.0, 0.0, 0.0]
+
+
+def test_semantic_match_requires_same_numbers():
+    cache = AnswerCache(similarity_threshold=0.95)
+    model = cache_model("gemma3:12b", "bge-m3", True, "/cache/a")
+    cache.store("doc", model, "ค่าเทอมปี 2566 เท่าไร", "20,000 บาท", [], _same_embedding(""))
+
+    cached, _ = cache.lookup("doc", model, "ค่าเทอมปี 2567 เท่าไร", _same_embedding)
+    assert cached is None
+    cached, _ = cache.lookup("doc", model, "ค่าเทอมของปี ๒๕๖๖ เท่าไหร่", _same_embedding)
+    assert cached['match'] == 'semantic'
+    assert cached['result'] == "20,000 บาท"
+
+
+def test_key_separates_adaptive_and_artifact():
+    cache = AnswerCache()
+    cache.store("doc", cache_model("gemma3:12b", "bge-m3", True, "/cache/a"), "คำถาม", "คำตอบ", [], None)
+
+    assert cache.lookup("doc", cache_model("gemma3:12b", "bge-m3", False, "/cache/a"), "คำถาม")[0] is None
+    assert cache.lookup("doc", cache_model("gemma3:12b", "bge-m3", True, "/cache/b"), "คำถาม")[0] is None
+    assert cache.lookup("doc", cache_model("gemma3:12b", "bge-m3", True, "/cache/a"), "คำถาม")[0] is not None
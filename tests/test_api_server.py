@@ -0,0 +1,28 @@
+"""
+Tests ของ api_server: ตรวจค่าของ POST /ingest ก่อนรับไฟล์
+"""
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import api_server
+
+
+async def _post_ingest(query):
+    app = api_server.create_app()
+    app.on_startup.clear()  # ไม่ต้อง warm up model ของ Ollama
+    async with TestClient(TestServer(app)) as client:
+        response = await client.post("/ingest", params=query, data=b"%PDF-fake")
+        return response.status, await response.json()
+
+
+@pytest.mark.parametrize("param", ["embedding_model", "index_type", "splitter"])
+def test_ingest_rejects_unsupported_param(param, monkeypatch):
+    async def fail_save(request):
+        raise AssertionError("upload should not be saved")
+    monkeypatch.setattr(api_server, "_save_upload", fail_save)
+
+    status, body = asyncio.run(_post_ingest({param: "no-such-value"}))
+    assert status == 400
+    assert param in body['error']
@@ -0,0 +1,51 @@
+"""
+Tests ของ artifact_cache.ArtifactCache.import_legacy_stores
+"""
+import os
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from artifact_cache import ArtifactCache
+
+
+PARAMS = {'chunking_version': 1, 'splitter': "thai"}
+
+
+def _legacy_store(root, name, size):
+    texts = [f"ข้อความส่วนที่ {i}" for i in range(5)]
+    metadatas = [{'source': "/tmp/upload.pdf", 'page': i // 2} for i in range(5)]
+    vectorstore = FAISS.from_texts(texts, DeterministicFakeEmbedding(size=size), metadatas=metadatas)
+    vectorstore.save_local(os.path.join(root, f"{name}.faiss"))
+
+
+def test_legacy_store_adopted_by_uploaded_name(tmp_path):
+    _legacy_store(tmp_path, "report.pdf", 4608)  # gemma2:27b
+    cache = ArtifactCache(directory=str(tmp_path / "artifacts"))
+
+    result = cache.import_legacy_stores(str(tmp_path), PARAMS)
+    assert result == {'imported': ["report.pdf"], 'removed': []}
+    assert not os.path.exists(tmp_path / "report.pdf.faiss")
+
+    assert cache.lookup("sha-other", "gemma2:27b", PARAMS, name="other.pdf") is None
+    assert cache.lookup("sha-report", "bge-m3", PARAMS, name="report.pdf") is None
+    entry = cache.lookup("sha-report", "gemma2:27b", PARAMS, name="report.pdf")
+    assert entry['info']['num_chunks'] == 5
+    assert entry['info']['num_pages'] == 3
+    # ผูกกับ fingerprint แล้ว ชื่อไฟล์อื่นของเอกสารเดียวกันก็ใช้ได้
+    reopened = ArtifactCache(directory=str(tmp_path / "artifacts"))
+    assert reopened.lookup("sha-report", "gemma2:27b", PARAMS, name="renamed.pdf")['path'] == entry['path']
+
+
+def test_unknown_legacy_store_removed_once(tmp_path):
+    _legacy_store(tmp_path, "ambiguous.pdf", 1024)  # bge-m3 และ mxbai-embed-large
+    cache = ArtifactCache(directory=str(tmp_path / "artifacts"))
+
+    result = cache.import_legacy_stores(str(tmp_path), PARAMS)
+    assert result['imported'] == []
+    assert [name for name, _ in result['removed']] == ["ambiguous.pdf"]
+    assert not os.path.exists(tmp_path / "ambiguous.pdf.faiss")
+
+    _legacy_store(tmp_path, "later.pdf", 4608)
+    reopened = ArtifactCache(directory=str(tmp_path / "artifacts"))
+    assert reopened.import_legacy_stores(str(tmp_path), PARAMS) == {'imported': [], 'removed': []}
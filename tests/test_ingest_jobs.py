@@ -0,0 +1,62 @@
+"""
+Tests ของ ingest_jobs.IngestJobManager เมื่อหลาย process ใช้ database เดียวกัน
+"""
+import io
+import threading
+import time
+
+from ingest_jobs import IngestJobManager
+
+
+def _fake_runner(manager, runs, lock):
+    def run(job):
+        with lock:
+            runs.append((manager.owner, job['id']))
+        time.sleep(0.02)
+        manager._update(job['id'], status='done', finished_at=time.time())
+    return run
+
+
+def _wait_finished(manager, job_ids, timeout=20.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if all(manager.get(job_id)['status'] == 'done' for job_id in job_ids):
+            return
+        time.sleep(0.05)
+    raise AssertionError("jobs did not finish")
+
+
+def test_two_managers_run_each_job_once(tmp_path):
+    runs, lock = [], threading.Lock()
+    managers = [IngestJobManager(directory=str(tmp_path), max_workers=2) for _ in range(2)]
+    for manager in managers:
+        manager._run = _fake_runner(manager, runs, lock)
+    try:
+        job_ids = [
+            managers[i % 2].submit(io.BytesIO(b"%PDF-fake"), f"doc-{i}", "bge-m3", {'chunk_size': 600})
+            for i in range(20)
+        ]
+        _wait_finished(managers[0], job_ids)
+    finally:
+        for manager in managers:
+            manager.stop()
+
+    ran = [job_id for _, job_id in runs]
+    assert sorted(ran) == sorted(job_ids)
+
+
+def test_startup_requeues_only_expired_leases(tmp_path, monkeypatch):
+    # ไม่ให้ worker claim งาน จะได้เห็นสถานะหลังเริ่มโปรแกรมอย่างเดียว
+    monkeypatch.setattr(IngestJobManager, "_worker_loop", lambda self: None)
+    manager = IngestJobManager(directory=str(tmp_path), max_workers=1, lease_timeout=30)
+    manager.stop()
+    alive = manager.submit(io.BytesIO(b"%PDF-fake"), "alive", "bge-m3", {})
+    expired = manager.submit(io.BytesIO(b"%PDF-fake"), "expired", "bge-m3", {})
+    now = time.time()
+    manager._update(alive, status='running', claimed_by="other", heartbeat_at=now)
+    manager._update(expired, status='running', claimed_by="gone", heartbeat_at=now - 60)
+
+    restarted = IngestJobManager(directory=str(tmp_path), max_workers=1, lease_timeout=30)
+    restarted.stop()
+    assert restarted.get(alive)['status'] == 'running'
+    assert restarted.get(expired)['status'] == 'queued'
@@ -0,0 +1,47 @@
+"""
+Tests ของ resource_registry.ResourceRegistry
+"""
+import gc
+
+from resource_registry import ResourceRegistry
+
+
+class Resource:
+    def __init__(self, name):
+        self.name = name
+
+
+def _no_factory():
+    raise AssertionError("should reuse the evicted instance")
+
+
+def test_eviction_while_reference_held():
+    registry = ResourceRegistry(max_bytes=100)
+    held = registry.get_or_create("a", lambda: Resource("a"), size_fn=lambda value: 80)
+    registry.get_or_create("b", lambda: Resource("b"), size_fn=lambda value: 80)
+    assert registry.stats()['entries'] == 1
+    assert registry.total_bytes() <= registry.max_bytes
+
+    # "a" ถูก evict แต่ยังมีผู้ถืออยู่ - ขอใหม่ได้ชิ้นเดิม ไม่โหลดสำเนาที่สอง
+    assert registry.get_or_create("a", _no_factory, size_fn=lambda value: 80) is held
+    assert registry.find_key(held) == "a"
+
+
+def test_evicted_instance_released_when_unused():
+    registry = ResourceRegistry(max_bytes=100)
+    registry.get_or_create("a", lambda: Resource("a"), size_fn=lambda value: 80)
+    registry.get_or_create("b", lambda: Resource("b"), size_fn=lambda value: 80)
+    gc.collect()
+
+    created = []
+    registry.get_or_create("a", lambda: created.append(1) or Resource("a"), size_fn=lambda value: 80)
+    assert created == [1]
+
+
+def test_invalidated_instance_not_reused():
+    registry = ResourceRegistry(max_bytes=100)
+    held = registry.get_or_create("a", lambda: Resource("a"), size_fn=lambda value: 80)
+    registry.get_or_create("b", lambda: Resource("b"), size_fn=lambda value: 80)
+    registry.invalidate(lambda key: key == "a")
+
+    assert registry.get_or_create("a", lambda: Resource("a2"), size_fn=lambda value: 80) is not held
@@ -0,0 +1,41 @@
+"""
+Tests ของ thai_splitter.iter_chunk_spans
+"""
+import random
+
+from thai_splitter import iter_chunk_spans
+
+
+_WORDS = ["การศึกษา", "หลักสูตร", "นักศึกษา", "มหาวิทยาลัย", "เทคโนโลยี", "ระบบ", "ข้อมูล", "และ", "ของ"]
+
+
+def _spaced_thai(seed, segments=200):
+    """ภาษาไทยที่มีช่องว่างทั้งถี่และห่าง (ช่วงห่างทำให้ไม่มีจุดตัดในครึ่งหลังของ chunk)"""
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(segments):
+        length = rng.choice([rng.randint(20, 60), rng.randint(300, 500)])
+        part = ""
+        while len(part) < length:
+            part += rng.choice(_WORDS)
+        parts.append(part)
+    return " ".join(parts)
+
+
+def test_no_span_contained_in_predecessor():
+    for seed in range(5):
+        text = _spaced_thai(seed)
+        spans = list(iter_chunk_spans(text, 600, 120))
+        for (start, end), (next_start, next_end) in zip(spans, spans[1:]):
+            assert next_start > start
+            assert next_end > end
+
+
+def test_spans_cover_text_within_chunk_size():
+    text = _spaced_thai(0)
+    spans = list(iter_chunk_spans(text, 600, 120))
+    assert spans[0][0] == 0
+    assert spans[-1][1] == len(text)
+    for (start, end), (next_start, _) in zip(spans, spans[1:]):
+        assert end - start <= 600
+        assert next_start <= end
@@ -0,0 +1,26 @@
+"""
+Tests ของ vector_store_format.convert_legacy_store
+"""
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from vector_store_format import convert_legacy_store, is_legacy_store, is_native_store, load_store
+
+
+def test_convert_legacy_store_keeps_search_results(tmp_path):
+    embeddings = DeterministicFakeEmbedding(size=32)
+    texts = [f"ข้อความส่วนที่ {i}" for i in range(20)]
+    legacy = FAISS.from_texts(texts, embeddings, metadatas=[{'page': i} for i in range(20)])
+    legacy.save_local(str(tmp_path))
+    assert is_legacy_store(str(tmp_path))
+
+    assert convert_legacy_store(str(tmp_path)) == 20
+    assert is_native_store(str(tmp_path))
+    assert not (tmp_path / "index.pkl").exists()
+
+    converted = load_store(str(tmp_path), embeddings)
+    for query in ("ข้อความส่วนที่ 3", "ข้อความส่วนที่ 17"):
+        expected = legacy.similarity_search(query, k=3)
+        actual = converted.similarity_search(query, k=3)
+        assert [(doc.page_content, doc.metadata) for doc in actual] == \
+            [(doc.page_content, doc.metadata) for doc in expected]
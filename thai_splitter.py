@@ -0,0 +1,342 @@
+"""
+Thai-aware Text Splitter
+แบ่ง chunks ตามขอบเขตย่อหน้า/ประโยค/คำ ในเวลาเชิงเส้น (ภาษาไทยไม่เว้นวรรคระหว่างคำ)
+ตัด header/footer ที่ซ้ำทุกหน้า และตัด chunks ที่เกือบซ้ำกัน (MinHash) ก่อน embed
+"""
+import logging
+import re
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain.text_splitter import TextSplitter
+
+try:
+    from pythainlp.tokenize import word_tokenize
+except ImportError:  # ไม่ได้ติดตั้ง pythainlp (requirements.txt) - ใช้กฎ Thai character cluster แทน
+    word_tokenize = None
+
+logger = logging.getLogger(__name__)
+_fallback_logged = False
+
+
+DEFAULT_DEDUP_THRESHOLD = 0.9
+
+# ความสำคัญของจุดตัด: ตัดที่จุดที่สำคัญที่สุดในช่วงท้ายของ chunk ก่อน
+PARAGRAPH, SENTENCE, LINE, WORD = 4, 3, 2, 1
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_THAI_RE = re.compile("[\u0E00-\u0E7F]")
+_DIGITS_RE = re.compile(r"[0-9๐-๙]+")
+
+# อักขระที่ขึ้นต้น cluster ไม่ได้ (สระบน/ล่าง วรรณยุกต์ และสระที่ตามหลังพยัญชนะ)
+_THAI_NON_STARTERS = set(
+    "ะัาำิีึืฺุูๅ"
+    "็่้๊๋์ํ๎"
+)
+# สระหน้า (เ แ โ ใ ไ) ต้องอยู่กับพยัญชนะตัวถัดไปเสมอ
+_THAI_LEADING_VOWELS = set("เแโใไ")
+_MAX_CLUSTER_BACKTRACK = 8
+
+
+def _boundary_strength(text, start, end):
+    """ความสำคัญของช่องว่าง text[start:end] ในฐานะจุดตัด chunk"""
+    gap = text[start:end]
+    newlines = gap.count("\n")
+    if newlines >= 2:
+        return PARAGRAPH
+    before = text[start - 1] if start else ""
+    after = text[end] if end < len(text) else ""
+    # ภาษาไทยเว้นวรรคระหว่างประโยค/วลี ไม่ใช่ระหว่างคำ
+    if before in ".!?" or (_THAI_RE.match(before) and _THAI_RE.match(after)):
+        return SENTENCE
+    if newlines:
+        return LINE
+    return WORD
+
+
+def find_boundaries(text):
+    """
+    จุดตัดที่เป็นไปได้ทั้งหมดของข้อความ (อ่านข้อความรอบเดียว)
+
+    Returns:
+        (positions, strengths) position คือตำแหน่งเริ่มของข้อความถัดจากช่องว่าง
+    """
+    positions, strengths = [], []
+    for match in _WHITESPACE_RE.finditer(text):
+        if match.start() == 0 or match.end() == len(text):
+            continue
+        positions.append(match.end())
+        strengths.append(_boundary_strength(text, match.start(), match.end()))
+    return positions, strengths
+
+
+def _cluster_cut(text, start, limit):
+    """
+    ตำแหน่งตัดข้อความที่ไม่มีช่องว่าง (ภาษาไทยยาวๆ) ที่ไม่ทำให้สระ/วรรณยุกต์แยกจากพยัญชนะ
+
+    ใช้ pythainlp ตัดตามคำถ้าติดตั้งไว้ ไม่เช่นนั้นใช้กฎ Thai character cluster
+    """
+    if word_tokenize is not None:
+        words = word_tokenize(text[start:limit], engine="newmm", keep_whitespace=True)
+        if len(words) > 1:
+            return limit - len(words[-1])
+
+    cut = limit
+    while cut > start + 1 and limit - cut < _MAX_CLUSTER_BACKTRACK:
+        if text[cut] not in _THAI_NON_STARTERS and text[cut - 1] not in _THAI_LEADING_VOWELS:
+            return cut
+        cut -= 1
+    return limit
+
+
+def iter_chunk_spans(text, chunk_size, chunk_overlap):
+    """
+    แบ่งข้อความเป็นช่วง (start, end) ยาวไม่เกิน chunk_size ในเวลาเชิงเส้น
+
+    - ตัดที่จุดสำคัญที่สุด (ย่อหน้า > ประโยค > บรรทัด > คำ) ในครึ่งหลังของ chunk
+    - chunk ถัดไปเริ่มที่จุดตัดแรกภายใน chunk_overlap ตัวอักษรสุดท้าย (ไม่เริ่มกลางคำ)
+    - ทุก chunk จบเลยจุดจบของ chunk ก่อนหน้า (ไม่มี chunk ที่อยู่ใน overlap ทั้งหมด)
+    """
+    positions, strengths = find_boundaries(text)
+    n = len(text)
+    start = len(text) - len(text.lstrip())
+    previous_end = start
+
+    while start < n:
+        limit = start + chunk_size
+        if limit >= n:
+            end = n
+        else:
+            lo = bisect_right(positions, start + chunk_size // 2)
+            hi = bisect_right(positions, limit)
+            if lo == hi:
+                # จุดตัดก่อนจุดจบของ chunk ก่อนหน้าจะได้ chunk ที่อยู่ใน overlap ทั้งหมด
+                lo = bisect_right(positions, max(previous_end, start + chunk_overlap))
+            if lo < hi:
+                # จุดที่สำคัญที่สุด ถ้าเท่ากันเลือกจุดที่อยู่ท้ายสุด
+                best = max(range(lo, hi), key=lambda i: (strengths[i], i))
+                end = positions[best]
+            else:
+                end = _cluster_cut(text, start, limit)
+
+        chunk_end = end
+        while chunk_end > start and text[chunk_end - 1].isspace():
+            chunk_end -= 1
+        if chunk_end > start:
+            yield start, chunk_end
+        if end >= n:
+            break
+
+        previous_end = end
+        next_start = end
+        if chunk_overlap:
+            i = bisect_left(positions, end - chunk_overlap)
+            if i < len(positions) and start < positions[i] < end:
+                next_start = positions[i]
+            elif end - chunk_overlap > start:
+                next_start = _cluster_cut(text, start, end - chunk_overlap)
+        start = next_start
+
+
+def _line_key(line):
+    """บรรทัดที่ต่างกันแค่ตัวเลข (เลขหน้า, วันที่) ถือเป็นบรรทัดเดียวกัน"""
+    return _DIGITS_RE.sub("#", " ".join(line.split()))
+
+
+class BoilerplateFilter:
+    """
+    ตัด header/footer ที่ซ้ำกันในหลายหน้า (ชื่อเอกสาร, เลขหน้า, ชื่อหน่วยงาน)
+
+    นับบรรทัดแรก/สุดท้ายของทุกหน้าที่เคยเห็น บรรทัดที่พบในอย่างน้อย min_ratio ของหน้า
+    (และอย่างน้อย min_pages หน้า) ถือเป็น header/footer
+    """
+
+    def __init__(self, edge_lines=2, min_ratio=0.5, min_pages=3):
+        self.edge_lines = edge_lines
+        self.min_ratio = min_ratio
+        self.min_pages = min_pages
+        self.pages_seen = 0
+        self._counts = Counter()
+
+    def _edges(self, lines):
+        """index ของบรรทัดที่ไม่ว่าง edge_lines บรรทัดแรกและสุดท้าย"""
+        non_empty = [i for i, line in enumerate(lines) if line.strip()]
+        return set(non_empty[:self.edge_lines] + non_empty[-self.edge_lines:])
+
+    def update(self, texts):
+        for text in texts:
+            lines = text.split("\n")
+            self._counts.update({_line_key(lines[i]) for i in self._edges(lines)})
+        self.pages_seen += len(texts)
+
+    def state(self):
+        """สถานะที่ต้องใช้ทำงานต่อจาก checkpoint (JSON ได้)"""
+        return {'pages_seen': self.pages_seen, 'counts': dict(self._counts)}
+
+    def load_state(self, state):
+        self.pages_seen = state['pages_seen']
+        self._counts = Counter(state['counts'])
+
+    def is_boilerplate(self, line):
+        threshold = max(self.min_pages, self.min_ratio * self.pages_seen)
+        return self._counts[_line_key(line)] >= threshold
+
+    def strip(self, text):
+        """
+        Returns:
+            (ข้อความที่ตัด header/footer แล้ว, จำนวนบรรทัดที่ตัด)
+        """
+        lines = text.split("\n")
+        removed = {i for i in self._edges(lines) if self.is_boilerplate(lines[i])}
+        if not removed:
+            return text, 0
+        return "\n".join(line for i, line in enumerate(lines) if i not in removed), len(removed)
+
+
+class NearDuplicateFilter:
+    """
+    ตรวจ chunks ที่เกือบซ้ำกับ chunk ที่เคยเห็นแล้ว ด้วย MinHash + LSH
+
+    shingles เป็น character n-grams (ใช้ได้กับภาษาไทยที่ไม่มีช่องว่าง)
+    ค้นหา candidate ด้วย LSH banding จึงใช้เวลาคงที่ต่อ chunk ไม่ขึ้นกับจำนวน chunks ที่เคยเห็น
+
+    Args:
+        threshold: Jaccard similarity (ประมาณ) ที่ถือว่าซ้ำ
+        num_perm: จำนวน hash functions ของ MinHash
+        bands: จำนวน bands ของ LSH (num_perm ต้องหารด้วย bands ลงตัว)
+        shingle_size: ความยาวของ character n-gram
+    """
+
+    def __init__(self, threshold=DEFAULT_DEDUP_THRESHOLD, num_perm=64, bands=16, shingle_size=5):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(0)
+        # a เป็นเลขคี่ เพื่อให้ a * x เป็น permutation ของ uint64
+        self._a = rng.randint(0, 2 ** 62, num_perm, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.randint(0, 2 ** 62, num_perm, dtype=np.int64).astype(np.uint64)
+        self._buckets = {}
+        self._signatures = []
+
+    def signature(self, text):
+        text = " ".join(text.split())
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        k = min(self.shingle_size, len(codes))
+        if k == 0:
+            return np.full(len(self._a), np.iinfo(np.uint64).max, dtype=np.uint64)
+        # hash ของทุก shingle พร้อมกัน (polynomial hash ของ code points) แล้วตัดให้เหลือ 31 บิต
+        hashes = np.zeros(len(codes) - k + 1, dtype=np.uint64)
+        for offset in range(k):
+            hashes = hashes * np.uint64(1_000_003) + codes[offset:len(codes) - k + 1 + offset]
+        # hash function แต่ละตัวเป็น a * x + b (mod 2^64 จาก overflow ของ uint64)
+        return (np.outer(np.unique(hashes), self._a) + self._b).min(axis=0)
+
+    def is_duplicate(self, text):
+        """True ถ้าเกือบซ้ำกับ chunk ก่อนหน้า ไม่เช่นนั้นจำ chunk นี้ไว้แล้วคืน False"""
+        signature = self.signature(text)
+        keys = [
+            (band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+        checked = set()
+        for key in keys:
+            for candidate in self._buckets.get(key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                    return True
+
+        position = len(self._signatures)
+        self._signatures.append(signature)
+        for key in keys:
+            self._buckets.setdefault(key, []).append(position)
+        return False
+
+
+class ThaiTextSplitter(TextSplitter):
+    """
+    Text splitter สำหรับเอกสารภาษาไทย/อังกฤษ ใช้แทน RecursiveCharacterTextSplitter
+
+    split_documents จำ header/footer และ chunks ที่เคยเห็นไว้ข้ามการเรียกแต่ละครั้ง
+    (ใช้ splitter 1 ตัวต่อ 1 เอกสาร เมื่อประมวลผลทีละกลุ่มหน้า)
+    metadata ของทุก chunk มี start_index (ตำแหน่งในหน้าหลังตัด header/footer)
+
+    Args:
+        strip_boilerplate: ตัด header/footer ที่ซ้ำในหลายหน้า
+        dedup_threshold: Jaccard similarity ที่ถือว่า chunk ซ้ำ (None = ไม่ตัดซ้ำ)
+    """
+
+    def __init__(self, chunk_size, chunk_overlap, strip_boilerplate=True,
+                 dedup_threshold=DEFAULT_DEDUP_THRESHOLD, **kwargs):
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True, **kwargs)
+        self._boilerplate = BoilerplateFilter() if strip_boilerplate else None
+        self._dedup = NearDuplicateFilter(dedup_threshold) if dedup_threshold else None
+        self.stats = {'chunks': 0, 'duplicate_chunks': 0, 'boilerplate_lines': 0}
+
+        global _fallback_logged
+        if word_tokenize is None and not _fallback_logged:
+            logger.warning("ไม่พบ pythainlp - ข้อความไทยที่ไม่มีช่องว่างจะถูกตัดตาม character cluster แทนขอบเขตคำ")
+            _fallback_logged = True
+
+    def split_text(self, text):
+        return [text[start:end] for start, end in iter_chunk_spans(text, self._chunk_size, self._chunk_overlap)]
+
+    def split_documents(self, documents):
+        texts = [doc.page_content for doc in documents]
+        if self._boilerplate is not None:
+            self._boilerplate.update(texts)
+            stripped = [self._boilerplate.strip(text) for text in texts]
+            texts = [text for text, _ in stripped]
+            self.stats['boilerplate_lines'] += sum(removed for _, removed in stripped)
+
+        chunks = []
+        for doc, text in zip(documents, texts):
+            for start, end in iter_chunk_spans(text, self._chunk_size, self._chunk_overlap):
+                chunk = text[start:end]
+                if self._dedup is not None and self._dedup.is_duplicate(chunk):
+                    self.stats['duplicate_chunks'] += 1
+                    continue
+                chunks.append(Document(page_content=chunk, metadata=dict(doc.metadata, start_index=start)))
+        self.stats['chunks'] += len(chunks)
+        return chunks
+
+    def state(self):
+        """
+        สถานะของ header/footer และสถิติ สำหรับบันทึกกับ checkpoint (JSON ได้)
+
+        สถานะของ NearDuplicateFilter สร้างใหม่ได้จาก chunks ที่อยู่ใน index แล้ว (load_state)
+        """
+        return {
+            'boilerplate': self._boilerplate.state() if self._boilerplate is not None else None,
+            'stats': dict(self.stats)
+        }
+
+    def load_state(self, state, chunks=()):
+        """
+        ทำงานต่อจาก checkpoint
+
+        Args:
+            state: ค่าจาก state() (None = checkpoint เก่าที่ไม่ได้บันทึกไว้)
+            chunks: ข้อความของ chunks ที่อยู่ใน index แล้ว เรียงตามลำดับที่เพิ่ม
+        """
+        if state is not None:
+            if state['boilerplate'] is not None and self._boilerplate is not None:
+                self._boilerplate.load_state(state['boilerplate'])
+            self.stats.update(state['stats'])
+        if self._dedup is not None:
+            # filter จำเฉพาะ chunks ที่ไม่ซ้ำ ซึ่งคือ chunks ทั้งหมดใน index
+            for chunk in chunks:
+                self._dedup.is_duplicate(chunk)
+
+    def dedup_ratio(self):
+        """
+        สัดส่วนของ chunks ที่ถูกตัดเพราะซ้ำ (0.0 - 1.0) เทียบกับ chunks ของ splitter นี้ก่อนตัดซ้ำ
+
+        ไม่ใช่การลดลงเทียบกับ RecursiveCharacterTextSplitter (ขนาด chunk และจุดตัดต่างกัน)
+        """
+        total = self.stats['chunks'] + self.stats['duplicate_chunks']
+        return self.stats['duplicate_chunks'] / total if total else 0.0
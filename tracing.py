@@ -0,0 +1,252 @@
+"""
+Stage Timing Instrumentation
+จับเวลาและนับจำนวน (หน้า, chunks, tokens, cache hits) ของแต่ละขั้นตอนใน Process PDF และการตอบคำถาม
+ส่งออกเป็น JSON lines และไฟล์ text แบบ Prometheus สำหรับ scraper
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+
+METRICS_DIR = os.environ.get("BORNZI_METRICS_DIR", "metrics")
+TRACES_FILE = "traces.jsonl"
+PROMETHEUS_FILE = "metrics.prom"
+METRIC_PREFIX = "bornzi"
+
+
+class Trace:
+    """
+    เวลาของแต่ละขั้นตอนใน 1 งาน (เช่น Process PDF 1 ไฟล์ หรือตอบ 1 คำถาม)
+
+    ขั้นตอนที่ถูกเรียกหลายครั้ง (เช่น embed ทีละกลุ่มหน้า) จะรวมเวลาและนับจำนวนครั้ง
+    บันทึกจากหลาย thread พร้อมกันได้
+
+    Args:
+        name: ชนิดของงาน ("ingest", "query")
+        attributes: ข้อมูลประกอบ เช่น ชื่อเอกสาร, model
+    """
+
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self.stages = OrderedDict()  # stage -> {'seconds', 'calls'}
+        self.counts = OrderedDict()
+        self.total_time = None
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage):
+        """จับเวลาขั้นตอน stage ภายใน with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage, seconds):
+        """บันทึกเวลาของขั้นตอนที่วัดไว้แล้ว"""
+        with self._lock:
+            stats = self.stages.setdefault(stage, {'seconds': 0.0, 'calls': 0})
+            stats['seconds'] += seconds
+            stats['calls'] += 1
+
+    def count(self, name, value=1):
+        """เพิ่มตัวนับ (pages, chunks, tokens, cache_hits, ...)"""
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def finish(self):
+        """จบงาน บันทึกเวลารวม (เรียกซ้ำได้ ใช้เวลาของครั้งแรก)"""
+        if self.total_time is None:
+            self.total_time = time.perf_counter() - self._start
+        return self
+
+    def breakdown(self):
+        """
+        Returns:
+            list ของ {'stage', 'seconds', 'calls', 'percent'} ตามลำดับที่เกิดขึ้น
+            'other' = เวลาที่ไม่ได้อยู่ในขั้นตอนใด
+        """
+        total = self.total_time if self.total_time is not None else time.perf_counter() - self._start
+        with self._lock:
+            rows = [
+                {'stage': stage, 'seconds': stats['seconds'], 'calls': stats['calls']}
+                for stage, stats in self.stages.items()
+            ]
+        accounted = sum(row['seconds'] for row in rows)
+        if total - accounted > 0.001:
+            rows.append({'stage': 'other', 'seconds': total - accounted, 'calls': 1})
+        for row in rows:
+            row['percent'] = row['seconds'] / total * 100 if total else 0.0
+        return rows
+
+    def to_dict(self):
+        with self._lock:
+            stages = {stage: dict(stats) for stage, stats in self.stages.items()}
+            counts = dict(self.counts)
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'started_at': self.started_at,
+            'total_time': self.total_time,
+            'attributes': self.attributes,
+            'stages': stages,
+            'counts': counts
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """สร้าง Trace คืนจากผลของ to_dict (เช่น trace ที่บันทึกไว้ของงานเบื้องหลัง)"""
+        trace = cls(data['name'], **data['attributes'])
+        trace.trace_id = data['trace_id']
+        trace.started_at = data['started_at']
+        trace.total_time = data['total_time']
+        trace.stages.update((stage, dict(stats)) for stage, stats in data['stages'].items())
+        trace.counts.update(data['counts'])
+        return trace
+
+
+class NullTrace:
+    """Trace ที่ไม่บันทึกอะไร ใช้แทนเมื่อไม่ได้ส่ง trace มา"""
+
+    def span(self, stage):
+        return nullcontext()
+
+    def add(self, stage, seconds):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def finish(self):
+        return self
+
+
+NULL_TRACE = NullTrace()
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+class MetricsSink:
+    """
+    รวม metrics ของทุก trace ใน process แล้วเขียนออกเป็นไฟล์
+
+    - traces.jsonl  1 บรรทัดต่อ 1 trace (ต่อท้ายไฟล์)
+    - metrics.prom  ค่ารวมแบบ Prometheus text format (เขียนทับทั้งไฟล์ทุกครั้ง)
+                    ใช้กับ node_exporter textfile collector ได้
+    """
+
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self.traces_path = os.path.join(directory, TRACES_FILE)
+        self.prometheus_path = os.path.join(directory, PROMETHEUS_FILE)
+        self._traces = {}        # name -> {'count', 'seconds', 'last_seconds'}
+        self._stage_seconds = {}  # (name, stage) -> seconds
+        self._stage_calls = {}    # (name, stage) -> calls
+        self._counts = {}         # (name, count) -> value
+        self._lock = threading.Lock()
+
+    def record(self, trace):
+        """บันทึก trace ที่จบแล้ว (เรียก finish ให้ถ้ายังไม่ได้เรียก)"""
+        trace.finish()
+        data = trace.to_dict()
+
+        with self._lock:
+            totals = self._traces.setdefault(trace.name, {'count': 0, 'seconds': 0.0, 'last_seconds': 0.0})
+            totals['count'] += 1
+            totals['seconds'] += trace.total_time
+            totals['last_seconds'] = trace.total_time
+            for stage, stats in data['stages'].items():
+                key = (trace.name, stage)
+                self._stage_seconds[key] = self._stage_seconds.get(key, 0.0) + stats['seconds']
+                self._stage_calls[key] = self._stage_calls.get(key, 0) + stats['calls']
+            for name, value in data['counts'].items():
+                key = (trace.name, name)
+                self._counts[key] = self._counts.get(key, 0) + value
+
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.traces_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(data, ensure_ascii=False) + "\n")
+
+            tmp_path = self.prometheus_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self._prometheus_text())
+            os.replace(tmp_path, self.prometheus_path)
+
+    def _prometheus_text(self):
+        p = METRIC_PREFIX
+        lines = [
+            f"# HELP {p}_traces_total Number of finished traces.",
+            f"# TYPE {p}_traces_total counter"
+        ]
+        lines += [
+            f'{p}_traces_total{{trace="{_label(name)}"}} {totals["count"]}'
+            for name, totals in sorted(self._traces.items())
+        ]
+        lines += [
+            f"# HELP {p}_trace_seconds_total Total wall time of traces.",
+            f"# TYPE {p}_trace_seconds_total counter"
+        ]
+        lines += [
+            f'{p}_trace_seconds_total{{trace="{_label(name)}"}} {totals["seconds"]:.6f}'
+            for name, totals in sorted(self._traces.items())
+        ]
+        lines += [
+            f"# HELP {p}_trace_last_seconds Wall time of the most recent trace.",
+            f"# TYPE {p}_trace_last_seconds gauge"
+        ]
+        lines += [
+            f'{p}_trace_last_seconds{{trace="{_label(name)}"}} {totals["last_seconds"]:.6f}'
+            for name, totals in sorted(self._traces.items())
+        ]
+        lines += [
+            f"# HELP {p}_stage_seconds_total Time spent per stage.",
+            f"# TYPE {p}_stage_seconds_total counter"
+        ]
+        lines += [
+            f'{p}_stage_seconds_total{{trace="{_label(name)}",stage="{_label(stage)}"}} {seconds:.6f}'
+            for (name, stage), seconds in sorted(self._stage_seconds.items())
+        ]
+        lines += [
+            f"# HELP {p}_stage_calls_total Number of times each stage ran.",
+            f"# TYPE {p}_stage_calls_total counter"
+        ]
+        lines += [
+            f'{p}_stage_calls_total{{trace="{_label(name)}",stage="{_label(stage)}"}} {calls}'
+            for (name, stage), calls in sorted(self._stage_calls.items())
+        ]
+        lines += [
+            f"# HELP {p}_items_total Items processed (pages, chunks, tokens, cache hits, ...).",
+            f"# TYPE {p}_items_total counter"
+        ]
+        lines += [
+            f'{p}_items_total{{trace="{_label(name)}",item="{_label(item)}"}} {value}'
+            for (name, item), value in sorted(self._counts.items())
+        ]
+        return "\n".join(lines) + "\n"
+
+    def prometheus_text(self):
+        with self._lock:
+            return self._prometheus_text()
+
+
+_metrics_sink = None
+_metrics_sink_lock = threading.Lock()
+
+
+def get_metrics_sink():
+    """คืน MetricsSink ที่ใช้ร่วมกันทั้ง process"""
+    global _metrics_sink
+    with _metrics_sink_lock:
+        if _metrics_sink is None:
+            _metrics_sink = MetricsSink()
+        return _metrics_sink
@@ -1,41 +1,124 @@
 """
 UI Components for Streamlit App
 """
+import os
+from datetime import datetime, timezone
 import streamlit as st
 from embeddings_config import EmbeddingFactory
+from llm_config import LLM_MODELS, get_llm_info
+from pdf_processor import INDEX_TYPES, SPLITTERS
+from artifact_cache import get_artifact_cache
+from ingest_jobs import get_job_manager, ACTIVE_STATUSES
+from resource_registry import register_corpus, invalidate_document, corpus_key, get_vectorstore
+from tracing import Trace
+from ollama_client import get_ollama_pool
 
 def render_sidebar(vectorstore_dir):
     """แสดง Sidebar สำหรับการตั้งค่าและอัพโหลด PDF"""
     
     st.header("📄 Upload PDF Document")
     
-    # เลือก AI Model (ใช้ทั้งระบบ)
-    st.markdown("### 🤖 AI Model")
+    # เลือก Embedding model (ใช้สร้าง index) แยกจาก LLM (ใช้ตอบคำถาม)
+    st.markdown("### 🧬 Embedding Model")
     all_models = EmbeddingFactory.get_all_models()
     model_options = {
-        name: f"{info['name']} ({info['size']})"
+        name: f"{info['name']} ({info['size']}, {info['dimension']} มิติ)"
         for name, info in all_models.items()
     }
     
     selected_model = st.selectbox(
-        "เลือก Model:",
+        "เลือก Embedding Model:",
         options=list(model_options.keys()),
         format_func=lambda x: model_options[x],
         index=list(model_options.keys()).index(st.session_state.embedding_model),
-        help="Model ที่ใช้สำหรับทั้ง Embedding และ LLM"
+        help="Model ที่ใช้แปลง chunks เป็น vector - เปลี่ยนแล้วต้อง Process PDF ใหม่"
     )
     
-    # อัพเดต session state
+    # อัพเดต session state - index ที่สร้างด้วย embedding model อื่นใช้ไม่ได้
     if selected_model != st.session_state.embedding_model:
         st.session_state.embedding_model = selected_model
         if st.session_state.pdf_processed:
-            st.warning("⚠️ เปลี่ยน model แล้ว กรุณา Process PDF ใหม่")
+            st.warning("⚠️ เปลี่ยน embedding model แล้ว กรุณา Process PDF ใหม่")
             st.session_state.pdf_processed = False
             st.session_state.vectorstore = None
+            st.session_state.query_mode = "document"
+            st.session_state.search_kwargs = None
     
-    # แสดงข้อมูล model
+    # แสดงข้อมูล model พร้อมขนาด vector และความเร็วที่วัดได้จากการประมวลผลครั้งก่อน
     model_info = EmbeddingFactory.get_model_info(selected_model)
     st.info(f"ℹ️ {model_info.get('description', '')}")
+    vector_bytes = EmbeddingFactory.vector_bytes(selected_model)
+    speed = get_artifact_cache().ingest_speed(selected_model)
+    st.caption(
+        f"📏 {vector_bytes:,} bytes/chunk (~{vector_bytes * 10000 / 1024 ** 2:.0f} MB ต่อ 10,000 chunks)"
+        + (f" | ⚡ วัดได้ ~{speed:.1f} chunks/วิ" if speed else "")
+    )
+    with st.expander("📊 เปรียบเทียบ Embedding Models"):
+        artifact_cache = get_artifact_cache()
+        rows = []
+        for name, info in all_models.items():
+            model_speed = artifact_cache.ingest_speed(name)
+            rows.append({
+                "model": info['name'],
+                "มิติ": info['dimension'],
+                "MB ต่อ 10,000 chunks": f"{EmbeddingFactory.vector_bytes(name) * 10000 / 1024 ** 2:.0f}",
+                "chunks/วิ": f"{model_speed:.1f}" if model_speed else "ยังไม่ได้วัด"
+            })
+        st.table(rows)
+    
+    # เลือก LLM - เปลี่ยนได้ทุกเมื่อโดยไม่ต้องสร้าง index ใหม่
+    st.markdown("### 🤖 LLM")
+    llm_options = {
+        name: f"{info['name']} ({info['size']})"
+        for name, info in LLM_MODELS.items()
+    }
+    st.session_state.llm_model = st.selectbox(
+        "เลือก LLM:",
+        options=list(llm_options.keys()),
+        format_func=lambda x: llm_options[x],
+        index=list(llm_options.keys()).index(st.session_state.llm_model),
+        help="Model ที่ใช้ตอบคำถาม - เปลี่ยนได้โดยไม่ต้อง Process PDF ใหม่"
+    )
+    llm_info = get_llm_info(st.session_state.llm_model)
+    st.caption(f"ℹ️ {llm_info['description']} | context {llm_info['context_length']:,} tokens")
+    
+    # ตั้งค่าการประมวลผล PDF
+    with st.expander("⚙️ ตั้งค่าการประมวลผล"):
+        st.session_state.extraction_workers = st.number_input(
+            "จำนวน process สำหรับอ่าน PDF:",
+            min_value=1,
+            max_value=os.cpu_count() or 1,
+            value=st.session_state.extraction_workers,
+            help="มากกว่า 1 = แบ่งช่วงหน้าให้หลาย CPU core extract ข้อความพร้อมกัน (เหมาะกับเอกสารหลายร้อยหน้า)"
+        )
+        st.session_state.index_type = st.selectbox(
+            "ชนิด Vector Index:",
+            options=list(INDEX_TYPES),
+            index=list(INDEX_TYPES).index(st.session_state.index_type),
+            help="auto = เลือกตามจำนวน chunks | flat = ค้นหาแบบ exact | hnsw/ivf = ค้นหาเร็ว | ivfpq/sq8 = ประหยัด memory"
+        )
+        st.session_state.splitter = st.selectbox(
+            "วิธีแบ่ง chunks:",
+            options=list(SPLITTERS),
+            index=list(SPLITTERS).index(st.session_state.splitter),
+            help="thai = ตัดตามประโยค/คำ ตัด header/footer และ chunks ที่เกือบซ้ำ | recursive = วิธีเดิม (overlap 60%)"
+        )
+        st.session_state.compare_indexes = st.checkbox(
+            "เปรียบเทียบ recall/latency ของ index ทุกชนิด",
+            value=st.session_state.compare_indexes
+        )
+        st.session_state.adaptive_retrieval = st.checkbox(
+            "ปรับจำนวนเอกสารและ context อัตโนมัติ",
+            value=st.session_state.adaptive_retrieval,
+            help="เลือกจำนวนเอกสารจาก similarity score และกำหนด num_ctx ตามความยาว prompt จริง (ตอบเร็วขึ้นสำหรับคำถามแคบๆ)"
+        )
+        st.session_state.conversation_mode = st.checkbox(
+            "โหมดสนทนาต่อเนื่อง",
+            value=st.session_state.conversation_mode,
+            help="ต่อ prompt จากคำถามก่อนหน้า ให้ Ollama ใช้ cache ของรอบก่อน และใช้ผลค้นหาเดิมกับคำถามต่อเนื่อง"
+        )
+        if not st.session_state.conversation_mode:
+            st.session_state.conversation = None
     
     st.markdown("---")
     
@@ -51,11 +134,15 @@ def render_controls():
     if st.session_state.pdf_processed:
         st.markdown("---")
         st.success(f"📌 ไฟล์ปัจจุบัน: {st.session_state.current_pdf_name}")
+        if st.session_state.ingest_partial:
+            pages_done, num_pages = st.session_state.ingest_partial
+            st.warning(f"⏳ ประมวลผลไปแล้ว {pages_done}/{num_pages} หน้า - ตอบจากหน้าที่ประมวลผลแล้วเท่านั้น")
         
         col1, col2 = st.columns(2)
         with col1:
             if st.button("🗑️ Clear Chat"):
                 st.session_state.chat_history = []
+                st.session_state.conversation = None
                 st.rerun()
         with col2:
             if st.button("🔄 New PDF"):
@@ -63,9 +150,289 @@ def render_controls():
                 st.session_state.pdf_processed = False
                 st.session_state.chat_history = []
                 st.session_state.current_pdf_name = None
+                st.session_state.ingest_partial = None
+                st.session_state.ingest_job = None
+                st.session_state.doc_fingerprint = None
+                st.session_state.search_kwargs = None
+                st.session_state.query_mode = "document"
                 st.rerun()
 
 
+def _activate_job_document(job, vectorstore, partial=None):
+    """ตั้งเอกสารของงาน Process PDF เป็นเอกสารปัจจุบันของ session"""
+    st.session_state.vectorstore = vectorstore
+    st.session_state.doc_fingerprint = job['fingerprint']
+    st.session_state.query_mode = "document"
+    st.session_state.search_kwargs = None
+    st.session_state.pdf_processed = True
+    st.session_state.current_pdf_name = job['name']
+    st.session_state.ingest_partial = partial
+
+
+def _owns_document(job):
+    """session ไม่ได้เปิดเอกสารอื่นอยู่ (ไม่แทนที่เอกสารที่ผู้ใช้เปลี่ยนไปแล้ว)"""
+    return st.session_state.doc_fingerprint in (None, job['fingerprint'])
+
+
+@st.fragment(run_every=2)
+def _poll_ingest_job(job_id):
+    """
+    แสดงความคืบหน้าของงานที่ยังไม่เสร็จ (อัพเดททุก 2 วินาทีโดยไม่ rerun ทั้งหน้า)
+    
+    เมื่อมี checkpoint ใหม่ จะเปลี่ยน index ของ session เป็นหน้าที่ประมวลผลแล้ว
+    ถามคำถามได้ระหว่างที่งานยังไม่เสร็จ
+    """
+    
+    manager = get_job_manager()
+    job = manager.get(job_id)
+    if job is None or job['status'] not in ACTIVE_STATUSES:
+        st.rerun()
+    
+    if job['status'] == 'queued':
+        st.progress(0.0)
+        st.caption(f"⏳ {job['name']} - รอคิว")
+    else:
+        num_pages = job['num_pages'] or 0
+        st.progress(min(job['pages_done'] / max(num_pages, 1), 1.0))
+        st.caption(f"📄 {job['pages_done']}/{num_pages} หน้า | 🧩 {job['chunks_done']} chunks")
+    
+    if st.button("⏹️ ยกเลิก", key=f"cancel_job_{job_id}"):
+        manager.cancel(job_id)
+    
+    checkpoint = job['checkpoint']
+    if checkpoint and _owns_document(job):
+        partial = (checkpoint['pages_done'], job['num_pages'])
+        if st.session_state.ingest_partial != partial:
+            first_partial = not st.session_state.pdf_processed
+            _activate_job_document(job, manager.partial_vectorstore(job), partial)
+            if first_partial:
+                st.rerun()  # แสดงช่องแชทของหน้าหลัก
+
+
+def render_ingest_job(job_id):
+    """แสดงสถานะงาน Process PDF ของ session (ความคืบหน้า, ผลลัพธ์ หรือข้อผิดพลาด)"""
+    
+    manager = get_job_manager()
+    job = manager.get(job_id)
+    if job is None:
+        st.session_state.ingest_job = None
+        return
+    
+    if job['status'] in ACTIVE_STATUSES:
+        _poll_ingest_job(job_id)
+    elif job['status'] == 'done':
+        if _owns_document(job) and (st.session_state.ingest_partial is not None or not st.session_state.pdf_processed):
+            vectorstore = get_vectorstore(
+                job['result']['artifact_path'], job['fingerprint'], job['embedding_model'], job['base_url']
+            )
+            _activate_job_document(job, vectorstore)
+        display_ingest_result(job)
+    elif job['status'] == 'failed':
+        st.error(f"❌ เกิดข้อผิดพลาด: {job['error']}")
+        if st.button("🔁 ลองใหม่ (ทำต่อจาก checkpoint)", key=f"retry_job_{job_id}"):
+            manager.retry(job_id)
+            st.rerun()
+    else:
+        st.warning(f"⏹️ ยกเลิกการประมวลผล {job['name']} แล้ว")
+
+
+def display_ingest_result(job):
+    """แสดงผลลัพธ์ของงาน Process PDF ที่เสร็จแล้ว"""
+    
+    result = job['result']
+    st.success(f"✅ ประมวลผล PDF สำเร็จ!")
+    st.info(f"📄 ไฟล์: {job['name']}")
+    st.info(result['chunk_info'])
+    st.info(f"📊 สถิติ: {result['num_pages']} หน้า | {result['total_chars']:,} ตัวอักษร | {result['num_chunks']} chunks")
+    st.info(f"⏱️ ใช้เวลา {result['elapsed']:.1f} วินาที ({result['pages_per_sec']:.1f} หน้า/วิ, {result['chunks_per_sec']:.1f} chunks/วิ)")
+    if result.get('split_stats'):
+        split_stats = result['split_stats']
+        st.info(
+            f"🧹 ตัด chunks ที่ซ้ำ {split_stats['duplicate_chunks']} "
+            f"({split_stats['dedup_ratio']:.0%} ของ chunks ก่อนตัดซ้ำ) | "
+            f"ตัด header/footer {split_stats['boilerplate_lines']} บรรทัด"
+        )
+    display_trace(Trace.from_dict(result['trace']))
+    display_index_report(result['index_type'], result['index_report'])
+    if result['cache_stats']:
+        cache_stats = result['cache_stats']
+        st.info(f"🧠 Embedding cache: hit {cache_stats['hits']} | miss {cache_stats['misses']} chunks")
+    
+    model_info = EmbeddingFactory.get_model_info(job['embedding_model'])
+    vector_mb = result['num_chunks'] * EmbeddingFactory.vector_bytes(job['embedding_model']) / 1024 ** 2
+    st.info(f"🧬 Embedding: {model_info['name']} ({model_info['dimension']} มิติ, vectors ~{vector_mb:.1f} MB)")
+    
+    # แนะนำ LLM
+    if result['recommended_model'] != st.session_state.llm_model:
+        rec_info = get_llm_info(result['recommended_model'])
+        st.warning(f"💡 แนะนำ LLM: {rec_info['name']} สำหรับเอกสารขนาดนี้")
+    
+    st.info(f"💾 บันทึกที่: `{result['artifact_path']}`")
+
+
+def render_job_queue():
+    """ตารางงาน Process PDF ล่าสุดของทุก session (คิวใช้ร่วมกันทั้ง process)"""
+    
+    jobs = get_job_manager().list_jobs(limit=10)
+    if not jobs:
+        return
+    active = sum(job['status'] in ACTIVE_STATUSES for job in jobs)
+    with st.expander(f"📋 คิวงาน Process PDF ({active} งานที่ยังไม่เสร็จ)"):
+        st.table([
+            {
+                "เอกสาร": job['name'],
+                "สถานะ": job['status'],
+                "หน้า": f"{job['pages_done']}/{job['num_pages'] or '?'}",
+                "chunks": job['chunks_done']
+            }
+            for job in jobs
+        ])
+
+
+def render_ollama_status():
+    """สถานะของ Ollama: latency, model ที่โหลดอยู่ใน memory และผลการ warm-up"""
+    
+    pool = get_ollama_pool()
+    probe = pool.probe()
+    if not probe['ok']:
+        st.error(f"🔴 Ollama ไม่ตอบสนอง: {probe['error']}")
+        return
+    
+    warm_ups = pool.warm_up_status()
+    loading = [state['model'] for state in warm_ups if state['status'] == "loading"]
+    with st.expander(f"🟢 Ollama ({probe['latency_ms']:.0f} ms, โหลดอยู่ {len(probe['models'])} models)"):
+        now = datetime.now(timezone.utc)
+        for model in probe['models']:
+            remaining = (model['expires_at'] - now).total_seconds() / 60 if model['expires_at'] else None
+            expiry = f"อยู่ต่ออีก ~{remaining:.0f} นาที" if remaining is not None and remaining > 0 else "อยู่ใน memory"
+            st.caption(f"🧠 {model['name']} | VRAM {(model['size_vram'] or 0) / 1024 ** 3:.1f} GB | {expiry}")
+        if loading:
+            st.caption(f"🔥 กำลังโหลด: {', '.join(loading)}")
+        for state in warm_ups:
+            if state['status'] == "ready":
+                st.caption(f"✅ warm-up {state['model']} {state['seconds']:.1f} วิ")
+            elif state['status'] == "error":
+                st.caption(f"⚠️ warm-up {state['model']} ไม่สำเร็จ: {state['error']}")
+        st.caption(f"keep_alive {pool.keep_alive} วิ | pool {pool.max_connections} connections")
+
+
+def display_trace(trace, title="⏱️ เวลาแต่ละขั้นตอน"):
+    """แสดงเวลาของแต่ละขั้นตอนและตัวนับของ trace แบบย่อ/ขยายได้"""
+    
+    with st.expander(f"{title} (รวม {trace.total_time:.2f} วิ)"):
+        st.table([
+            {
+                "ขั้นตอน": row['stage'],
+                "เวลา (วิ)": f"{row['seconds']:.3f}",
+                "%": f"{row['percent']:.1f}",
+                "ครั้ง": row['calls']
+            }
+            for row in trace.breakdown()
+        ])
+        if trace.counts:
+            st.caption(" | ".join(f"{name}: {value:,}" for name, value in trace.counts.items()))
+
+
+def display_index_report(index_type, index_report):
+    """แสดงชนิด index ที่ใช้ และผลเปรียบเทียบ recall/latency (ถ้ามี)"""
+    
+    st.info(f"🗂️ Vector Index: {index_type}")
+    if index_report:
+        with st.expander("📈 เปรียบเทียบ index (เทียบกับ exact search)"):
+            st.table([
+                {
+                    "index": row['index_type'],
+                    "recall@10": f"{row['recall']:.3f}",
+                    "latency (ms/query)": f"{row['latency_ms']:.3f}",
+                    "ขนาด (MB)": f"{row['size_bytes'] / 1024 ** 2:.1f}",
+                    "เวลาสร้าง (วิ)": f"{row['build_time']:.2f}"
+                }
+                for row in index_report
+            ])
+
+
+def _activate_corpus(corpus):
+    """ตั้ง session ให้ถามจาก corpus ตามขอบเขตเอกสารที่เลือก"""
+    scope = [doc_id for doc_id in st.session_state.corpus_scope if doc_id in corpus]
+    st.session_state.corpus_scope = scope
+    st.session_state.vectorstore = register_corpus(corpus)
+    st.session_state.doc_fingerprint = corpus.fingerprint(scope)
+    st.session_state.search_kwargs = corpus.search_kwargs(scope)
+    st.session_state.current_pdf_name = f"Corpus ({len(scope) or len(corpus.documents())} เอกสาร)"
+    st.session_state.pdf_processed = True
+    st.session_state.ingest_partial = None
+
+
+def render_corpus_panel(corpus):
+    """แสดง Corpus: เพิ่ม/ลบเอกสาร เลือกขอบเขตการค้นหา และสลับไปถามจากหลายเอกสาร"""
+    
+    st.markdown("---")
+    st.markdown("### 📚 Corpus")
+    documents = corpus.documents()
+    
+    # เพิ่มเอกสารที่ประมวลผลแล้วเข้า corpus
+    can_add = (
+        st.session_state.query_mode == "document"
+        and st.session_state.pdf_processed
+        and st.session_state.ingest_partial is None
+        and st.session_state.doc_fingerprint not in corpus
+    )
+    if can_add and st.button("➕ เพิ่มเอกสารปัจจุบันเข้า Corpus"):
+        with st.spinner("กำลังเพิ่มเข้า Corpus..."):
+            corpus.add_document(
+                st.session_state.doc_fingerprint,
+                st.session_state.current_pdf_name,
+                st.session_state.vectorstore
+            )
+            invalidate_document(corpus_key(corpus.embedding_model))
+        st.rerun()
+    
+    if not documents:
+        st.caption("ยังไม่มีเอกสารใน Corpus")
+        return
+    
+    st.session_state.corpus_scope = st.multiselect(
+        "ค้นหาเฉพาะเอกสาร:",
+        options=list(documents),
+        default=[doc_id for doc_id in st.session_state.corpus_scope if doc_id in documents],
+        format_func=lambda doc_id: f"{documents[doc_id]['name']} ({documents[doc_id]['num_chunks']} chunks)",
+        help="ไม่เลือก = ค้นหาทุกเอกสารใน Corpus"
+    )
+    
+    if st.session_state.query_mode == "corpus":
+        _activate_corpus(corpus)
+        if st.button("📄 กลับไปถามเอกสารเดียว"):
+            st.session_state.query_mode = "document"
+            st.session_state.vectorstore = None
+            st.session_state.pdf_processed = False
+            st.session_state.doc_fingerprint = None
+            st.session_state.search_kwargs = None
+            st.session_state.current_pdf_name = None
+            st.session_state.chat_history = []
+            st.rerun()
+    elif st.button("💬 ถามจาก Corpus", type="secondary"):
+        st.session_state.query_mode = "corpus"
+        st.session_state.chat_history = []
+        _activate_corpus(corpus)
+        st.rerun()
+    
+    with st.expander(f"🗂️ เอกสารใน Corpus ({len(documents)})"):
+        for doc_id, info in list(documents.items()):
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                st.markdown(f"**{info['name']}**  \n{info['num_chunks']} chunks")
+            with col2:
+                if st.button("🗑️", key=f"remove_{doc_id}"):
+                    corpus.remove_document(doc_id)
+                    invalidate_document(corpus_key(corpus.embedding_model))
+                    if st.session_state.query_mode == "corpus" and corpus.vectorstore is None:
+                        st.session_state.query_mode = "document"
+                        st.session_state.vectorstore = None
+                        st.session_state.pdf_processed = False
+                        st.session_state.search_kwargs = None
+                    st.rerun()
+
+
 def render_instructions():
     """แสดงคำแนะนำการใช้งาน"""
     
@@ -0,0 +1,218 @@
+"""
+Memory-mapped Vector Store Format
+รูปแบบไฟล์ของ vector store ที่โหลดเร็วและไม่ใช้ pickle
+
+โครงสร้างโฟลเดอร์:
+    store.json       ข้อมูลของ store (รุ่นของ format, dimension, จำนวน chunks, docstore IDs)
+    index.faiss      FAISS index (อ่านแบบ memory-map ถ้า FAISS รองรับ)
+    chunks.bin       ข้อความและ metadata ของ chunks (JSON UTF-8 ต่อกัน)
+    chunks.idx.npy   offsets ของแต่ละ chunk ใน chunks.bin (int64, n + 1 ค่า)
+
+ข้อความของ chunk จะถูกอ่านจากดิสก์เฉพาะตอนที่ chunk นั้นถูกค้นเจอเท่านั้น
+
+store รูปแบบเดิม (<ชื่อไฟล์>.faiss: index.faiss + index.pkl) ใน vectorstore_cache
+ถูกแปลงด้วย convert_legacy_store และนำเข้า artifact cache อัตโนมัติเมื่อเปิด UI ครั้งแรก
+(artifact_cache.ArtifactCache.import_legacy_stores) แปลงโฟลเดอร์อื่นเอง:
+    python vector_store_format.py convert <vectorstore_dir>
+"""
+import json
+import mmap
+import os
+import sys
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+
+FORMAT_NAME = "bornzi-vectorstore"
+FORMAT_VERSION = 1
+STORE_FILES = ("store.json", "index.faiss", "chunks.bin", "chunks.idx.npy")
+LEGACY_FILES = ("index.faiss", "index.pkl")
+# ไฟล์ที่ store รุ่นก่อนเขียนไว้แต่ไม่ได้ใช้แล้ว (vectors อยู่ใน index.faiss อยู่แล้ว)
+OBSOLETE_FILES = ("vectors.npy",)
+
+
+class LazyDocstore(Docstore, AddableMixin):
+    """
+    Docstore ที่อ่านข้อความของ chunk จากไฟล์ memory-map เมื่อถูกเรียกใช้
+
+    chunks ที่เพิ่ม/ลบหลังโหลดจะเก็บไว้ใน memory จนกว่าจะบันทึกใหม่
+    """
+
+    def __init__(self, directory, ids):
+        self._positions = {doc_id: i for i, doc_id in enumerate(ids)}
+        self._offsets = np.load(os.path.join(directory, "chunks.idx.npy"), mmap_mode="r")
+        self._overlay = {}
+        self._deleted = set()
+
+        chunks_path = os.path.join(directory, "chunks.bin")
+        if os.path.getsize(chunks_path) > 0:
+            with open(chunks_path, "rb") as f:
+                self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._blob = b""
+
+    def search(self, search):
+        if search in self._overlay:
+            return self._overlay[search]
+        position = self._positions.get(search)
+        if position is None or search in self._deleted:
+            return f"ID {search} not found."
+
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        record = json.loads(self._blob[start:end].decode("utf-8"))
+        return Document(page_content=record['text'], metadata=record['metadata'])
+
+    def add(self, texts):
+        overlapping = (set(texts) & set(self._positions)) - self._deleted
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._overlay.update(texts)
+
+    def delete(self, ids):
+        for doc_id in ids:
+            self._overlay.pop(doc_id, None)
+            if doc_id in self._positions:
+                self._deleted.add(doc_id)
+
+    def size_bytes(self):
+        """ขนาดข้อความและ metadata ของ chunks (chunks.bin + chunks ที่เพิ่มหลังโหลด)"""
+        return len(self._blob) + sum(
+            len(doc.page_content.encode("utf-8")) for doc in self._overlay.values()
+        )
+
+
+def is_native_store(path):
+    return os.path.exists(os.path.join(path, "store.json"))
+
+
+def is_legacy_store(path):
+    return not is_native_store(path) and os.path.exists(os.path.join(path, "index.pkl"))
+
+
+def _save_array(path, array):
+    """บันทึก .npy แบบเขียนไฟล์ชั่วคราวก่อนแล้วจึงแทนที่"""
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, array)
+    os.replace(path + ".tmp", path)
+
+
+def save_store(vectorstore, path):
+    """
+    บันทึก FAISS vectorstore ในรูปแบบ native
+
+    ทุกไฟล์เขียนเป็นไฟล์ชั่วคราวก่อนแล้วจึงแทนที่ และ store.json เขียนเป็นไฟล์สุดท้าย
+    ถ้ามี store.json แปลว่าไฟล์อื่นครบแล้ว
+    """
+    os.makedirs(path, exist_ok=True)
+    index = vectorstore.index
+    ids = [vectorstore.index_to_docstore_id[i] for i in range(index.ntotal)]
+
+    # ข้อความและ metadata ของ chunks
+    chunks_path = os.path.join(path, "chunks.bin")
+    offsets = [0]
+    with open(chunks_path + ".tmp", "wb") as f:
+        for doc_id in ids:
+            doc = vectorstore.docstore.search(doc_id)
+            record = json.dumps(
+                {'id': doc_id, 'text': doc.page_content, 'metadata': doc.metadata},
+                ensure_ascii=False
+            ).encode("utf-8")
+            f.write(record)
+            offsets.append(offsets[-1] + len(record))
+    os.replace(chunks_path + ".tmp", chunks_path)
+    _save_array(os.path.join(path, "chunks.idx.npy"), np.asarray(offsets, dtype=np.int64))
+
+    # FAISS index
+    index_path = os.path.join(path, "index.faiss")
+    faiss.write_index(index, index_path + ".tmp")
+    os.replace(index_path + ".tmp", index_path)
+
+    manifest_path = os.path.join(path, "store.json")
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({
+            'format': FORMAT_NAME,
+            'version': FORMAT_VERSION,
+            'dim': int(index.d),
+            'count': int(index.ntotal),
+            'ids': ids
+        }, f, ensure_ascii=False)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    # ลบไฟล์ pickle ของรูปแบบเดิมและไฟล์ที่ไม่ได้ใช้แล้ว (ถ้ามี)
+    for name in ("index.pkl",) + OBSOLETE_FILES:
+        file_path = os.path.join(path, name)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def load_store(path, embeddings, mmap_index=True):
+    """
+    โหลด vectorstore รูปแบบ native
+
+    Args:
+        mmap_index: อ่าน FAISS index แบบ memory-map (อ่านอย่างเดียว)
+                    ใช้ False สำหรับ store ที่ต้องแก้ไข เช่น corpus
+    """
+    with open(os.path.join(path, "store.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT_NAME or manifest.get('version') != FORMAT_VERSION:
+        raise ValueError(f"ไม่รู้จักรูปแบบ vector store ที่ {path}")
+
+    index_path = os.path.join(path, "index.faiss")
+    index = None
+    if mmap_index:
+        try:
+            index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            index = None  # FAISS รุ่นนี้ไม่รองรับ mmap สำหรับ index ชนิดนี้
+    if index is None:
+        index = faiss.read_index(index_path)
+
+    ids = manifest['ids']
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=LazyDocstore(path, ids),
+        index_to_docstore_id=dict(enumerate(ids))
+    )
+
+
+def delete_store(path):
+    """ลบไฟล์ของ vector store ทั้งรูปแบบ native และรูปแบบเดิม"""
+    for name in set(STORE_FILES + LEGACY_FILES + OBSOLETE_FILES):
+        file_path = os.path.join(path, name)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def convert_legacy_store(path):
+    """
+    แปลง cache รูปแบบเดิม (FAISS.save_local: index.faiss + index.pkl) เป็นรูปแบบ native
+
+    ต้อง unpickle index.pkl หนึ่งครั้ง - ใช้กับ cache ที่เชื่อถือได้เท่านั้น
+    """
+    vectorstore = FAISS.load_local(path, None, allow_dangerous_deserialization=True)
+    save_store(vectorstore, path)
+    return vectorstore.index.ntotal
+
+
+def convert_directory(root):
+    """แปลงทุก vector store รูปแบบเดิมภายใต้ root"""
+    converted = []
+    for dirpath, _, filenames in os.walk(root):
+        if "index.pkl" in filenames and "store.json" not in filenames:
+            count = convert_legacy_store(dirpath)
+            converted.append((dirpath, count))
+    return converted
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "convert":
+        print("Usage: python vector_store_format.py convert <vectorstore_dir>")
+        sys.exit(1)
+    for store_path, count in convert_directory(sys.argv[2]):
+        print(f"✅ {store_path}: {count} chunks")